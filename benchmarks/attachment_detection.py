@@ -0,0 +1,190 @@
+"""Time attachment detection on pathological messages.
+
+Messages full of brackets made the old regular expressions backtrack with quadratic
+(or worse) cost. For each input this script times `Message.create_with_context` at
+growing message sizes, fits the exponent k of time ~ size**k, and fails if k is well
+above 1 (linear; quadratic backtracking gives about 2) or a single message exceeds the
+budget.
+
+Before timing, the script checks that detection and cleanup give the same results as
+the old regular expressions on realistic Android and iOS markers (captions, brackets
+in file names, size annotations, several markers per message), and fails on any
+difference.
+
+Usage:
+    python benchmarks/attachment_detection.py [--size 50000] [--budget-ms 100] [--compare]
+
+With --compare, the old regular expressions are timed as well (on smaller inputs,
+since they can take minutes on the full size).
+"""
+import argparse
+import itertools
+import math
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from chat_export.chat_export import Chat, Message  # noqa: E402
+
+ATTACHMENTS = frozenset({
+    "IMG-20240101-WA0001.jpg",
+    "00000012-PHOTO-2024-01-01-10-00-00.jpg",
+    "document (1).pdf",
+})
+
+# name -> (is_ios, function building a message of about n characters)
+CASES = {
+    "android: open brackets": (False, lambda n: "(" * n),
+    "android: dotted words in brackets": (False, lambda n: "a.b (c d) " * (n // 10)),
+    "android: no closing bracket": (False, lambda n: "x.y (" + "a " * (n // 2)),
+    "android: long name prefix": (False, lambda n: "a" * n + ".jpg (file attached)"),
+    "android: size annotations": (False, lambda n: "IMG-20240101-WA0001.jpg (file attached) " + "(1" * (n // 2)),
+    "ios: open angle brackets": (True, lambda n: "<" * n),
+    "ios: open angle brackets, closed at the end": (True, lambda n: "<" * n + ">"),
+    "ios: spaced angle brackets, closed at the end": (True, lambda n: "< " * (n // 2) + ">"),
+    "ios: labels without close": (True, lambda n: "<ab: " + "x" * n),
+    "ios: many labels": (True, lambda n: "<ab:x" * (n // 5)),
+    "ios: closes without spaces": (True, lambda n: "<ab:" + "a>" * (n // 2)),
+    "ios: suffix form": (True, lambda n: "<a" * (n // 2) + " eklendi>"),
+}
+
+# Message sizes as fractions of --size, for fitting the scaling exponent
+SIZE_FRACTIONS = (1 / 8, 1 / 4, 1 / 2, 1)
+# Fail above this exponent; leaves room for timer noise on the small sizes
+MAX_EXPONENT = 1.4
+# Timer resolution floor in ms, so that tiny timings don't dominate the fit
+MIN_MS = 0.05
+
+OLD_ANDROID = re.compile(Message.ATTACHMENT_PATTERN_ANDROID)
+OLD_IOS = re.compile(Message.ATTACHMENT_PATTERN_IOS)
+OLD_FILE_SIZE = re.compile(r'\s*\(\d[\d,.]*\s*.{1,10}\)\s*$')
+
+# Pieces of realistic messages; every combination is checked against the old regexes
+NAMES = sorted(ATTACHMENTS) + ["missing.jpg", "no extension", "a.b.c.tar.gz"]
+ANDROID_MARKERS = ["{} (file attached)", "{} (Datei angehängt)", "{} (dosya ekli)", "{} (attached file)"]
+IOS_MARKERS = ["<attached: {}>", "<angehängt: {}>", "\u200e<attached: {}>", "<{} eklendi>", "<attached:  {}>"]
+SURROUNDINGS = ["", "Look ", "(see this) ", "x.y (a b) ", "<b> ", " $NEWLINE$ "]
+TAILS = ["", " nice", " (3 KB)", " (1,2 MB)", " (12 pages) ", " $NEWLINE$ caption (2)", " <not a marker>", ">"]
+
+
+def realistic_messages(is_ios):
+    markers = IOS_MARKERS if is_ios else ANDROID_MARKERS
+    for marker, name, before, tail in itertools.product(markers, NAMES, SURROUNDINGS, TAILS):
+        message = before + marker.format(name) + tail
+        yield message
+        # A second marker, with another name
+        yield message + " " + marker.format(NAMES[(NAMES.index(name) + 1) % len(NAMES)])
+        # Marker glued to other text
+        yield before + marker.format(name) + marker.format(name) + tail
+
+
+def old_attachment(content, chat):
+    """Attachment name as found by the old regexes."""
+    if chat.is_ios and '<' in content:
+        match = OLD_IOS.search(content)
+        if match and (match.group(1) or match.group(2)) in chat.attachments_in_zip:
+            return match.group(1) or match.group(2)
+    elif not chat.is_ios and '(' in content:
+        match = OLD_ANDROID.search(content)
+        if match and match.group(1) in chat.attachments_in_zip:
+            return match.group(1)
+    return None
+
+
+def old_cleaned_content(content, chat, attachment_name):
+    """Message content as cleaned with the old regexes."""
+    cleaned_content = content
+    if chat.has_media and attachment_name is not None:
+        cleaned_content = (OLD_IOS if chat.is_ios else OLD_ANDROID).sub('', content)
+    if cleaned_content != content:
+        cleaned_content = OLD_FILE_SIZE.sub('', cleaned_content)
+    cleaned_content = cleaned_content.replace('<', '[').replace('>', ']')
+    cleaned_content = Message._wrap_urls_with_anchor_tags(cleaned_content)
+    cleaned_content = cleaned_content.replace(chat.newline_marker, '<br>')
+    if cleaned_content == "null" or (cleaned_content == "" and attachment_name is None):
+        cleaned_content = "[call (attempt)]"
+    return cleaned_content.strip()
+
+
+def check_old_results():
+    """Print messages where detection or cleanup differ from the old regexes, return their count."""
+    differences = 0
+    for is_ios in (False, True):
+        chat = make_chat(is_ios)
+        for content in realistic_messages(is_ios):
+            message = Message.create_with_context(1, "01.01.24, 10:00", "A", content, chat)
+            name = old_attachment(content, chat)
+            expected = (name, old_cleaned_content(content, chat, name))
+            if (message.attachment_name, message.cleaned_content) != expected:
+                differences += 1
+                print(f"FAIL: {content!r}: {(message.attachment_name, message.cleaned_content)!r}, "
+                      f"old regexes give {expected!r}")
+    return differences
+
+
+def make_chat(is_ios):
+    return Chat(
+        name="benchmark",
+        is_ios=is_ios,
+        has_media=True,
+        attachments_in_zip=ATTACHMENTS,
+        message_date_format="%d.%m.%y",
+        newline_marker=" $NEWLINE$ ",
+    )
+
+
+def time_message(content, chat):
+    start = time.perf_counter()
+    Message.create_with_context(1, "01.01.24, 10:00", "A", content, chat)
+    return time.perf_counter() - start
+
+
+def time_old_regex(content, is_ios):
+    start = time.perf_counter()
+    (OLD_IOS if is_ios else OLD_ANDROID).search(content)
+    return time.perf_counter() - start
+
+
+def scaling_exponent(sizes, times_ms):
+    """Least-squares slope of log(time) over log(size)."""
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(ms, MIN_MS)) for ms in times_ms]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    return (sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+            / sum((x - mean_x) ** 2 for x in xs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=50000, help="Largest message size in characters (default: 50000)")
+    parser.add_argument("--budget-ms", type=float, default=100, help="Fail if one message takes longer (default: 100)")
+    parser.add_argument("--compare", action="store_true", help="Also time the old regular expressions")
+    args = parser.parse_args()
+
+    failed = check_old_results() > 0
+    for name, (is_ios, build) in CASES.items():
+        chat = make_chat(is_ios)
+        messages = [build(int(args.size * fraction)) for fraction in SIZE_FRACTIONS]
+        time_message(messages[0], chat)  # warm up
+        times_ms = [min(time_message(message, chat) for _ in range(3)) * 1000 for message in messages]
+        exponent = scaling_exponent([len(message) for message in messages], times_ms)
+        large, large_ms = messages[-1], times_ms[-1]
+        line = f"  {name:46s} {len(large):7d} chars {large_ms:8.2f} ms  (time ~ size^{exponent:.2f})"
+        if args.compare:
+            old = build(args.size // 10)
+            line += f"  old regex on {len(old)} chars: {time_old_regex(old, is_ios) * 1000:.1f} ms"
+        print(line)
+        if large_ms > args.budget_ms:
+            print(f"FAIL: {name} took {large_ms:.1f} ms, budget is {args.budget_ms:.1f} ms")
+            failed = True
+        if exponent > MAX_EXPONENT:
+            print(f"FAIL: {name} grows faster than linearly with the message size (exponent {exponent:.2f})")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Measure how long `import chat_export.chat_export` takes, based on `python -X importtime`.
+
+The non-interactive CLI path should only import what it needs to read the ZIP. This
+script reports the cumulative import time of the module, the slowest imports it pulls
+in, and the time a non-interactive CLI run takes until it has read the central
+directory of the ZIP (ZipIndex). It fails if a module that is supposed to be imported
+lazily shows up before that point. Modules that the standard library modules needed
+for reading a ZIP import themselves (e.g. urllib.parse via pathlib before Python 3.13)
+are reported, but can't be deferred and don't fail the check.
+
+Usage:
+    python benchmarks/startup_importtime.py [--runs 5] [--budget-ms 80]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+
+MODULE = "chat_export.chat_export"
+
+# Imported on demand only (interactive mode, media embedding, serve command, ...)
+DEFERRED_MODULES = [
+    "base64",
+    "difflib",
+    "tempfile",
+    "webbrowser",
+    "importlib.metadata",
+    "tkinter",
+    "http.server",
+    "urllib.parse",
+    "AppKit",
+    "objc",
+    "win32ui",
+]
+
+# Standard library modules that reading a ZIP can't do without; what they import is not ours to defer
+STDLIB_BASELINE = "import pathlib, zipfile"
+
+# Runs the CLI until the ZipIndex has been created, then prints the elapsed time and the loaded modules.
+# A source checkout has no chat_export-<version>.dist-info next to the package, so get_version() would
+# fall back to importlib.metadata; the probe resolves the version up front, as an installed package does.
+CLI_PROBE = f"""
+import json, os, sys, time
+start = time.perf_counter()
+import {MODULE} as module
+module._version = module._find_dist_info_version() or module.VERSION
+create_index = module.ZipIndex.__init__
+def first_zip_read(self, *args, **kwargs):
+    create_index(self, *args, **kwargs)
+    print(json.dumps({{"ms": (time.perf_counter() - start) * 1000, "modules": sorted(sys.modules)}}))
+    sys.stdout.flush()
+    os._exit(0)
+module.ZipIndex.__init__ = first_zip_read
+sys.argv = ["chat-export"] + sys.argv[1:]
+module.main()
+"""
+
+
+def _subprocess_env():
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # measure with cached bytecode, like real installs
+    repo_root = Path(__file__).resolve().parent.parent
+    env["PYTHONPATH"] = str(repo_root) + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def run_importtime(statement=f"import {MODULE}"):
+    """Run the import statement in a fresh interpreter and return {module: cumulative_us}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        env=_subprocess_env(), capture_output=True, text=True, check=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:   self [us] | cumulative | imported package"
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative_us)
+    return timings
+
+
+def write_sample_zip(zip_path):
+    """A minimal Android export, enough for the CLI to get to reading the ZIP."""
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        archive.writestr("WhatsApp Chat with Bob.txt", "01.01.24, 10:00 - Alice: Hi\n01.01.24, 10:01 - Bob: Hello\n")
+
+
+def run_cli_until_zip_read(zip_path, output_dir):
+    """Run the non-interactive CLI in a fresh interpreter until the ZIP has been indexed.
+
+    Returns (milliseconds since the import started, names of the loaded modules).
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", CLI_PROBE, "-n", "-z", str(zip_path), "-p", "Alice", "-o", str(output_dir)],
+        env=_subprocess_env(), capture_output=True, text=True, check=True,
+    )
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    return probe["ms"], set(probe["modules"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Number of measured runs (default: 5)")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if the median import time exceeds this")
+    args = parser.parse_args()
+
+    run_importtime()  # warm up: writes bytecode caches
+    runs = [run_importtime() for _ in range(args.runs)]
+    totals = [timings[MODULE] / 1000 for timings in runs]
+    median_ms = statistics.median(totals)
+
+    print(f"import {MODULE}: median {median_ms:.1f} ms (min {min(totals):.1f} ms, max {max(totals):.1f} ms, {args.runs} runs)")
+    print("Slowest imports (cumulative, last run):")
+    last = runs[-1]
+    dependencies = {name: us for name, us in last.items() if not name.startswith("chat_export")}
+    for name, cumulative_us in sorted(dependencies.items(), key=lambda item: item[1], reverse=True)[:10]:
+        print(f"  {cumulative_us / 1000:7.1f} ms  {name}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        zip_path = Path(directory, "WhatsApp Chat with Bob.zip")
+        write_sample_zip(zip_path)
+        run_cli_until_zip_read(zip_path, directory)  # warm up
+        cli_runs = [run_cli_until_zip_read(zip_path, directory) for _ in range(args.runs)]
+    cli_totals = [ms for ms, _ in cli_runs]
+    cli_modules = cli_runs[-1][1]
+    print(f"CLI until the ZIP is indexed: median {statistics.median(cli_totals):.1f} ms "
+          f"(min {min(cli_totals):.1f} ms, max {max(cli_totals):.1f} ms, {args.runs} runs)")
+
+    failed = False
+    baseline = run_importtime(STDLIB_BASELINE)
+    unavoidable = [name for name in DEFERRED_MODULES if name in baseline]
+    if unavoidable:
+        print(f"Imported by the standard library on this Python, not checked: {', '.join(unavoidable)}")
+    eager = [name for name in DEFERRED_MODULES
+             if (name in last or name in cli_modules) and name not in baseline]
+    if eager:
+        print(f"FAIL: imported at startup although deferred: {', '.join(eager)}")
+        failed = True
+    if args.budget_ms is not None and median_ms > args.budget_ms:
+        print(f"FAIL: median import time {median_ms:.1f} ms exceeds budget of {args.budget_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,10 @@ from .chat_export import (
     HTMLRenderer,
     MessageParser,
     DateRange,
-    __version__,
+    ExportResult,
+    convert,
+    export,
+    get_version,
 )
 
 __all__ = [
@@ -15,7 +18,15 @@ __all__ = [
     "HTMLRenderer",
     "MessageParser",
     "DateRange",
+    "ExportResult",
+    "convert",
+    "export",
     "__version__",
 ]
 
 
+def __getattr__(name):
+    # __version__ is resolved on first access, see chat_export.get_version
+    if name == "__version__":
+        return get_version()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,44 +1,60 @@
 import argparse
-import base64
-import difflib
+import contextlib
 import html as html_module
+import io
+import logging
 import os
 import sys
-import tempfile
+import threading
 import time
-import traceback
 import zipfile
+import zlib
 from datetime import datetime
 from dataclasses import dataclass, field
 from typing import Optional
 import re
 import shutil
-import webbrowser
+import struct
 from pathlib import Path, PureWindowsPath, PurePosixPath
-from importlib.metadata import version as _pkg_version, PackageNotFoundError
 
-# Attempt to import PyObjC modules for macOS file dialog support
-# for this to work, you need to pip install PyObjC
-if sys.platform == 'darwin':
+# Modules that are only needed for interactive use, media embedding or the serve
+# command (difflib, webbrowser, tempfile, base64, importlib.metadata, urllib.parse,
+# the native file dialogs, ...) are imported where they are used, so that non-interactive
+# batch runs don't pay for them at startup.
+
+# Progress messages. The command line shows them on the console (see configure_logging);
+# applications using the library decide themselves where they go.
+logger = logging.getLogger("chat_export")
+
+# Separates the date from the time in a timestamp: '24.12.23, 18:30' or '30/08/25 18.00'
+TIMESTAMP_SEPARATOR_PATTERN = re.compile(', | ')
+SIZE_PATTERN = re.compile(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?)i?B?\s*', re.IGNORECASE)
+
+
+def pyobjc_available():
+    """Check if PyObjC is installed for macOS file dialog support.
+    for this to work, you need to pip install PyObjC
+    """
+    if sys.platform != 'darwin':
+        return False
     try:
-        from AppKit import NSOpenPanel, NSApplication, NSApp
-        import objc
-        pyobjc_available = True
+        import AppKit  # noqa: F401
+        import objc  # noqa: F401
+        return True
     except ImportError:
-        pyobjc_available = False
-else:
-    pyobjc_available = False
+        return False
 
-# Attempt to import pywin32 modules for Windows file dialog support
-if sys.platform == 'win32':
+
+def pywin32_available():
+    """Check if pywin32 is installed for Windows file dialog support."""
+    if sys.platform != 'win32':
+        return False
     try:
-        import win32ui
-        import win32con
-        pywin32_available = True
+        import win32ui  # noqa: F401
+        import win32con  # noqa: F401
+        return True
     except ImportError:
-        pywin32_available = False
-else:
-    pywin32_available = False
+        return False
 
 
 class DateRange:
@@ -85,6 +101,40 @@ class DateRange:
         raise ValueError("Invalid date format. Please use DD.MM.YYYY, MM/DD/YYYY, DD.MM.YY, MM/DD/YY, DD/MM/YYYY, or DD/MM/YY")
 
 
+class MessageFilter:
+    """Keeps only messages of the given senders and/or messages whose text matches a regex."""
+
+    def __init__(self, senders=None, pattern=None):
+        if isinstance(senders, str):
+            senders = [senders]
+        self.senders = frozenset(senders) if senders else None
+        try:
+            self.pattern = re.compile(pattern) if pattern else None
+        except re.error as e:
+            raise ValueError(f"Invalid search pattern '{pattern}': {e}")
+
+    def accepts_sender(self, sender):
+        """Check the sender of a message (checked before the rest of the message is read)."""
+        return self.senders is None or sender in self.senders
+
+    def accepts_text(self, text):
+        """Check the text of a message, with its lines joined by newlines."""
+        return self.pattern is None or self.pattern.search(text) is not None
+
+    def is_filtered(self):
+        """Return True if any filtering is applied."""
+        return self.senders is not None or self.pattern is not None
+
+    def describe(self):
+        """Return a readable description of the filter."""
+        parts = []
+        if self.senders is not None:
+            parts.append("messages from " + ", ".join(sorted(self.senders)))
+        if self.pattern is not None:
+            parts.append(f"messages matching '{self.pattern.pattern}'")
+        return "Filtered: " + " and ".join(parts) if parts else None
+
+
 
 @dataclass(frozen=True)
 class Message:
@@ -105,7 +155,7 @@ class Message:
     def create_with_context(cls, id: int, timestamp: str, sender: str, content: str, chat: 'Chat') -> 'Message':
         """Create a Message with computed properties using Chat context."""
         # Compute attachment name
-        attachment_name = cls._extract_attachment_name(content, chat)
+        attachment_name = cls._find_attachment(content, chat)
         has_attachment = attachment_name is not None
 
         # Compute cleaned content
@@ -129,45 +179,157 @@ class Message:
             has_attachment=has_attachment
         )
 
-    # Attachment patterns as class constants
+    # Attachment markers as regular expressions. Searching a message with them directly
+    # backtracks badly on long messages full of brackets, so they are only matched at the
+    # positions where a search could start a match, see _android_markers and _ios_markers.
     ATTACHMENT_PATTERN_ANDROID = r'(.+?\.[a-zA-Z0-9]{0,4}) \(.{1,20} .{1,20}\)'
     # There are two formats for attachment patterns on iOS. 
     # The first is the default format: <attached: filename>
     # The second is the new format: <filename eklendi> (e.g. Turkish)
     ATTACHMENT_PATTERN_IOS = r'<\w{2,20}:\s*([^ ]+)>|<\s*([^ ]+) \w{2,20}>'
 
+    ANDROID_MARKER_PATTERN = re.compile(ATTACHMENT_PATTERN_ANDROID)
+    # Bounded pieces of the iOS markers, only ever matched at a single known position
+    IOS_LABEL_PATTERN = re.compile(r'<\w{2,20}:')
+    IOS_SUFFIX_PATTERN = re.compile(r' \w{2,20}>')
+    WHITESPACE_PATTERN = re.compile(r'\s*')
+
     @staticmethod
-    def _extract_attachment_name(content: str, chat: 'Chat') -> Optional[str]:
-        """Extract attachment filename from message content using various patterns."""
+    def _find_attachment(content: str, chat: 'Chat') -> Optional[str]:
+        """The attachment of a message: the name in the first attachment marker, if that
+        file is in the zip. Returns None otherwise."""
         if chat.is_ios and '<' in content:
-            match = re.search(Message.ATTACHMENT_PATTERN_IOS, content)
-            if match:
-                # pattern contains two formats. If there's no match for the first (group(1) is None), use the second (i.e. Turkish: Filename eklendi)
-                result = match.group(1) or match.group(2) if match.groups() else match.group(0)
-                if result in chat.attachments_in_zip:
-                    return result
+            markers = Message._ios_markers(content)
         elif not chat.is_ios and '(' in content:
-            match = re.search(Message.ATTACHMENT_PATTERN_ANDROID, content)
-            if match:
-                result = match.group(1) if match.groups() else match.group(0)
-                if result in chat.attachments_in_zip:
-                    return result
+            markers = Message._android_markers(content)
+        else:
+            return None
+        first = next(markers, None)
+        if first is not None and first[2] in chat.attachments_in_zip:
+            return first[2]
         return None
 
+    @staticmethod
+    def _android_markers(content: str):
+        """Yield (start, end, name) of the Android markers, e.g. "IMG-20240101-WA0001.jpg
+        (file attached)", as re.finditer(ATTACHMENT_PATTERN_ANDROID) would find them.
+
+        A match that starts within a line would also match from the start of that line,
+        since .+? can take the characters in between. So a failed match is only retried at
+        the next line instead of at every position, which is what made the search quadratic."""
+        pos = 0
+        while pos < len(content):
+            match = Message.ANDROID_MARKER_PATTERN.match(content, pos)
+            if match:
+                yield match.start(), match.end(), match.group(1)
+                pos = match.end()
+            else:
+                newline = content.find('\n', pos)
+                if newline == -1:
+                    return
+                pos = newline + 1
+
+    @staticmethod
+    def _ios_markers(content: str):
+        """Yield (start, end, name) of the iOS markers, "<attached: 00000012-PHOTO.jpg>" or
+        "<00000012-PHOTO.jpg eklendi>", as re.finditer(ATTACHMENT_PATTERN_IOS) would find them.
+
+        The name ([^ ]+) runs up to the next space, which the regex scans for again from every
+        '<'. Here the spaces and '>' are looked up in sorted lists of their positions instead."""
+        import bisect
+
+        spaces = [match.start() for match in re.finditer(' ', content)]
+        closes = [match.start() for match in re.finditer('>', content)]
+        # '<attached:' labels and ' eklendi>' suffixes by position; neither can overlap
+        # itself, so finditer finds all of them
+        labels = {match.start(): match.end() for match in Message.IOS_LABEL_PATTERN.finditer(content)}
+        suffixes = {match.start(): match.end() for match in Message.IOS_SUFFIX_PATTERN.finditer(content)}
+        if not labels and not suffixes:
+            return
+
+        def run_end(start):
+            """Where a [^ ]+ run from start ends: the next space, or the end."""
+            i = bisect.bisect_left(spaces, start)
+            return spaces[i] if i < len(spaces) else len(content)
+
+        def name_starts(start):
+            """Where [^ ]+ can start after \\s* from start: the greedy end of the whitespace
+            first, then backtracking, skipping ' ', which [^ ]+ can't take."""
+            whitespace_end = Message.WHITESPACE_PATTERN.match(content, start).end()
+            if whitespace_end == start:
+                return (start,) if start < len(content) and content[start] != ' ' else ()
+            return [name_start for name_start in range(whitespace_end, start - 1, -1)
+                    if name_start < len(content) and content[name_start] != ' ']
+
+        pos = content.find('<')
+        # both forms end with '>'
+        while pos != -1 and closes and pos < closes[-1]:
+            marker = None
+            if pos in labels:
+                # <label: name> - the name is the longest [^ ]+ that is followed by '>'
+                for name_start in name_starts(labels[pos]):
+                    i = bisect.bisect_left(closes, run_end(name_start)) - 1
+                    if i >= 0 and closes[i] > name_start:
+                        marker = (pos, closes[i] + 1, content[name_start:closes[i]])
+                        break
+            if marker is None and suffixes:
+                # <name label> - the name runs up to the next space
+                for name_start in name_starts(pos + 1):
+                    name_end = run_end(name_start)
+                    if name_end in suffixes:
+                        marker = (pos, suffixes[name_end], content[name_start:name_end])
+                        break
+            if marker is not None:
+                yield marker
+                pos = content.find('<', marker[1])
+            else:
+                pos = content.find('<', pos + 1)
+
+    @staticmethod
+    def _strip_file_size(text: str) -> str:
+        """Remove a trailing file-size annotation like "(3 KB)" or "(1,2 MB)", as
+        re.sub(r'\s*\(\d[\d,.]*\s*.{1,10}\)\s*$', '', text) does, in linear time."""
+        stripped = text.rstrip()
+        close = len(stripped) - 1
+        if close < 0 or stripped[close] != ')':
+            return text
+        # .{1,10} before the closing bracket, on one line
+        newline = stripped.rfind('\n', max(close - 10, 0), close)
+        first = None
+        for unit_start in range(max(close - 10, newline + 1), close):
+            # \d[\d,.]*\s* before it, right after the opening bracket
+            number_end = unit_start
+            while number_end > 0 and stripped[number_end - 1].isspace():
+                number_end -= 1
+            number_start = number_end
+            while number_start > 0 and (stripped[number_start - 1].isdecimal() or stripped[number_start - 1] in ',.'):
+                number_start -= 1
+            if (number_start < number_end and stripped[number_start].isdecimal()
+                    and number_start > 0 and stripped[number_start - 1] == '('):
+                if first is None or number_start - 1 < first:
+                    first = number_start - 1
+        if first is None:
+            return text
+        return stripped[:first].rstrip()
+
     @staticmethod
     def _clean_message_content(content: str, chat: 'Chat', attachment_name: Optional[str]) -> str:
         """Remove attachment markers from message content."""
         cleaned_content = content
 
-        # Remove attachment patterns if media present and attachment found
-        if chat.has_media and chat.is_ios and '<' in content and attachment_name is not None:
-            cleaned_content = re.sub(Message.ATTACHMENT_PATTERN_IOS, '', cleaned_content)
-        elif chat.has_media and not chat.is_ios and '(' in content and attachment_name is not None:
-            cleaned_content = re.sub(Message.ATTACHMENT_PATTERN_ANDROID, '', cleaned_content)
+        # Remove attachment markers if media present and attachment found
+        if chat.has_media and attachment_name is not None:
+            markers = Message._ios_markers(content) if chat.is_ios else Message._android_markers(content)
+            pieces = []
+            pos = 0
+            for start, end, _ in markers:
+                pieces.append(content[pos:start])
+                pos = end
+            cleaned_content = ''.join(pieces) + content[pos:]
 
         if cleaned_content != content:
             # Clean up any remaining file-size annotations like "(3 KB)" or "(1,2 MB)"
-            cleaned_content = re.sub(r'\s*\(\d[\d,.]*\s*.{1,10}\)\s*$', '', cleaned_content)
+            cleaned_content = Message._strip_file_size(cleaned_content)
 
         # Make '<medien ausgeschlossen>' visible in html
         cleaned_content = cleaned_content.replace('<', '[').replace('>', ']')
@@ -189,7 +351,7 @@ class Message:
         """Parse the date from a message timestamp."""
         try:
             # Remove time part and any AM/PM indicator
-            date_str = re.split(', | ', timestamp.replace('[',''))[0]
+            date_str = TIMESTAMP_SEPARATOR_PATTERN.split(timestamp.replace('[',''))[0]
             return datetime.strptime(date_str, message_date_format).date()
         except (ValueError, AttributeError):
             return None
@@ -205,11 +367,12 @@ class Message:
         except (ValueError, AttributeError):
             return timestamp
 
+    URL_PATTERN = re.compile(r'(https?://[^\s]+)')
+
     @staticmethod
     def _wrap_urls_with_anchor_tags(text: str) -> str:
         """Wrap URLs in anchor tags."""
-        url_pattern = re.compile(r'(https?://[^\s]+)')
-        return url_pattern.sub(r'<a href="\1" target="_blank">\1</a>', text)
+        return Message.URL_PATTERN.sub(r'<a href="\1" target="_blank">\1</a>', text)
 
 
 @dataclass
@@ -227,20 +390,115 @@ class Chat:
     messages: list[Message] = field(default_factory=list)
     senders: list[str] = field(default_factory=list)
     date_range: Optional['DateRange'] = None
+    message_filter: Optional['MessageFilter'] = None
     sender_color_map: dict = field(default_factory=dict)
     own_name: str = ""
+    # ZIP file or export folder per attachment, for chats combined from several exports
+    attachment_sources: dict = field(default_factory=dict)
+
+
+class FragmentCache:
+    """Rendered markup of messages that is the same from every participant's perspective.
+
+    When one parse is rendered once per participant (--participant all), the renderers of
+    a format share a cache, so only the perspective dependent parts (own/received class
+    and bubble color) are rendered again. Fragments beyond max_chars are not cached.
+    """
+
+    def __init__(self, max_chars=256 * 1024 * 1024):
+        self.max_chars = max_chars
+        self._fragments = {}
+        self._chars = 0
+
+    def get(self, message_id):
+        return self._fragments.get(message_id)
+
+    def put(self, message_id, fragment, chars):
+        if self._chars + chars <= self.max_chars:
+            self._fragments[message_id] = fragment
+            self._chars += chars
 
 
 class Renderer:
     """Base renderer class for message rendering."""
 
+    # True if the output links to files in the media folder, which then have to be extracted
+    uses_media_files = False
+
+    # Messages between two checkpoints when rendering with a journal (--resume)
+    CHECKPOINT_INTERVAL = 500
+    # Attributes holding the names of the output files (see add_filename_suffix)
+    FILENAME_ATTRIBUTES = ()
+
     def __init__(self, output_dir=None):
         self.output_dir = output_dir
+        # Called with each newly seen attachment name while rendering (e.g. MediaExtractor.submit)
+        self.attachment_callback = None
+        # RenderCheckpoints of an ExportJournal, set when the export can be resumed
+        self.checkpoints = None
+        # FragmentCache shared with the renderers of the same format for other perspectives
+        self.fragments = None
+        # StoredMediaLinks when attachments are linked into a MediaStore instead of the media folder
+        self.media_links = None
+        self.attachments_to_extract = set()
+
+    def media_url(self, attachment_name):
+        """Link to an attachment in the media folder or media store."""
+        if self.media_links is not None:
+            return self.media_links.url(attachment_name, self.output_dir)
+        return f"{self.media_path}/{media_relative_path(attachment_name, self.media_layout)}"
+
+    def add_filename_suffix(self, suffix):
+        """Append suffix to the names of the output files, e.g. chat.html -> chat_Alice.html."""
+        for attribute in self.FILENAME_ATTRIBUTES:
+            filename = getattr(self, attribute)
+            if filename:
+                stem, ext = os.path.splitext(filename)
+                setattr(self, attribute, stem + suffix + ext)
 
     def render(self, chat):
         """Render a Chat object. To be implemented by subclasses."""
         raise NotImplementedError("Subclasses must implement render method")
 
+    def note_attachment(self, attachment_name):
+        """Remember an attachment the output links to and report it to attachment_callback."""
+        if self.uses_media_files and attachment_name not in self.attachments_to_extract:
+            self.attachments_to_extract.add(attachment_name)
+            if self.attachment_callback is not None:
+                self.attachment_callback(attachment_name)
+
+    def replay_attachments(self, chat, until_id=None):
+        """Note the attachments of messages that were rendered by an earlier, interrupted run."""
+        for message in chat.messages:
+            if until_id is not None and message.id > until_id:
+                break
+            if message.has_attachment:
+                self.note_attachment(message.attachment_name)
+        return self.attachments_to_extract
+
+    def _resume_point(self, paths):
+        """Return the last checkpoint if all partial output files are still there, else None."""
+        if self.checkpoints is None:
+            return None
+        resume = self.checkpoints.resume_point()
+        if resume is None:
+            return None
+        for name, offset in resume['offsets'].items():
+            path = paths.get(name)
+            if path is None or not os.path.exists(path) or os.path.getsize(path) < offset:
+                logger.warning("Partial output %s does not match the journal, rendering it again", path or name)
+                return None
+        return resume
+
+    def _open_output(self, path, resume, name):
+        """Open an output file for writing; when resuming, truncate it at the checkpoint."""
+        if resume is None:
+            return open(path, 'w', encoding='utf-8')
+        f = open(path, 'r+', encoding='utf-8')
+        f.seek(resume['offsets'][name])
+        f.truncate()
+        return f
+
     def get_generated_files(self) -> list[Path]:
         """Get the generated files."""
         raise NotImplementedError("Subclasses must implement get_generated_files method")
@@ -251,6 +509,8 @@ def macos_file_picker():
     pip install pyobjc-framework-Cocoa
     for this to work
     """
+    from AppKit import NSOpenPanel, NSApplication
+
     # Initialize NSApplication if it hasn't been
     app = NSApplication.sharedApplication()
     app.setActivationPolicy_(1)  # NSApplicationActivationPolicyRegular
@@ -286,6 +546,8 @@ def windows_file_picker():
     pip install pywin32
     for this to work.
     """
+    import win32ui
+
     # Define file filter format: "Description|*.extension|"
     file_filter = "ZIP Files (*.zip)|*.zip|All Files (*.*)|*.*|"
 
@@ -300,10 +562,45 @@ def windows_file_picker():
 
 VERSION = "1.0.7"
 
-try:
-    __version__ = _pkg_version("chat-export") or VERSION
-except PackageNotFoundError:
-    __version__ = VERSION
+_version = None
+
+def get_version():
+    """Return the installed package version, falling back to VERSION.
+
+    The version is normally taken from the name of the chat_export-<version>.dist-info
+    directory next to the package, because importing importlib.metadata costs more
+    than everything else the non-interactive path needs.
+    """
+    global _version
+    if _version is None:
+        _version = _find_dist_info_version() or _find_metadata_version() or VERSION
+    return _version
+
+def _find_dist_info_version():
+    module_file = globals().get('__file__')
+    if not module_file:
+        # e.g. when run via exec() directly from GitHub
+        return None
+    try:
+        site_dir = Path(module_file).resolve().parent.parent
+        for dist_info in site_dir.glob('chat_export-*.dist-info'):
+            return dist_info.name[len('chat_export-'):-len('.dist-info')]
+    except OSError:
+        pass
+    return None
+
+def _find_metadata_version():
+    from importlib.metadata import version as _pkg_version, PackageNotFoundError
+    try:
+        return _pkg_version("chat-export")
+    except PackageNotFoundError:
+        return None
+
+def __getattr__(name):
+    # Resolve __version__ lazily on first access (PEP 562)
+    if name == '__version__':
+        return get_version()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 donate_link = "https://donate.stripe.com/3cI8wO0yD8Wt0ItbV06J204"
 
@@ -327,6 +624,222 @@ def parse_path(path_str: str) -> Path:
     # Convert into an OS-specific Path (resolves separators automatically)
     return Path(pure)
 
+def parse_size(size_str) -> int:
+    """Parse a size in bytes like '500000', '300K', '5M' or '1.5G' (binary units)."""
+    if isinstance(size_str, int):
+        return size_str
+    units = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    match = SIZE_PATTERN.fullmatch(str(size_str))
+    if not match:
+        raise ValueError(f"Invalid size '{size_str}', use e.g. 500K, 5M or 1G")
+    return int(float(match.group(1)) * units[match.group(2).upper()])
+
+def parse_serve_arguments(argv):
+    """Parse command line arguments for the serve command."""
+    parser = argparse.ArgumentParser(
+        prog='chat-export serve',
+        description='Serve a WhatsApp chat export ZIP as HTML on a local web server. '
+                    'Media is streamed directly from the ZIP, nothing is extracted.'
+    )
+    parser.add_argument('zip_file',
+                        type=str,
+                        help='Path to WhatsApp chat export ZIP file')
+    parser.add_argument('--host',
+                        type=str,
+                        default='127.0.0.1',
+                        help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port',
+                        type=int,
+                        default=8000,
+                        help='Port to listen on (default: 8000, use 0 for any free port)')
+    parser.add_argument('--open',
+                        action='store_true',
+                        help='Open the chat in the default web browser')
+    return parser.parse_args(argv)
+
+def parse_worker_arguments(argv):
+    """Parse command line arguments for the worker command."""
+    parser = argparse.ArgumentParser(
+        prog='chat-export worker',
+        description='Run conversion jobs given as JSON lines on stdin (or a Unix socket) '
+                    'and write one JSON result line per job to stdout (or the socket).'
+    )
+    parser.add_argument('--socket',
+                        type=str,
+                        help='Path of a Unix socket to accept job streams on instead of stdin')
+    parser.add_argument('-j', '--concurrency',
+                        type=int,
+                        default=1,
+                        help='Number of jobs to run at the same time (default: 1)')
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    return args
+
+# Layouts of the media folder: every attachment directly in it, or fanned out into
+# media/ab/cd/<name> by a hash of the name, so that no folder holds more than a few files
+# even for exports with hundreds of thousands of attachments
+MEDIA_LAYOUTS = ('flat', 'sharded')
+
+
+def media_relative_path(attachment_name, layout='flat') -> str:
+    """Path of an attachment in the media folder, with '/' as separator."""
+    if layout == 'sharded':
+        import hashlib
+
+        digest = hashlib.sha1(attachment_name.encode('utf-8')).hexdigest()
+        return f"{digest[:2]}/{digest[2:4]}/{attachment_name}"
+    return attachment_name
+
+
+def export_stem(path) -> str:
+    """Base name of an export: the ZIP file name without extension, or the folder name
+    of an already extracted export."""
+    path = Path(path)
+    return path.name if path.is_dir() else path.stem
+
+def parse_watch_arguments(argv):
+    """Parse command line arguments for the watch command."""
+    parser = argparse.ArgumentParser(
+        prog='chat-export watch',
+        description='Watch a folder and convert every chat export ZIP that is added to it or changed.'
+    )
+    parser.add_argument('watch_dir',
+                        help='Folder to watch for chat export ZIP files')
+    parser.add_argument('-o', '--output-dir',
+                        type=str,
+                        required=True,
+                        help='Base directory where the outputs are created')
+    parser.add_argument('-p', '--participant',
+                        action='append',
+                        help='Name of the participant that represents yourself, can be given several times '
+                             '(default: all, one output per participant)')
+    parser.add_argument('-j', '--workers',
+                        type=int,
+                        default=1,
+                        help='Number of exports to convert at the same time (default: 1)')
+    parser.add_argument('--timeout',
+                        type=float,
+                        help='Stop a conversion that takes longer than this many seconds (default: no limit)')
+    parser.add_argument('--interval',
+                        type=float,
+                        default=5.0,
+                        help='Seconds between two scans of the folder (default: 5)')
+    parser.add_argument('--stable-polls',
+                        type=int,
+                        default=2,
+                        help='Scans a ZIP must keep its size and modification time before it is converted '
+                             '(default: 2)')
+    parser.add_argument('--once',
+                        action='store_true',
+                        help='Convert the ZIPs in the folder and exit instead of watching')
+    parser.add_argument('--metrics',
+                        type=str,
+                        metavar='FILE',
+                        help='Keep queue depth, throughput, failures and stage latencies in this file')
+    parser.add_argument('--metrics-format',
+                        choices=('json', 'prometheus'),
+                        help='Format of the --metrics file (default: prometheus for *.prom, otherwise json)')
+    parser.add_argument('--embed-media', action='store_true',
+                        help='Embed media files as base64 in HTML instead of linking to external files')
+    parser.add_argument('--format', action='append', choices=sorted(RENDERERS),
+                        help='Output format, can be given several times (html, embedded, json; default: html)')
+    parser.add_argument('--compress', action='store_true',
+                        help='With --embed-media: store messages and compressible attachments deflate-compressed')
+    parser.add_argument('--compact', action='store_true',
+                        help='Smaller HTML: short per-sender classes and a stylesheet shared by the HTML files')
+    parser.add_argument('--stats', action='store_true',
+                        help='Also write statistics (<name>_stats.json and .html)')
+    parser.add_argument('--media-layout', choices=MEDIA_LAYOUTS, default='flat',
+                        help='flat: all attachments in the media folder (default); sharded: in media/ab/cd/<name>')
+    parser.add_argument('--media-cache', type=str, metavar='DIR',
+                        help='With --embed-media: keep the encoded attachments in this folder for later exports')
+    parser.add_argument('--media-store', type=str, metavar='DIR',
+                        help='Store attachments once in this content-addressed folder shared by all exports')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.stable_polls < 1:
+        parser.error("--stable-polls must be at least 1")
+    if args.timeout is not None and args.timeout <= 0:
+        parser.error("--timeout must be positive")
+    embedded = args.embed_media or 'embedded' in (args.format or [])
+    if args.compress and not embedded:
+        parser.error("--compress requires --embed-media")
+    if args.media_cache and not embedded:
+        parser.error("--media-cache requires --embed-media")
+    if args.media_store and args.media_layout != 'flat':
+        parser.error("--media-store can't be combined with --media-layout")
+    if args.metrics and not args.metrics_format:
+        args.metrics_format = 'prometheus' if args.metrics.endswith('.prom') else 'json'
+    return args
+
+def parse_gc_arguments(argv):
+    """Parse command line arguments for the gc command."""
+    parser = argparse.ArgumentParser(
+        prog='chat-export gc',
+        description='Delete the attachments of a --media-store folder that no remaining export links to.'
+    )
+    parser.add_argument('store',
+                        help='The media store folder')
+    parser.add_argument('--grace',
+                        type=float,
+                        default=MediaStore.GC_GRACE_SECONDS / 3600,
+                        help='Keep attachments added in the last this many hours, which exports that are still '
+                             'running may link to (default: 1)')
+    parser.add_argument('--dry-run',
+                        action='store_true',
+                        help='Only report what would be deleted')
+    return parser.parse_args(argv)
+
+def parse_merge_arguments(argv):
+    """Parse command line arguments for the merge command."""
+    parser = argparse.ArgumentParser(
+        prog='chat-export merge',
+        description='Merge several exports of the same chat (e.g. from different phones, covering '
+                    'overlapping periods) into one HTML export without duplicate messages.'
+    )
+    parser.add_argument('exports',
+                        nargs='+',
+                        help='Chat export ZIP files or extracted export folders (at least two)')
+    parser.add_argument('-p', '--participant',
+                        action='append',
+                        required=True,
+                        help='Name of the participant that represents yourself; several times or "all" for '
+                             'one output per participant')
+    parser.add_argument('--name',
+                        type=str,
+                        help='Name of the merged output (default: name of the first export + "_merged")')
+    parser.add_argument('--from-date', type=str, help='Start date for filtering messages (optional)')
+    parser.add_argument('--until-date', type=str, help='End date for filtering messages (optional)')
+    parser.add_argument('-o', '--output-dir',
+                        type=str,
+                        help='Base directory where the output will be created (default: current working directory)')
+    parser.add_argument('--embed-media', action='store_true',
+                        help='Embed media files as base64 in HTML instead of linking to external files')
+    parser.add_argument('--format', action='append', choices=sorted(RENDERERS),
+                        help='Output format, can be given several times (html, embedded, json; default: html)')
+    parser.add_argument('--compress', action='store_true',
+                        help='With --embed-media: store messages and compressible attachments deflate-compressed')
+    parser.add_argument('--compact', action='store_true',
+                        help='Smaller HTML: short per-sender classes and a stylesheet shared by the HTML files')
+    parser.add_argument('--media-layout', choices=MEDIA_LAYOUTS, default='flat',
+                        help='flat: all attachments in the media folder (default); sharded: in media/ab/cd/<name>')
+    parser.add_argument('--media-store', type=str, metavar='DIR',
+                        help='Store attachments once in this content-addressed folder shared by all exports')
+    parser.add_argument('--no-pipeline', action='store_true',
+                        help='Extract media only after all HTML has been written instead of while rendering')
+    parser.add_argument('--no-crc-check', action='store_true',
+                        help='Skip the CRC check for media copied directly from uncompressed ZIP entries')
+    args = parser.parse_args(argv)
+    if len(args.exports) < 2:
+        parser.error("at least two exports are needed for merging")
+    if args.compress and not (args.embed_media or 'embedded' in (args.format or [])):
+        parser.error("--compress requires --embed-media")
+    if args.media_store and args.media_layout != 'flat':
+        parser.error("--media-store can't be combined with --media-layout")
+    return args
+
 def parse_arguments():
     """Parse command line arguments for both interactive and non-interactive modes."""
     parser = argparse.ArgumentParser(
@@ -354,11 +867,12 @@ Examples:
 
     parser.add_argument('-z', '--zip-file',
                        type=str,
-                       help='Path to WhatsApp chat export ZIP file (required in non-interactive mode)')
+                       help='Path to WhatsApp chat export ZIP file or already extracted export folder (required in non-interactive mode)')
 
     parser.add_argument('-p', '--participant',
-                       type=str,
-                       help='Name of the participant that represents yourself (required in non-interactive mode)')
+                       action='append',
+                       help='Name of the participant that represents yourself (required in non-interactive mode). '
+                            'Give it several times, or "all", to write one output from each participant\'s perspective')
 
     parser.add_argument('--from-date',
                        type=str,
@@ -376,10 +890,124 @@ Examples:
                        action='store_true',
                        help='Embed media files as base64 in HTML instead of linking to external files')
 
+    parser.add_argument('--embed-max-size',
+                       type=str,
+                       metavar='SIZE',
+                       help='With --embed-media: only embed attachments up to this size (e.g. 5M) and link larger ones '
+                            'to a media folder next to the HTML file')
+
+    parser.add_argument('--embed-budget',
+                       type=str,
+                       metavar='SIZE',
+                       help='With --embed-media: embed at most this many bytes of attachments in total (e.g. 200M), '
+                            'smallest first, and link the rest')
+
+    parser.add_argument('--format',
+                       action='append',
+                       choices=sorted(RENDERERS),
+                       help='Output format, can be given several times to write several formats from one parse: '
+                            'html (chat.html and chat_media_linked.html with a media folder), embedded (one HTML file '
+                            'with media embedded, same as --embed-media), json (chat.json). Default: html')
+
+    parser.add_argument('--sender',
+                       action='append',
+                       metavar='NAME',
+                       help='Only export messages of this sender (can be given several times)')
+
+    parser.add_argument('--grep',
+                       type=str,
+                       metavar='REGEX',
+                       help='Only export messages whose text matches this regular expression, e.g. "(?i)holiday"')
+
+    parser.add_argument('--stats',
+                       action='store_true',
+                       help='Also write chat statistics (messages per sender, day, month and hour, attachments per type) '
+                            'as JSON and HTML')
+
+    parser.add_argument('--compress',
+                       action='store_true',
+                       help='With --embed-media: store messages and compressible attachments deflate-compressed '
+                            '(smaller file, needs a browser with JavaScript to display)')
+
+    parser.add_argument('--compact',
+                       action='store_true',
+                       help='Write smaller HTML: short per-sender classes instead of inline styles, and one stylesheet '
+                            'file (chat-export.css) shared by the HTML files of the output folder')
+
+    parser.add_argument('--media-cache',
+                       type=str,
+                       metavar='DIR',
+                       help='With --embed-media: keep the encoded attachments in this folder, so exporting the same '
+                            'files again (e.g. with another date range or participant) copies them instead of encoding')
+
+    parser.add_argument('--media-cache-size',
+                       type=str,
+                       metavar='SIZE',
+                       help='Maximum size of the --media-cache folder, e.g. 500M or 5G; the least recently used '
+                            'attachments are removed beyond it (default: 1G)')
+
+    parser.add_argument('--media-layout',
+                       choices=MEDIA_LAYOUTS,
+                       default='flat',
+                       help='flat: all attachments directly in the media folder (default); sharded: in subfolders '
+                            'media/ab/cd/<name> named after a hash of the file name, for exports with very many attachments')
+
+    parser.add_argument('--media-store',
+                       type=str,
+                       metavar='DIR',
+                       help='Store attachments once in this content-addressed folder shared by all exports and link '
+                            'to them there instead of copying them into a media folder per chat '
+                            '(clean up with "chat-export gc DIR")')
+
+    parser.add_argument('--plan',
+                       action='store_true',
+                       help='Only print a JSON estimate of the conversion (messages, date span, senders, attachments, '
+                            'output sizes with linked and embedded media) without writing anything. Needs --zip-file')
+
+    parser.add_argument('--resume',
+                       action='store_true',
+                       help='Keep a progress journal in the output folder and, if an earlier run with the same options '
+                            'was interrupted, continue it instead of starting over')
+
+    parser.add_argument('--no-pipeline',
+                       action='store_true',
+                       help='Extract media only after all HTML has been written instead of while rendering')
+
+    parser.add_argument('--no-crc-check',
+                       action='store_true',
+                       help='Skip the CRC check for media copied directly from uncompressed ZIP entries')
+
     args = parser.parse_args()
 
+    embedded = args.embed_media or 'embedded' in (args.format or [])
+    if args.compress and not embedded:
+        parser.error("--compress requires --embed-media")
+    if args.media_cache and not embedded:
+        parser.error("--media-cache requires --embed-media")
+    if args.media_cache_size is not None and not args.media_cache:
+        parser.error("--media-cache-size requires --media-cache")
+    if args.media_store and args.media_layout != 'flat':
+        parser.error("--media-store can't be combined with --media-layout")
+    for option, value in (('--embed-max-size', args.embed_max_size), ('--embed-budget', args.embed_budget),
+                          ('--media-cache-size', args.media_cache_size)):
+        if value is not None:
+            if not embedded:
+                parser.error(f"{option} requires --embed-media")
+            try:
+                parse_size(value)
+            except ValueError as e:
+                parser.error(f"{option}: {e}")
+    if args.grep:
+        try:
+            re.compile(args.grep)
+        except re.error as e:
+            parser.error(f"invalid --grep pattern: {e}")
+
+    if args.plan and not args.zip_file:
+        parser.error("--plan requires --zip-file (-z)")
+
     # Validate non-interactive mode requirements
-    if args.non_interactive:
+    if args.non_interactive and not args.plan:
         if not args.zip_file:
             parser.error("Non-interactive mode requires --zip-file (-z)")
         if not args.participant:
@@ -391,24 +1019,39 @@ Examples:
 class MessageParser:
     """Handles parsing of WhatsApp chat content into Message objects."""
 
+    # Chat patterns for different platforms, compiled once and shared by all parsers.
+    # Time separator can be ':' (most locales, e.g. 18:00) or '.' (Indonesian
+    # WhatsApp exports, e.g. 18.00), so match either.
+    CHAT_PATTERNS = {
+        'ios': re.compile(r'\[(\d{1,4}.\d{1,2}.\d{2,4},? \d{1,2}[.:]\d{2}(?:[.:]\d{2})?(?:\s*[AaPp][Mm])?)\] (.*?): (.*)'),
+        'android': re.compile(
+            r'(\d{1,4}.\d{1,2}.\d{2,4},? \d{1,2}[.:]\d{2}(?:[.:]\d{2})?(?:\s*[AaPp]\.?\s*[Mm]\.?)?) - (.*?): (.*)')
+    }
+    WHATSAPP_PATTERNS = {
+        'ios': re.compile(r'\[(\d{1,4}.\d{1,2}.\d{2,4},? \d{1,2}[.:]\d{2}(?:[.:]\d{2})?(?:\s*[AaPp][Mm])?)\] (.*)'),
+        'android': re.compile(
+            r'(\d{1,4}.\d{1,2}.\d{2,4},? \d{1,2}[.:]\d{2}(?:[.:]\d{2})?(?:\s*[AaPp]\.?\s*[Mm]\.?)?) - (.*)')
+    }
+    # Both of the above in one pattern, for finding all message starts of the chat text with
+    # a single finditer: group 1 is the timestamp, group 2 the sender (None for WhatsApp
+    # system messages) and group 3 the first line of the message text.
+    MESSAGE_START_PATTERNS = {
+        'ios': re.compile(
+            r'^\[(\d{1,4}.\d{1,2}.\d{2,4},? \d{1,2}[.:]\d{2}(?:[.:]\d{2})?(?:\s*[AaPp][Mm])?)\] (?:(.*?): )?(.*)',
+            re.MULTILINE),
+        'android': re.compile(
+            r'^(\d{1,4}.\d{1,2}.\d{2,4},? \d{1,2}[.:]\d{2}(?:[.:]\d{2})?(?:\s*[AaPp]\.?\s*[Mm]\.?)?) - (?:(.*?): )?(.*)',
+            re.MULTILINE)
+    }
+
     def __init__(self, is_ios=False, has_media=False, attachments_in_zip=None):
         self.is_ios = is_ios
         self.has_media = has_media
         self.attachments_in_zip = attachments_in_zip or set()
 
-        # Chat patterns for different platforms
-        # Time separator can be ':' (most locales, e.g. 18:00) or '.' (Indonesian
-        # WhatsApp exports, e.g. 18.00), so match either.
-        self.chat_patterns = {
-            'ios': re.compile(r'\[(\d{1,4}.\d{1,2}.\d{2,4},? \d{1,2}[.:]\d{2}(?:[.:]\d{2})?(?:\s*[AaPp][Mm])?)\] (.*?): (.*)'),
-            'android': re.compile(
-                r'(\d{1,4}.\d{1,2}.\d{2,4},? \d{1,2}[.:]\d{2}(?:[.:]\d{2})?(?:\s*[AaPp]\.?\s*[Mm]\.?)?) - (.*?): (.*)')
-        }
-        self.whatsapp_patterns = {
-            'ios': re.compile(r'\[(\d{1,4}.\d{1,2}.\d{2,4},? \d{1,2}[.:]\d{2}(?:[.:]\d{2})?(?:\s*[AaPp][Mm])?)\] (.*)'),
-            'android': re.compile(
-                r'(\d{1,4}.\d{1,2}.\d{2,4},? \d{1,2}[.:]\d{2}(?:[.:]\d{2})?(?:\s*[AaPp]\.?\s*[Mm]\.?)?) - (.*)')
-        }
+        self.chat_patterns = self.CHAT_PATTERNS
+        self.whatsapp_patterns = self.WHATSAPP_PATTERNS
+        self.message_start_patterns = self.MESSAGE_START_PATTERNS
 
         self.newline_marker = ' $NEWLINE$ '
         self.message_date_format = "%d.%m.%y"
@@ -422,24 +1065,26 @@ class MessageParser:
             "%d/%m/%y"   # Indonesian format: DD/MM/YY
         ]
 
+    def _iter_sender_timestamps(self, chat_content):
+        """Yield the timestamps of all messages that have a sender."""
+        pattern = self.message_start_patterns['ios'] if self.is_ios else self.message_start_patterns['android']
+        for match in pattern.finditer(chat_content):
+            if match.group(2) is not None:
+                yield match.group(1)
+
     def get_date_format(self, chat_content):
         """Determine the date format used in the chat."""
         chat_content = chat_content.replace('‎','')
-        first_line = None
-        pattern = self.chat_patterns['ios'] if self.is_ios else self.chat_patterns['android']
-        for line in chat_content.split('\n'):
-            if pattern.match(line):
-                first_line = line
-                break
+        first_timestamp = next(self._iter_sender_timestamps(chat_content), None)
 
-        if first_line is None:
-            first_line_content = chat_content.split('\n')[0]
+        if first_timestamp is None:
+            first_line_content = chat_content.split('\n', 1)[0]
             raise ValueError(f"Could not determine the date format of the chat: {first_line_content}")
 
         # Use the same splitting logic as elsewhere (comma+space OR plain space)
         # instead of a plain ',' split, since some locales (e.g. Indonesian
         # exports: '30/08/25 18.00 - ...') have no comma between date and time.
-        first_line_date = re.split(', | ', first_line.replace('[', ''))[0]
+        first_line_date = TIMESTAMP_SEPARATOR_PATTERN.split(first_timestamp)[0]
         # find first non-digit in the date string
         deliminator = None
         for char in first_line_date:
@@ -457,10 +1102,8 @@ class MessageParser:
         year_pattern = '%y' if len(first_line_date.split(deliminator)[2]) == 2 else '%Y'
         # need to find out if month or day comes first.
         day_before_month = True
-        for line in chat_content.split('\n'):
-            if not pattern.match(line):
-                continue
-            date_str = re.split(', | ', line.replace('[',''))[0]
+        for timestamp in self._iter_sender_timestamps(chat_content):
+            date_str = TIMESTAMP_SEPARATOR_PATTERN.split(timestamp)[0]
             first, second, _ = date_str.split(deliminator)
             # convert to int
             first = int(first)
@@ -481,7 +1124,7 @@ class MessageParser:
         """Helper method to parse timestamp for date filtering during message processing."""
         try:
             # Remove time part and any AM/PM indicator
-            date_str = re.split(', | ', timestamp.replace('[',''))[0]
+            date_str = TIMESTAMP_SEPARATOR_PATTERN.split(timestamp.replace('[',''))[0]
             return datetime.strptime(date_str, self.message_date_format).date()
         except (ValueError, AttributeError):
             return None
@@ -526,16 +1169,10 @@ class MessageParser:
 
     def get_senders(self, chat_content):
         """Extract all unique senders from chat content."""
-        senders = set()
-        pattern = self.chat_patterns['ios'] if self.is_ios else self.chat_patterns['android']
-        for line in chat_content.split('\n'):
-            match = pattern.match(line)
-            if match:
-                sender = match.group(2)
-                sender = self.trim_zero_widths(sender)
-                sender = self.mark_invisible_chars(sender)
-                senders.add(sender)
-        return sorted(list(senders))
+        pattern = self.message_start_patterns['ios'] if self.is_ios else self.message_start_patterns['android']
+        raw_senders = {match.group(2) for match in pattern.finditer(chat_content)}
+        raw_senders.discard(None)
+        return sorted({self._normalize_sender(sender) for sender in raw_senders})
 
     def _generate_color_map(self, senders, own_name):
         """Generate color mapping for senders."""
@@ -585,13 +1222,13 @@ class MessageParser:
 
         return color_map
 
-    def parse_messages(self, chat_content, chat_name="", date_range=None, own_name=""):
-        """Parse chat content into a Chat object."""
+    def create_chat(self, chat_content, chat_name="", date_range=None, own_name="", message_filter=None):
+        """Create an empty Chat object with the metadata of the chat content."""
         # Set the message date format
         self.message_date_format = self.get_date_format(chat_content)
 
         # Create Chat object with metadata
-        chat = Chat(
+        return Chat(
             name=chat_name,
             is_ios=self.is_ios,
             has_media=self.has_media,
@@ -601,197 +1238,1259 @@ class MessageParser:
             messages=[],
             senders=self.get_senders(chat_content),
             date_range=date_range,
+            message_filter=message_filter,
             sender_color_map={},
             own_name=own_name
         )
 
-        # Preprocess the chat content to handle multi-line messages
-        processed_content = []
-        current_line = []
-        filtered_count = 0
-        total_count = 0
-
-        for line in chat_content.split('\n'):
-            # remove the Left-to-right_marks
-            line = line.replace('‎','')
-            pattern = self.chat_patterns['ios'] if self.is_ios else self.chat_patterns['android']
-            wapattern = self.whatsapp_patterns['ios'] if self.is_ios else self.whatsapp_patterns['android']
-            match = pattern.match(line)
-            wamatch = wapattern.match(line)
-
-            if match or wamatch:
-                total_count += 1
-                if current_line:
-                    processed_content.append(''.join(current_line))
-
-                # Only add messages within date range
-                if match:
-                    timestamp = match.group(1)
-                    if date_range and not date_range.contains(self._parse_timestamp_date(timestamp)):
-                        current_line = []
-                        continue
-                else:
-                    timestamp = wamatch.group(1)
-                    if date_range and not date_range.contains(self._parse_timestamp_date(timestamp)):
-                        current_line = []
-                        continue
+    def _normalize_sender(self, sender):
+        """Sender name as shown in the export (zero-widths trimmed, invisible chars marked)."""
+        return self.mark_invisible_chars(self.trim_zero_widths(sender))
 
-                filtered_count += 1
-                current_line = [line]
-            else:
-                if current_line:
-                    current_line.append(self.newline_marker + line)
+    def _scan_messages(self, chat_content, date_range, counts, message_filter=None):
+        """Yield (timestamp, raw sender, text) for each message of the date range, with the
+        lines of the text joined by the newline marker. The sender is None for WhatsApp
+        system messages.
+
+        Message starts are found with one finditer over the whole chat text; the text
+        of a message is everything up to the next message start. Messages rejected by the
+        date range or the sender of message_filter are skipped before their text is built.
+        """
+        chat_content = chat_content.replace('‎', '')
+        pattern = self.message_start_patterns['ios'] if self.is_ios else self.message_start_patterns['android']
+        check_sender = message_filter is not None and message_filter.senders is not None
+        check_text = message_filter is not None and message_filter.pattern is not None
+        sender_names = {}
+        # dates by the date part of the timestamp, which is everything before the first space
+        dates = {}
+        # (timestamp, sender, first line, end of first line) of the message being read
+        pending = None
+
+        def finish(message, text_end):
+            timestamp, sender, first_line, first_line_end = message
+            # the regex sees the message text only, with its original line breaks
+            more_lines = chat_content[first_line_end:text_end]
+            if check_text and not message_filter.accepts_text(first_line + more_lines):
+                return None
+            counts['filtered'] += 1
+            return timestamp, sender, first_line + more_lines.replace('\n', self.newline_marker)
+
+        for match in pattern.finditer(chat_content):
+            counts['total'] += 1
+            if pending is not None:
+                # the line break before this message start is not part of the text
+                result = finish(pending, match.start() - 1)
+                if result is not None:
+                    yield result
+                pending = None
+
+            timestamp, sender, first_line = match.groups()
+            # Only add messages within date range
+            if date_range:
+                date_part = timestamp.partition(' ')[0]
+                if date_part not in dates:
+                    dates[date_part] = self._parse_timestamp_date(timestamp)
+                if not date_range.contains(dates[date_part]):
+                    continue
+            if check_sender:
+                if sender not in sender_names:
+                    sender_names[sender] = "WhatsApp" if sender is None else self._normalize_sender(sender)
+                if not message_filter.accepts_sender(sender_names[sender]):
+                    continue
+            pending = (timestamp, sender, first_line, match.end())
 
         # Don't forget to add the last message
-        if current_line:
-            processed_content.append(''.join(current_line))
+        if pending is not None:
+            result = finish(pending, len(chat_content))
+            if result is not None:
+                yield result
 
-        # Parse each processed line into Message objects
-        messages = []
-        for line in processed_content:
-            pattern = self.chat_patterns['ios'] if self.is_ios else self.chat_patterns['android']
-            wapattern = self.whatsapp_patterns['ios'] if self.is_ios else self.whatsapp_patterns['android']
-            match = pattern.match(line)
-            wamatch = wapattern.match(line)
+    def iter_messages(self, chat_content, chat, date_range=None, counts=None, message_filter=None):
+        """Yield the Message objects of the chat content one at a time.
 
-            if match:
-                timestamp, sender, content = match.groups()
-                sender = self.trim_zero_widths(sender)
-                sender = self.mark_invisible_chars(sender)
-                messages.append(Message.create_with_context(
-                    id=len(messages)+1,
-                    timestamp=timestamp,
-                    sender=sender,
-                    content=content,
-                    chat=chat
-                ))
-            elif wamatch:
-                timestamp, content = wamatch.groups()
-                messages.append(Message.create_with_context(
-                    id=len(messages)+1,
-                    timestamp=timestamp,
-                    sender="WhatsApp",
-                    content=content,
-                    chat=chat
-                ))
+        chat must come from create_chat. If given, counts['total'] and counts['filtered']
+        are incremented with the number of messages seen and kept by the date range and
+        message_filter.
+        """
+        if counts is None:
+            counts = {'total': 0, 'filtered': 0}
+        sender_names = {None: "WhatsApp"}
+        message_id = 0
+        for timestamp, sender, content in self._scan_messages(chat_content, date_range, counts, message_filter):
+            if sender not in sender_names:
+                sender_names[sender] = self._normalize_sender(sender)
+            message_id += 1
+            yield Message.create_with_context(
+                id=message_id,
+                timestamp=timestamp,
+                sender=sender_names[sender],
+                content=content,
+                chat=chat
+            )
+
+    def parse_messages(self, chat_content, chat_name="", date_range=None, own_name="", stats=None, message_filter=None):
+        """Parse chat content into a Chat object. If given, stats (a ChatStatistics) is
+        updated with every parsed message."""
+        chat = self.create_chat(chat_content, chat_name, date_range, own_name, message_filter)
+        counts = {'total': 0, 'filtered': 0}
 
         # Update chat with messages and color map
-        chat.messages.extend(messages)
+        if stats is None:
+            chat.messages.extend(self.iter_messages(chat_content, chat, date_range, counts, message_filter))
+        else:
+            for message in self.iter_messages(chat_content, chat, date_range, counts, message_filter):
+                chat.messages.append(message)
+                stats.add(message)
         chat.sender_color_map.update(self._generate_color_map(chat.senders, own_name))
 
-        return chat, filtered_count, total_count
+        return chat, counts['filtered'], counts['total']
 
 
-class HTMLRenderer(Renderer):
-    """Renders messages to HTML format."""
+class ChatStatistics:
+    """Chat statistics that are updated one message at a time while parsing.
 
-    def __init__(self, output_dir, has_media=False, embed_media=False, zip_path=None, media_path="./media"):
-        super().__init__(output_dir)
-        self.has_media = has_media
-        self.embed_media = embed_media
-        self.zip_path = zip_path
-        self.media_path = media_path
-        self.html_filename = 'chat.html'
-        self.html_filename_media_linked = 'chat_media_linked.html'
-        if embed_media:
-            # replace .zip with .html
-            self.html_filename = Path(self.zip_path).stem + '.html'
-            self.html_filename_media_linked = None
-        self.attachments_to_extract = set()
+    Only counters per sender, day, month, hour and attachment type are kept, so memory
+    does not grow with the number of messages.
+    """
 
-    def get_generated_files(self) -> list[Path]:
-        """Get the generated files."""
-        result = [Path(self.output_dir, self.html_filename)]
-        if self.html_filename_media_linked:
-            result.append(Path(self.output_dir, self.html_filename_media_linked))
-        return result
+    TIME_PATTERN = re.compile(r'(\d{1,2})[:.]\d{2}(?:[:.]\d{2})?\s*([AaPp])?')
 
-    def get_css_styles(self):
-        """Return the CSS styles for the HTML output."""
-        return """body {
-            font-family: Arial, sans-serif;
-            max-width: 900px;
-            margin: 0 auto;
-            padding: 20px;
-            background-color: #e5ddd5;
-        }
-        .message {
-            margin: 10px 0;
-            padding: 10px;
-            border-radius: 7.5px;
-            max-width: 65%;
-            position: relative;
-            clear: both;
-        }
-        .message.sent {
-            float: right;
-            margin-left: 35%;
-        }
-        .message.whatsapp {
-            max-width: 100%
-        }
-        .media {
-            max-width: 100%;
-            border-radius: 5px;
-            margin: 5px 0;
-        }
-        .text-file {
-            border: 1px solid #ddd;
-            border-radius: 5px;
-            padding: 10px;
-            background-color: #f9f9f9;
-            margin: 5px 0;
-        }
-        .text-file h4 {
-            margin: 0 0 10px 0;
-            color: #333;
-            font-size: 0.9em;
-        }
-        .text-content {
-            background-color: #fff;
-            border: 1px solid #e0e0e0;
-            border-radius: 3px;
-            padding: 10px;
-            font-family: 'Courier New', monospace;
-            font-size: 0.8em;
-            max-height: 300px;
-            overflow-y: auto;
-            white-space: pre-wrap;
-            word-wrap: break-word;
-        }
-        .timestamp {
-            color: #667781;
-            font-size: 0.75em;
-            float: right;
-            margin-left: 10px;
-            margin-top: 5px;
-        }
-        .sender {
-            color: #1f7aad;
-            font-size: 0.85em;
-            font-weight: bold;
-            display: block;
-            margin-bottom: 5px;
-        }
-        .content {
-            word-wrap: break-word;
-        }
-        .clearfix::after {
-            content: "";
-            clear: both;
-            display: table;
-        }
-        a {
-            color: #039be5;
-            text-decoration: none;
-        }
-        a:hover {
-            text-decoration: underline;
+    def __init__(self, attachment_size=None):
+        from collections import Counter
+
+        # callable returning the size in bytes of an attachment
+        self.attachment_size = attachment_size or (lambda name: 0)
+        self.message_count = 0
+        self.messages_per_sender = Counter()
+        self.messages_per_day = Counter()
+        self.messages_per_month = Counter()
+        self.messages_per_hour = Counter()
+        self.attachments_per_type = Counter()
+        self.attachment_bytes_per_type = Counter()
+        self.first_date = None
+        self.last_date = None
+
+    @classmethod
+    def hour_of(cls, timestamp):
+        """Hour (0-23) of a message timestamp like '24.12.23, 18:30' or '[12/24/23, 6:30:12 PM]'."""
+        date_and_time = TIMESTAMP_SEPARATOR_PATTERN.split(timestamp.replace('[', '').replace(']', ''), maxsplit=1)
+        if len(date_and_time) < 2:
+            return None
+        match = cls.TIME_PATTERN.search(date_and_time[1])
+        if not match:
+            return None
+        hour = int(match.group(1)) % 24
+        if match.group(2) in ('P', 'p') and hour < 12:
+            hour += 12
+        elif match.group(2) in ('A', 'a') and hour == 12:
+            hour = 0
+        return hour
+
+    def add(self, message):
+        """Count one message."""
+        self.message_count += 1
+        self.messages_per_sender[message.sender] += 1
+        day = message.parsed_date
+        if day is not None:
+            self.messages_per_day[day.isoformat()] += 1
+            self.messages_per_month[day.strftime('%Y-%m')] += 1
+            if self.first_date is None or day < self.first_date:
+                self.first_date = day
+            if self.last_date is None or day > self.last_date:
+                self.last_date = day
+        hour = self.hour_of(message.timestamp)
+        if hour is not None:
+            self.messages_per_hour[hour] += 1
+        if message.attachment_name:
+            file_type = os.path.splitext(message.attachment_name)[1].lstrip('.').lower() or 'other'
+            self.attachments_per_type[file_type] += 1
+            self.attachment_bytes_per_type[file_type] += self.attachment_size(message.attachment_name)
+
+    def to_dict(self):
+        """Statistics as a JSON-serializable dict."""
+        return {
+            'messages': self.message_count,
+            'first_date': self.first_date.isoformat() if self.first_date else None,
+            'last_date': self.last_date.isoformat() if self.last_date else None,
+            'messages_per_sender': dict(self.messages_per_sender.most_common()),
+            'messages_per_month': dict(sorted(self.messages_per_month.items())),
+            'messages_per_day': dict(sorted(self.messages_per_day.items())),
+            'messages_per_hour': {str(hour): self.messages_per_hour[hour] for hour in range(24)},
+            'busiest_hours': [hour for hour, _ in self.messages_per_hour.most_common(3)],
+            'attachments_per_type': {
+                file_type: {'count': count, 'bytes': self.attachment_bytes_per_type[file_type]}
+                for file_type, count in self.attachments_per_type.most_common()
+            },
         }
-        @media(width > 800px) {
-            .message.received {
-                float: left;
-                margin-right: 35%;
+
+    def write_json(self, path):
+        import json
+
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+
+    def write_html(self, path, chat_name=""):
+        """Write a small HTML summary page."""
+        escape = html_module.escape
+        stats = self.to_dict()
+
+        def table(title, header, rows):
+            body = ''.join(f"<tr><td>{escape(str(key))}</td><td>{value}</td></tr>" for key, value in rows)
+            return f"<h2>{title}</h2>\n<table><tr><th>{header}</th><th>Messages</th></tr>{body}</table>\n"
+
+        busiest_hours = [(f"{hour}:00", self.messages_per_hour[hour]) for hour in stats['busiest_hours']]
+        busiest_days = sorted(self.messages_per_day.items(), key=lambda item: (-item[1], item[0]))[:10]
+        attachment_rows = ''.join(
+            f"<tr><td>{escape(file_type)}</td><td>{info['count']}</td><td>{info['bytes']:,}</td></tr>"
+            for file_type, info in stats['attachments_per_type'].items()
+        )
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>{escape(chat_name)} - statistics</title>
+    <style>
+        body {{ font-family: Arial, sans-serif; max-width: 900px; margin: 0 auto; padding: 20px; }}
+        table {{ border-collapse: collapse; margin-bottom: 20px; }}
+        td, th {{ border-bottom: 1px solid #ddd; padding: 4px 12px; text-align: left; }}
+    </style>
+</head>
+<body>
+<h1>{escape(chat_name)}</h1>
+<p>{stats['messages']} messages from {stats['first_date'] or '-'} until {stats['last_date'] or '-'}</p>
+""")
+            f.write(table("Messages per sender", "Sender", stats['messages_per_sender'].items()))
+            f.write(table("Busiest hours", "Hour", busiest_hours))
+            f.write(table("Busiest days", "Day", busiest_days))
+            f.write(table("Messages per month", "Month", stats['messages_per_month'].items()))
+            f.write(f"<h2>Attachments</h2>\n<table><tr><th>Type</th><th>Files</th><th>Bytes</th></tr>{attachment_rows}</table>\n")
+            f.write("</body>\n</html>\n")
+
+
+# Local file header: signature, version, flags, method, time, date, crc, sizes, name/extra lengths
+_ZIP_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+_ZIP_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+def zip_stored_data_offset(archive, info):
+    """Return the archive offset of a stored (uncompressed, unencrypted) entry's data.
+
+    Returns None if the entry is compressed, encrypted, or its local header is unusable,
+    in which case it must be read through zipfile.
+    """
+    if info.compress_type != zipfile.ZIP_STORED or info.is_dir() or info.flag_bits & 0x1:
+        return None
+    if info.compress_size != info.file_size:
+        return None
+    archive.seek(info.header_offset)
+    header = archive.read(_ZIP_LOCAL_HEADER.size)
+    if len(header) != _ZIP_LOCAL_HEADER.size:
+        return None
+    fields = _ZIP_LOCAL_HEADER.unpack(header)
+    if fields[0] != _ZIP_LOCAL_HEADER_SIGNATURE:
+        return None
+    name_length, extra_length = fields[9], fields[10]
+    return info.header_offset + _ZIP_LOCAL_HEADER.size + name_length + extra_length
+
+
+class ZipIndex:
+    """The central directory of an export ZIP, read once and shared by all stages.
+
+    The ZipFile stays open, and its entries are classified in a single pass, so choosing
+    the chat file, reading it, embedding media and extracting attachments neither open
+    the archive again nor walk its entries again.
+    """
+
+    def __init__(self, zip_path):
+        self.zip_path = zip_path
+        self.zip_ref = zipfile.ZipFile(zip_path, 'r')
+        # name -> ZipInfo; for duplicate names the last entry wins, as in ZipFile.getinfo
+        self.entries = {info.filename: info for info in self.zip_ref.infolist()}
+        # the .txt entries, which are the candidates for the chat file
+        self.text_files = [name for name in self.entries if name[-4:].lower() == '.txt']
+        # name -> position in the archive, built when extraction first needs it
+        self._position = None
+
+    def archive_order(self, names):
+        """The names that are entries of the archive, in the order they are stored."""
+        if self._position is None:
+            self._position = {info.filename: position for position, info in enumerate(self.zip_ref.infolist())}
+        return sorted((name for name in names if name in self._position), key=self._position.__getitem__)
+
+    def close(self):
+        self.zip_ref.close()
+
+
+class ExportJournal:
+    """Append-only progress journal of an export, for continuing it after an interruption (--resume).
+
+    One JSON object per line: a 'start' entry with the options of the run, then 'checkpoint'
+    entries (message id and output file offsets a renderer has completely written),
+    'stage' entries for finished renderers and 'extracted' entries (name, size, CRC) for
+    attachments in the media folder. A line cut short by a kill is ignored when loading.
+    """
+
+    def __init__(self, path, run_info):
+        self.path = Path(path)
+        self.run_info = run_info
+        self.completed_stages = set()
+        # latest checkpoint entry per stage
+        self.checkpoints = {}
+        # attachment name -> (size, CRC or None)
+        self.extracted = {}
+        self._f = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read an existing journal. Returns False if there is none or it belongs to other options."""
+        import json
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return False
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+        if not entries or entries[0] != {'event': 'start', **self.run_info}:
+            return False
+        for entry in entries[1:]:
+            event = entry.get('event')
+            if event == 'checkpoint':
+                self.checkpoints[entry['stage']] = entry
+            elif event == 'stage':
+                self.completed_stages.add(entry['stage'])
+            elif event == 'extracted':
+                self.extracted[entry['name']] = (entry['size'], entry['crc'])
+        return True
+
+    def open(self, resume):
+        """Start appending; without resume, a new journal replaces any existing one."""
+        self._f = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        if not resume:
+            self._write({'event': 'start', **self.run_info}, sync=True)
+
+    def _write(self, entry, sync=False):
+        import json
+
+        with self._lock:
+            self._f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._f.flush()
+            if sync:
+                os.fsync(self._f.fileno())
+
+    def checkpoint(self, stage, message_id, offsets, state=None):
+        entry = {'event': 'checkpoint', 'stage': stage, 'message_id': message_id, 'offsets': offsets,
+                 'state': state or {}}
+        self.checkpoints[stage] = entry
+        self._write(entry, sync=True)
+
+    def complete_stage(self, stage):
+        self.completed_stages.add(stage)
+        self._write({'event': 'stage', 'stage': stage}, sync=True)
+
+    def is_extracted(self, name, size, crc, target_path):
+        """True if an earlier run extracted this attachment and the file is still complete."""
+        if self.extracted.get(name) != (size, crc):
+            return False
+        try:
+            return os.path.getsize(target_path) == size
+        except OSError:
+            return False
+
+    def extracted_file(self, name, size, crc=None):
+        self.extracted[name] = (size, crc)
+        self._write({'event': 'extracted', 'name': name, 'size': size, 'crc': crc})
+
+    def remove(self):
+        """Delete the journal once the export is complete."""
+        self.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+class RenderCheckpoints:
+    """The checkpoints of one renderer (stage) in an ExportJournal."""
+
+    def __init__(self, journal, stage):
+        self.journal = journal
+        self.stage = stage
+
+    def resume_point(self):
+        """The last checkpoint of an interrupted run, or None to render from the start."""
+        return self.journal.checkpoints.get(self.stage)
+
+    def save(self, message_id, files, state=None):
+        """Record that the output files (by name) are complete up to message_id."""
+        offsets = {}
+        for name, f in files.items():
+            f.flush()
+            offsets[name] = f.tell()
+        self.journal.checkpoint(self.stage, message_id, offsets, state)
+
+
+class MediaCache:
+    """Size-bounded on-disk cache of encoded embedded media, shared between exports (--media-cache).
+
+    Entries are keyed by the attachment name, its size and CRC-32 (modification time for
+    export folders) and the encoding options, so a changed file is never taken from the
+    cache. Each entry is a file with the encoding ('raw' or 'deflate') on the first line
+    and the base64 payload after it. Reading an entry marks it as recently used; when
+    the cache grows beyond max_bytes, the least recently used entries are deleted.
+    Entries are written to a temporary file and renamed, so several processes can share
+    a cache folder.
+    """
+
+    SUFFIX = '.payload'
+    DEFAULT_MAX_BYTES = 1024 ** 3
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        # entry path -> (size, last use), read from the folder on the first write
+        self._entries = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(*parts):
+        import hashlib
+
+        return hashlib.sha1('\0'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return self.directory / (key + self.SUFFIX)
+
+    def open(self, key):
+        """Return (encoding, file positioned at the base64 payload) for a cached entry, or None."""
+        path = self._path(key)
+        try:
+            f = open(path, 'r', encoding='ascii')
+        except OSError:
+            return None
+        encoding = f.readline().rstrip('\n')
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        return encoding, f
+
+    def put(self, key, encoding, encoded):
+        """Store an encoded payload and evict the least recently used entries beyond max_bytes."""
+        path = self._path(key)
+        data = f"{encoding}\n{encoded}"
+        if len(data) > self.max_bytes:
+            return
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, 'w', encoding='ascii') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write to the media cache: %s", e)
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            entries = self._scan()
+            entries[path] = (len(data), time.time())
+            self._evict(entries)
+
+    def _scan(self):
+        if self._entries is None:
+            self._entries = {}
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(self.SUFFIX):
+                    with contextlib.suppress(OSError):
+                        stat = entry.stat()
+                        self._entries[Path(entry.path)] = (stat.st_size, stat.st_mtime)
+        return self._entries
+
+    def _evict(self, entries):
+        total = sum(size for size, _ in entries.values())
+        if total <= self.max_bytes:
+            return
+        for path, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            del entries[path]
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+class MediaStore:
+    """Content-addressed folder of attachments shared by many exports (--media-store).
+
+    Every file is stored once as objects/ab/<sha256><ext>, however many chats contain
+    it, and the outputs link into the store. index.jsonl maps (size, CRC-32) to the
+    hashes already stored: an attachment without a match is copied into the store while
+    it is hashed, one with a match is only hashed to confirm it, and nothing is written.
+    Each export records the objects its output files link to in refs/, which gc() uses
+    to delete objects no remaining output links to. Several processes can add to a store
+    at the same time.
+    """
+
+    INDEX_FILE = 'index.jsonl'
+    # Objects younger than this are kept by gc(), since an export that is still running
+    # may link to them before its ref is written
+    GC_GRACE_SECONDS = 3600
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        for name in ('objects', 'refs', 'tmp'):
+            os.makedirs(self.directory / name, exist_ok=True)
+        # size -> [(CRC-32, sha256)], sha256 -> object path relative to the store
+        self._by_size = {}
+        self._objects = {}
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _load_index(self):
+        import json
+
+        try:
+            f = open(self.directory / self.INDEX_FILE, encoding='utf-8')
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # a line cut off by an interrupted write
+                    continue
+                self._index(entry)
+
+    def _index(self, entry):
+        if entry['sha256'] not in self._objects:
+            self._objects[entry['sha256']] = entry['object']
+            self._by_size.setdefault(entry['size'], []).append((entry['crc'], entry['sha256']))
+
+    def add(self, open_source, size, crc=None, ext=''):
+        """Store a file unless the store already has it, and return its object path.
+
+        open_source() opens the file for reading; crc is its CRC-32 if known in advance
+        (from the ZIP directory).
+        """
+        import hashlib
+
+        with self._lock:
+            candidates = {sha256 for entry_crc, sha256 in self._by_size.get(size, ())
+                          if crc is None or entry_crc == crc}
+        if candidates:
+            digest = hashlib.sha256()
+            with open_source() as source:
+                for block in iter(lambda: source.read(1024 * 1024), b''):
+                    digest.update(block)
+            sha256 = digest.hexdigest()
+            if sha256 in candidates:
+                object_path = self._objects[sha256]
+                if os.path.exists(self.directory / object_path):
+                    # protects it from a concurrent gc() until this export has written its ref
+                    with contextlib.suppress(OSError):
+                        os.utime(self.directory / object_path)
+                    return object_path
+        return self._write(open_source, ext)
+
+    def _write(self, open_source, ext):
+        import hashlib
+        import json
+
+        digest = hashlib.sha256()
+        crc = size = 0
+        # Not tempfile.mkstemp, which creates the file as 0600: objects get the usual mode
+        # (0666 minus the umask) like the files in media/, so that a shared store stays readable
+        tmp_path = self.directory / 'tmp' / f"{os.getpid()}-{os.urandom(8).hex()}"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            with open_source() as source, os.fdopen(fd, 'wb') as target:
+                for block in iter(lambda: source.read(1024 * 1024), b''):
+                    digest.update(block)
+                    crc = zlib.crc32(block, crc)
+                    size += len(block)
+                    target.write(block)
+            sha256 = digest.hexdigest()
+            object_path = f"objects/{sha256[:2]}/{sha256}{ext.lower()}"
+            target_path = self.directory / object_path
+            os.makedirs(target_path.parent, exist_ok=True)
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+        entry = {'sha256': sha256, 'size': size, 'crc': crc, 'object': object_path}
+        with self._lock:
+            if sha256 not in self._objects:
+                self._index(entry)
+                # one short line per append, so lines of concurrent writers don't interleave
+                with open(self.directory / self.INDEX_FILE, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry) + '\n')
+        return self._objects[sha256]
+
+    def add_zip_entry(self, zip_ref, info):
+        """Store an entry of an open ZipFile (zipfile checks its CRC while reading)."""
+        return self.add(lambda: zip_ref.open(info), info.file_size, info.CRC, os.path.splitext(info.filename)[1])
+
+    def add_file(self, path):
+        return self.add(lambda: open(path, 'rb'), os.path.getsize(path), ext=os.path.splitext(path)[1])
+
+    def write_ref(self, output_files, objects, source=None):
+        """Record the objects a set of output files links to, replacing an earlier record of the same files."""
+        import hashlib
+        import json
+
+        outputs = sorted(str(Path(path).absolute()) for path in output_files)
+        ref_id = hashlib.sha1('\0'.join(outputs).encode('utf-8')).hexdigest()
+        ref_path = self.directory / 'refs' / f"{ref_id}.json"
+        tmp_path = f"{ref_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'source': source, 'outputs': outputs, 'objects': sorted(objects), 'updated': time.time()},
+                      f, indent=1, ensure_ascii=False)
+        os.replace(tmp_path, ref_path)
+
+    def gc(self, grace_seconds=GC_GRACE_SECONDS, dry_run=False):
+        """Delete refs whose output files are all gone and objects no ref links to.
+
+        Returns (deleted refs, deleted objects, freed bytes).
+        """
+        import json
+
+        referenced = set()
+        dead_refs = []
+        for ref_path in (self.directory / 'refs').glob('*.json'):
+            try:
+                with open(ref_path, encoding='utf-8') as f:
+                    ref = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if any(os.path.exists(output) for output in ref['outputs']):
+                referenced.update(ref['objects'])
+            else:
+                dead_refs.append(ref_path)
+
+        cutoff = time.time() - grace_seconds
+        deleted_objects = freed = 0
+        for object_file in (self.directory / 'objects').glob('*/*'):
+            object_path = object_file.relative_to(self.directory).as_posix()
+            stat = object_file.stat()
+            if object_path in referenced or stat.st_mtime > cutoff:
+                continue
+            deleted_objects += 1
+            freed += stat.st_size
+            if not dry_run:
+                object_file.unlink()
+        for tmp_file in (self.directory / 'tmp').iterdir():
+            # left behind by interrupted exports
+            if tmp_file.stat().st_mtime <= cutoff and not dry_run:
+                tmp_file.unlink()
+        if not dry_run:
+            for ref_path in dead_refs:
+                ref_path.unlink()
+            self._rewrite_index()
+        return len(dead_refs), deleted_objects, freed
+
+    def _rewrite_index(self):
+        """Drop the index entries of deleted objects."""
+        import json
+
+        with self._lock:
+            self._by_size = {}
+            self._objects = {}
+            self._load_index()
+            entries = [{'sha256': sha256, 'size': size, 'crc': crc, 'object': self._objects[sha256]}
+                       for size, hashes in self._by_size.items() for crc, sha256 in hashes
+                       if os.path.exists(self.directory / self._objects[sha256])]
+            tmp_path = self.directory / f"{self.INDEX_FILE}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(entry) + '\n' for entry in entries)
+            os.replace(tmp_path, self.directory / self.INDEX_FILE)
+            self._by_size = {}
+            self._objects = {}
+            for entry in entries:
+                self._index(entry)
+
+
+class StoredMediaLinks:
+    """Links of one export into a MediaStore. Attachments are added to the store when a
+    renderer first links to them, since the link depends on their content."""
+
+    def __init__(self, store, default_source, zip_index=None):
+        self.store = store
+        self.default_source = default_source
+        # ZipIndex of default_source, if it is a ZIP
+        self.zip_index = zip_index
+        # attachment name -> ZIP file or export folder, for chats merged from several exports
+        self.sources = {}
+        # attachment name -> object path in the store
+        self.objects = {}
+        self._zip_files = {}
+        self._lock = threading.Lock()
+
+    def object_for(self, attachment_name):
+        with self._lock:
+            if attachment_name not in self.objects:
+                source = self.sources.get(attachment_name, self.default_source)
+                if os.path.isdir(source):
+                    object_path = self.store.add_file(os.path.join(source, *attachment_name.split('/')))
+                elif self.zip_index is not None and source == self.zip_index.zip_path:
+                    object_path = self.store.add_zip_entry(self.zip_index.zip_ref,
+                                                           self.zip_index.entries[attachment_name])
+                else:
+                    if source not in self._zip_files:
+                        self._zip_files[source] = zipfile.ZipFile(source, 'r')
+                    zip_ref = self._zip_files[source]
+                    object_path = self.store.add_zip_entry(zip_ref, zip_ref.getinfo(attachment_name))
+                self.objects[attachment_name] = object_path
+            return self.objects[attachment_name]
+
+    def url(self, attachment_name, output_dir):
+        """Relative link from output_dir to the stored attachment."""
+        target = self.store.directory / self.object_for(attachment_name)
+        relative = os.path.relpath(os.path.abspath(target), os.path.abspath(output_dir or '.'))
+        return relative.replace(os.path.sep, '/')
+
+    def close(self):
+        for zip_ref in self._zip_files.values():
+            zip_ref.close()
+        self._zip_files = {}
+
+
+class MediaExtractor:
+    """Extracts attachments from the ZIP into the media folder on a background thread.
+
+    Attachments are submitted as the renderer encounters them, so extraction (I/O bound)
+    overlaps with HTML rendering (CPU bound). The queue is bounded, which makes the
+    renderer wait if extraction falls too far behind.
+
+    Stored (uncompressed) entries are copied straight from the archive to the output
+    file with os.copy_file_range/os.sendfile on Linux. Everything else goes through
+    zipfile.
+    """
+
+    _STOP = object()
+    _COPY_CHUNK = 64 * 1024 * 1024
+
+    def __init__(self, zip_path, media_dir, queue_size=64, verify_crc=True, media_layout='flat', zip_index=None):
+        import queue
+
+        self.zip_path = zip_path
+        # ZipIndex of zip_path from reading the chat, or None to open the ZIP here
+        self.zip_index = zip_index
+        self.media_dir = media_dir
+        self.media_layout = media_layout
+        self.verify_crc = verify_crc
+        self.extracted = set()
+        # ExportJournal recording extracted attachments, set when the export can be resumed
+        self.journal = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._error = None
+        self._aborted = False
+        self._zero_copy = sys.platform.startswith('linux') and (
+            hasattr(os, 'copy_file_range') or hasattr(os, 'sendfile'))
+
+    def start(self):
+        """Start the background extraction thread."""
+        self._thread = threading.Thread(target=self._run, name="chat-export-extractor", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, attachment_name):
+        """Queue an attachment for extraction. Blocks while the queue is full."""
+        if self._error is not None:
+            raise self._error
+        self._queue.put(attachment_name)
+
+    def close(self, abort=False):
+        """Wait for all queued attachments to be extracted and re-raise any extraction error.
+
+        With abort=True, pending attachments are discarded and errors are not raised.
+        """
+        if self._thread is None:
+            return
+        if abort:
+            self._aborted = True
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+        if self._error is not None and not abort:
+            raise self._error
+
+    def extract_all(self, attachment_names):
+        """Extract the given attachments synchronously, in archive order."""
+        with self._open_source() as source:
+            for attachment_name in self._archive_order(source, attachment_names):
+                self._extract_name(source, attachment_name)
+
+    @contextlib.contextmanager
+    def _open_source(self):
+        """Open the export for reading, yielding whatever _extract_name needs."""
+        if self.zip_index is not None:
+            # the ZipFile is shared; the raw file for zero-copy needs a file position of its own
+            with open(self.zip_path, 'rb') as archive:
+                yield self.zip_index.zip_ref, archive
+            return
+        with zipfile.ZipFile(self.zip_path, 'r') as zip_ref, open(self.zip_path, 'rb') as archive:
+            yield zip_ref, archive
+
+    def _archive_order(self, source, attachment_names):
+        if self.zip_index is not None:
+            return self.zip_index.archive_order(attachment_names)
+        zip_ref, _ = source
+        return [info.filename for info in zip_ref.infolist() if info.filename in attachment_names]
+
+    def _extract_name(self, source, attachment_name):
+        zip_ref, archive = source
+        if self.zip_index is not None:
+            info = self.zip_index.entries[attachment_name]
+        else:
+            info = zip_ref.getinfo(attachment_name)
+        self.extract(zip_ref, archive, info)
+
+    def extract(self, zip_ref, archive, info):
+        """Extract a single entry into the media folder."""
+        if info.filename in self.extracted:
+            return
+        if self.journal is not None and self.journal.is_extracted(
+                info.filename, info.file_size, info.CRC, self._target_path(info.filename)):
+            self.extracted.add(info.filename)
+            return
+        if not (self._zero_copy and self._extract_stored(archive, info)):
+            if self.media_layout == 'flat':
+                zip_ref.extract(info, self.media_dir)
+            else:
+                self._extract_to_target(zip_ref, info)
+        self.extracted.add(info.filename)
+        if self.journal is not None:
+            self.journal.extracted_file(info.filename, info.file_size, info.CRC)
+
+    def _extract_to_target(self, zip_ref, info):
+        """Extract an entry through zipfile (which checks the CRC) to its path in the media layout."""
+        target_path = self._target_path(info.filename)
+        parent_dir = os.path.dirname(target_path)
+        if parent_dir:
+            os.makedirs(parent_dir, exist_ok=True)
+        with zip_ref.open(info) as source, open(target_path, 'wb') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+
+    def _target_path(self, filename):
+        """Output path for an entry in the media layout, sanitized the same way ZipFile.extract does it."""
+        arcname = media_relative_path(filename, self.media_layout).replace('/', os.path.sep)
+        if os.path.altsep:
+            arcname = arcname.replace(os.path.altsep, os.path.sep)
+        arcname = os.path.splitdrive(arcname)[1]
+        invalid_path_parts = ('', os.path.curdir, os.path.pardir)
+        arcname = os.path.sep.join(x for x in arcname.split(os.path.sep) if x not in invalid_path_parts)
+        return os.path.normpath(os.path.join(self.media_dir, arcname))
+
+    def _extract_stored(self, archive, info):
+        """Copy a stored entry's bytes from the archive to the output file without
+        passing them through Python. Returns False if the entry has to be extracted
+        through zipfile instead."""
+        data_offset = zip_stored_data_offset(archive, info)
+        if data_offset is None:
+            return False
+
+        target_path = self._target_path(info.filename)
+        parent_dir = os.path.dirname(target_path)
+        if parent_dir:
+            os.makedirs(parent_dir, exist_ok=True)
+        with open(target_path, 'wb') as target:
+            if not self._copy_range(archive.fileno(), target.fileno(), data_offset, info.file_size):
+                target.close()
+                os.remove(target_path)
+                return False
+        if self.verify_crc:
+            self._check_crc(target_path, info)
+        return True
+
+    def _copy_range(self, src_fd, dst_fd, offset, count):
+        """Copy count bytes starting at offset in src_fd to the start of dst_fd in the kernel."""
+        copied = 0
+        use_copy_file_range = hasattr(os, 'copy_file_range')
+        while copied < count:
+            chunk = min(self._COPY_CHUNK, count - copied)
+            try:
+                if use_copy_file_range:
+                    n = os.copy_file_range(src_fd, dst_fd, chunk, offset + copied)
+                else:
+                    n = os.sendfile(dst_fd, src_fd, offset + copied, chunk)
+            except OSError:
+                # e.g. EXDEV/ENOSYS on older kernels: try sendfile, then give up
+                if use_copy_file_range and hasattr(os, 'sendfile'):
+                    use_copy_file_range = False
+                    continue
+                return False
+            if n == 0:
+                return False
+            copied += n
+        return True
+
+    @staticmethod
+    def _check_crc(path, info):
+        crc = 0
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(1024 * 1024)
+                if not block:
+                    break
+                crc = zlib.crc32(block, crc)
+        if crc != info.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {info.filename!r}")
+
+    def _run(self):
+        try:
+            with self._open_source() as source:
+                while True:
+                    attachment_name = self._queue.get()
+                    if attachment_name is self._STOP:
+                        return
+                    if self._error is not None or self._aborted:
+                        continue
+                    try:
+                        self._extract_name(source, attachment_name)
+                    except Exception as e:
+                        self._error = e
+        except Exception as e:
+            self._error = e
+            # keep draining so submit() never blocks on a dead worker
+            while self._queue.get() is not self._STOP:
+                pass
+
+
+class DirectoryMediaExtractor(MediaExtractor):
+    """Places attachments of an already extracted export folder into the media folder.
+
+    Files are reflinked (copy-on-write clone) or hardlinked where the filesystem allows
+    it and copied otherwise.
+    """
+
+    # ioctl request number of FICLONE on Linux
+    _FICLONE = 0x40049409
+
+    def __init__(self, source_dir, media_dir, queue_size=64, media_layout='flat'):
+        super().__init__(source_dir, media_dir, queue_size=queue_size, verify_crc=False, media_layout=media_layout)
+        self.source_dir = source_dir
+
+    @contextlib.contextmanager
+    def _open_source(self):
+        yield self.source_dir
+
+    def _archive_order(self, source, attachment_names):
+        return sorted(attachment_names)
+
+    def _extract_name(self, source, attachment_name):
+        if attachment_name in self.extracted:
+            return
+        source_path = os.path.join(source, *attachment_name.split('/'))
+        target_path = self._target_path(attachment_name)
+        size = os.path.getsize(source_path) if self.journal is not None else None
+        if self.journal is not None and self.journal.is_extracted(attachment_name, size, None, target_path):
+            self.extracted.add(attachment_name)
+            return
+        parent_dir = os.path.dirname(target_path)
+        if parent_dir:
+            os.makedirs(parent_dir, exist_ok=True)
+        if os.path.lexists(target_path):
+            os.remove(target_path)
+        if not (self._reflink(source_path, target_path) or self._hardlink(source_path, target_path)):
+            shutil.copyfile(source_path, target_path)
+        self.extracted.add(attachment_name)
+        if self.journal is not None:
+            self.journal.extracted_file(attachment_name, size)
+
+    def _reflink(self, source_path, target_path):
+        if not sys.platform.startswith('linux'):
+            return False
+        import fcntl
+
+        try:
+            with open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+                fcntl.ioctl(target.fileno(), self._FICLONE, source.fileno())
+            return True
+        except OSError:
+            if os.path.lexists(target_path):
+                os.remove(target_path)
+            return False
+
+    @staticmethod
+    def _hardlink(source_path, target_path):
+        try:
+            os.link(source_path, target_path)
+            return True
+        except (OSError, NotImplementedError):
+            return False
+
+
+class MultiSourceMediaExtractor:
+    """Routes attachments to one extractor per export, for chats merged from several exports."""
+
+    def __init__(self, extractors, attachment_sources, default_source):
+        self.extractors = extractors
+        self.attachment_sources = attachment_sources
+        self.default_source = default_source
+
+    def _extractor_for(self, attachment_name):
+        return self.extractors[self.attachment_sources.get(attachment_name, self.default_source)]
+
+    def start(self):
+        for extractor in self.extractors.values():
+            extractor.start()
+        return self
+
+    def submit(self, attachment_name):
+        self._extractor_for(attachment_name).submit(attachment_name)
+
+    def close(self, abort=False):
+        """Close all extractors, then re-raise the first extraction error."""
+        first_error = None
+        for extractor in self.extractors.values():
+            try:
+                extractor.close(abort=abort)
+            except Exception as e:
+                first_error = first_error or e
+        if first_error is not None:
+            raise first_error
+
+    def extract_all(self, attachment_names):
+        by_source = {}
+        for attachment_name in attachment_names:
+            by_source.setdefault(self.attachment_sources.get(attachment_name, self.default_source), set()).add(attachment_name)
+        for source, names in by_source.items():
+            self.extractors[source].extract_all(names)
+
+
+class CompressedBlockWriter:
+    """Text stream that collects HTML markup and writes it to the underlying file as
+    deflate-compressed, base64-encoded blocks. The loader script of the page inflates
+    them in the browser with DecompressionStream."""
+
+    BLOCK_SIZE = 256 * 1024
+
+    def __init__(self, f, block_size=BLOCK_SIZE):
+        self.f = f
+        self.block_size = block_size
+        self._parts = []
+        self._size = 0
+
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+
+    def end_message(self):
+        """Called after each message; blocks only ever end between messages.
+        Returns True if a block was written."""
+        if self._size >= self.block_size:
+            self.flush_block()
+            return True
+        return False
+
+    def flush_block(self):
+        import base64
+
+        if not self._parts:
+            return
+        data = ''.join(self._parts).encode('utf-8')
+        self._parts = []
+        self._size = 0
+        encoded = base64.b64encode(zlib.compress(data, 9)).decode('ascii')
+        self.f.write(f'\n<script type="application/x-deflate" class="ce-block">{encoded}</script>')
+
+
+class HTMLRenderer(Renderer):
+    """Renders messages to HTML format."""
+
+    FILENAME_ATTRIBUTES = ('html_filename', 'html_filename_media_linked')
+
+    # Media types that are already compressed and are not worth deflating again
+    INCOMPRESSIBLE_MIME_PREFIXES = ('image/', 'video/', 'audio/', 'application/zip', 'application/gzip',
+                                    'application/x-rar', 'application/x-7z')
+    # Stylesheet shared by the compact HTML files of an output folder
+    STYLESHEET_FILENAME = 'chat-export.css'
+    # Short classes of own, received and WhatsApp messages in compact mode
+    COMPACT_MESSAGE_CLASSES = {'sent': 'o', 'received': 'r', 'whatsapp': 'w'}
+
+    def __init__(self, output_dir, has_media=False, embed_media=False, zip_path=None, media_path="./media", export_name=None,
+                 compress_payload=False, embed_max_size=None, embed_budget=None, attachment_size=None, media_layout='flat',
+                 media_cache=None, compact=False, zip_index=None):
+        super().__init__(output_dir)
+        # ZipIndex of zip_path, whose open ZipFile is used to read embedded media
+        self.zip_index = zip_index
+        # Short per-sender classes instead of inline styles and wrapper elements (--compact)
+        self.compact = compact
+        # sender -> class with the sender's background color, in compact mode
+        self._sender_classes = {}
+        self.has_media = has_media
+        self.embed_media = embed_media
+        # Limits for embedding; attachments that don't fit are linked to the media folder instead
+        self.embed_max_size = embed_max_size
+        self.embed_budget = embed_budget
+        # callable returning the size in bytes of an attachment
+        self.attachment_size = attachment_size or (lambda name: 0)
+        # Names of the attachments to embed, None for all (see plan_embedding)
+        self.embedded_attachments = None
+        # Store message markup and compressible attachments deflate-compressed (embed mode only)
+        self.compress_payload = compress_payload and embed_media
+        self._payload_f = None
+        self._payload_count = 0
+        # MediaCache of encoded payloads from earlier exports, or None
+        self.media_cache = media_cache
+        # ZipFiles opened for reading media while rendering, by path
+        self._zip_files = {}
+        self.zip_path = zip_path
+        self.media_path = media_path
+        self.media_layout = media_layout
+        self.html_filename = 'chat.html'
+        self.html_filename_media_linked = 'chat_media_linked.html'
+        if embed_media:
+            # replace .zip with .html
+            self.html_filename = (export_name or export_stem(self.zip_path)) + '.html'
+            self.html_filename_media_linked = None
+        # a single embedded file stays self-contained and keeps its styles inline
+        self.stylesheet_filename = self.STYLESHEET_FILENAME if compact and not embed_media else None
+        embed_limited = embed_max_size is not None or embed_budget is not None
+        self.uses_media_files = has_media and (not embed_media or embed_limited)
+
+    def get_generated_files(self) -> list[Path]:
+        """Get the generated files."""
+        result = [Path(self.output_dir, self.html_filename)]
+        if self.html_filename_media_linked:
+            result.append(Path(self.output_dir, self.html_filename_media_linked))
+        if self.stylesheet_filename:
+            result.append(Path(self.output_dir, self.stylesheet_filename))
+        return result
+
+    def get_compact_css_styles(self):
+        """CSS of the compact markup: .m is a message (o: own, r: received, w: WhatsApp),
+        b its sender and i its timestamp. Sender colors come from get_sender_css()."""
+        return """body{font-family:Arial,sans-serif;max-width:900px;margin:0 auto;padding:20px;background-color:#e5ddd5}
+.m{margin:10px 0;padding:10px;border-radius:7.5px;max-width:65%;clear:both;background-color:#fff;word-wrap:break-word}
+.m.o{float:right;margin-left:35%}
+.m.w{max-width:100%}
+.m>b{color:#1f7aad;font-size:.85em;display:block;margin-bottom:5px}
+.m>i{color:#667781;font-size:.75em;font-style:normal;display:block;text-align:right;margin-top:5px}
+.media{max-width:100%;border-radius:5px;margin:5px 0}
+.text-file{border:1px solid #ddd;border-radius:5px;padding:10px;background-color:#f9f9f9;margin:5px 0}
+.text-file h4{margin:0 0 10px 0;color:#333;font-size:.9em}
+.text-content{background-color:#fff;border:1px solid #e0e0e0;border-radius:3px;padding:10px;font-family:'Courier New',monospace;font-size:.8em;max-height:300px;overflow-y:auto;white-space:pre-wrap;word-wrap:break-word}
+a{color:#039be5;text-decoration:none}
+a:hover{text-decoration:underline}
+@media(width > 800px){.m.r{float:left;margin-right:35%}}
+@media print{body{background-color:#fff}}
+"""
+
+    def get_sender_css(self):
+        """Background color rules of the per-sender classes of the current chat."""
+        colors = self.chat.sender_color_map
+        return ''.join(f".{css_class}{{background-color:{colors[sender]}}}"
+                       for sender, css_class in self._sender_classes.items())
+
+    def _write_stylesheet(self):
+        """Write the shared stylesheet, unless the folder already has an identical one."""
+        path = os.path.join(self.output_dir, self.stylesheet_filename)
+        css = self.get_compact_css_styles()
+        with contextlib.suppress(OSError):
+            with open(path, encoding='utf-8') as f:
+                if f.read() == css:
+                    return
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(css)
+
+    def get_css_styles(self):
+        """Return the CSS styles for the HTML output."""
+        return """body {
+            font-family: Arial, sans-serif;
+            max-width: 900px;
+            margin: 0 auto;
+            padding: 20px;
+            background-color: #e5ddd5;
+        }
+        .message {
+            margin: 10px 0;
+            padding: 10px;
+            border-radius: 7.5px;
+            max-width: 65%;
+            position: relative;
+            clear: both;
+        }
+        .message.sent {
+            float: right;
+            margin-left: 35%;
+        }
+        .message.whatsapp {
+            max-width: 100%
+        }
+        .media {
+            max-width: 100%;
+            border-radius: 5px;
+            margin: 5px 0;
+        }
+        .text-file {
+            border: 1px solid #ddd;
+            border-radius: 5px;
+            padding: 10px;
+            background-color: #f9f9f9;
+            margin: 5px 0;
+        }
+        .text-file h4 {
+            margin: 0 0 10px 0;
+            color: #333;
+            font-size: 0.9em;
+        }
+        .text-content {
+            background-color: #fff;
+            border: 1px solid #e0e0e0;
+            border-radius: 3px;
+            padding: 10px;
+            font-family: 'Courier New', monospace;
+            font-size: 0.8em;
+            max-height: 300px;
+            overflow-y: auto;
+            white-space: pre-wrap;
+            word-wrap: break-word;
+        }
+        .timestamp {
+            color: #667781;
+            font-size: 0.75em;
+            float: right;
+            margin-left: 10px;
+            margin-top: 5px;
+        }
+        .sender {
+            color: #1f7aad;
+            font-size: 0.85em;
+            font-weight: bold;
+            display: block;
+            margin-bottom: 5px;
+        }
+        .content {
+            word-wrap: break-word;
+        }
+        .clearfix::after {
+            content: "";
+            clear: both;
+            display: table;
+        }
+        a {
+            color: #039be5;
+            text-decoration: none;
+        }
+        a:hover {
+            text-decoration: underline;
+        }
+        @media(width > 800px) {
+            .message.received {
+                float: left;
+                margin-right: 35%;
             }
         }
         @media print {
@@ -803,6 +2502,22 @@ class HTMLRenderer(Renderer):
     def get_html_header(self):
         """Generate the HTML header."""
         safe_name = html_module.escape(self.chat.name)
+        if self.compact:
+            if self.stylesheet_filename:
+                styles = f'<link rel="stylesheet" href="{self.stylesheet_filename}">\n<style>{self.get_sender_css()}</style>'
+            else:
+                styles = f'<style>\n{self.get_compact_css_styles()}{self.get_sender_css()}\n</style>'
+            return f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>{safe_name}</title>
+{styles}
+</head>
+<body>
+<div class="chat-container">
+<h1>{safe_name}</h1>"""
         return f"""<!DOCTYPE html>
 <html>
 <head>
@@ -817,6 +2532,127 @@ class HTMLRenderer(Renderer):
 <div class="chat-container">
 <h1>{safe_name}</h1>"""
 
+    def get_payload_loader(self):
+        """Script that inflates compressed message blocks and resolves embedded media payloads.
+
+        Media payloads are decoded when their element comes near the viewport and documents
+        when they are opened. Decoding is asynchronous and browsers lay out the print view
+        right after 'beforeprint', so a "Print" button (and Ctrl+P) first decodes all
+        remaining media, waits until the images are ready and only then opens the dialog.
+        """
+        if self.compress_payload:
+            noscript = "This chat export is stored compressed. Please enable JavaScript to display the messages."
+        else:
+            noscript = "Please enable JavaScript to display the embedded media."
+        return f"""
+<noscript><p>{noscript}</p></noscript>
+<script>
+(async function () {{
+    async function decode(base64, encoding) {{
+        const response = await fetch('data:application/octet-stream;base64,' + base64.trim());
+        if (encoding !== 'deflate') {{
+            return response.blob();
+        }}
+        return new Response(response.body.pipeThrough(new DecompressionStream('deflate'))).blob();
+    }}
+    async function resolvePayload(element) {{
+        const payload = document.getElementById(element.dataset.payload);
+        element.removeAttribute('data-payload');
+        if (!payload) {{
+            return;
+        }}
+        const data = await decode(payload.textContent, payload.dataset.encoding);
+        const url = URL.createObjectURL(new Blob([data], {{type: payload.dataset.mime}}));
+        if (element.tagName === 'A') {{
+            element.href = url;
+        }} else {{
+            element.src = url;
+        }}
+    }}
+    // decodes that have been started, so that printing can wait for all of them
+    const hydrating = [];
+    function hydrate(element) {{
+        const promise = resolvePayload(element);
+        hydrating.push(promise);
+        return promise;
+    }}
+    for (const block of Array.from(document.querySelectorAll('script.ce-block'))) {{
+        const html = await (await decode(block.textContent, 'deflate')).text();
+        block.insertAdjacentHTML('beforebegin', html);
+        block.remove();
+    }}
+    const observer = 'IntersectionObserver' in window ? new IntersectionObserver(function (entries) {{
+        entries.forEach(function (entry) {{
+            if (entry.isIntersecting) {{
+                observer.unobserve(entry.target);
+                hydrate(entry.target);
+            }}
+        }});
+    }}, {{rootMargin: '1000px 0px'}}) : null;
+    document.querySelectorAll('[data-payload]').forEach(function (element) {{
+        if (element.tagName !== 'A') {{
+            if (observer) {{
+                observer.observe(element);
+            }} else {{
+                hydrate(element);
+            }}
+            return;
+        }}
+        // documents are only decoded when they are opened
+        element.addEventListener('click', async function (event) {{
+            if (element.dataset.payload) {{
+                event.preventDefault();
+                await hydrate(element);
+                element.click();
+            }}
+        }});
+    }});
+    const media = 'img[data-payload], video[data-payload], audio[data-payload]';
+    function hydrateMedia() {{
+        document.querySelectorAll(media).forEach(function (element) {{
+            if (observer) {{
+                observer.unobserve(element);
+            }}
+            hydrate(element);
+        }});
+        document.querySelectorAll('img[loading="lazy"]').forEach(function (element) {{
+            element.loading = 'eager';
+        }});
+    }}
+    async function printWhenReady() {{
+        button.disabled = true;
+        button.textContent = 'Preparing to print...';
+        hydrateMedia();
+        await Promise.allSettled(hydrating);
+        await Promise.allSettled(Array.from(document.images).map(function (image) {{
+            return image.decode();
+        }}));
+        button.disabled = false;
+        button.textContent = 'Print';
+        window.print();
+    }}
+    const button = document.createElement('button');
+    if (document.querySelector(media)) {{
+        button.textContent = 'Print';
+        button.className = 'ce-print';
+        button.style.cssText = 'position:fixed;top:10px;right:10px;z-index:1';
+        button.addEventListener('click', printWhenReady);
+        const style = document.createElement('style');
+        style.textContent = '@media print{{.ce-print{{display:none}}}}';
+        document.head.appendChild(style);
+        document.body.appendChild(button);
+        window.addEventListener('keydown', function (event) {{
+            if ((event.ctrlKey || event.metaKey) && event.key === 'p' && !button.disabled) {{
+                event.preventDefault();
+                printWhenReady();
+            }}
+        }});
+    }}
+    // printing from the browser menu can't be delayed; decode what is left for a second attempt
+    window.addEventListener('beforeprint', hydrateMedia);
+}})();
+</script>"""
+
     def get_html_footer(self):
         """Generate the HTML footer."""
         return """
@@ -888,67 +2724,175 @@ class HTMLRenderer(Renderer):
         else:
             return 'application/octet-stream'
 
-    def encode_media_to_base64(self, attachment_name):
-        """Read media file from zip and encode to base64."""
+    def _media_source(self, attachment_name):
+        """ZIP file or export folder that contains an attachment."""
+        chat = getattr(self, 'chat', None)
+        if chat is not None and attachment_name in chat.attachment_sources:
+            return chat.attachment_sources[attachment_name]
+        return self.zip_path
+
+    def plan_embedding(self, chat):
+        """Decide which attachments of the chat are embedded when embedding is limited.
+
+        Attachments larger than embed_max_size are never embedded. Of the others, the
+        smallest ones are embedded first until embed_budget is used up, which embeds as
+        many attachments as possible.
+        """
+        if not self.embed_media or (self.embed_max_size is None and self.embed_budget is None):
+            self.embedded_attachments = None
+            return
+        names = {message.attachment_name for message in chat.messages if message.has_attachment}
+        remaining_budget = self.embed_budget
+        self.embedded_attachments = set()
+        for size, name in sorted((self.attachment_size(name), name) for name in names):
+            if self.embed_max_size is not None and size > self.embed_max_size:
+                break
+            if remaining_budget is not None:
+                if size > remaining_budget:
+                    break
+                remaining_budget -= size
+            self.embedded_attachments.add(name)
+        logger.info("Embedding %d of %d attachments, linking the others", len(self.embedded_attachments), len(names))
+
+    def is_embedded(self, attachment_name):
+        """True if an attachment is embedded into the HTML instead of linked to a file."""
+        return self.embed_media and (self.embedded_attachments is None or attachment_name in self.embedded_attachments)
+
+    def note_attachment(self, attachment_name):
+        if not self.is_embedded(attachment_name):
+            super().note_attachment(attachment_name)
+
+    def media_url(self, attachment_name):
+        if self.is_embedded(attachment_name):
+            # only used by the discarded media-linked document of embed mode, nothing to store
+            return f"{self.media_path}/{media_relative_path(attachment_name, self.media_layout)}"
+        return super().media_url(attachment_name)
+
+    def replay_attachments(self, chat, until_id=None):
+        if until_id is None:
+            self.plan_embedding(chat)
+        return super().replay_attachments(chat, until_id)
+
+    def _zip_file(self, source):
+        """The ZipFile of source, opened once per rendering instead of once per attachment."""
+        if self.zip_index is not None and source == self.zip_index.zip_path:
+            return self.zip_index.zip_ref
+        if source not in self._zip_files:
+            self._zip_files[source] = zipfile.ZipFile(source, 'r')
+        return self._zip_files[source]
+
+    def _close_zip_files(self):
+        for zip_ref in self._zip_files.values():
+            zip_ref.close()
+        self._zip_files = {}
+
+    def read_media(self, attachment_name):
+        """Read a media file from the zip (or extracted export folder)."""
+        source = self._media_source(attachment_name)
+        if os.path.isdir(source):
+            with open(os.path.join(source, *attachment_name.split('/')), 'rb') as media_file:
+                return media_file.read()
+        with self._zip_file(source).open(attachment_name) as media_file:
+            return media_file.read()
+
+    def media_fingerprint(self, attachment_name):
+        """(size, CRC-32) of a ZIP entry, or (size, modification time) of a file in an export folder."""
+        source = self._media_source(attachment_name)
+        if os.path.isdir(source):
+            stat = os.stat(os.path.join(source, *attachment_name.split('/')))
+            return stat.st_size, stat.st_mtime_ns
+        info = self._zip_file(source).getinfo(attachment_name)
+        return info.file_size, info.CRC
+
+    def write_media_payload(self, attachment_name):
+        """Write a media file as an inert base64 payload block, in compressed mode deflated if
+        that makes it noticeably smaller. Returns the payload id, or None if the file can't be read."""
+        import base64
+
+        mime_type = self.get_mime_type(attachment_name)
+        try_deflate = self.compress_payload and not mime_type.startswith(self.INCOMPRESSIBLE_MIME_PREFIXES)
+        cache_key = None
         try:
-            with zipfile.ZipFile(self.zip_path, 'r') as zip_ref:
-                with zip_ref.open(attachment_name) as media_file:
-                    media_data = media_file.read()
-                    base64_data = base64.b64encode(media_data).decode('utf-8')
-                    mime_type = self.get_mime_type(attachment_name)
-                    return f"data:{mime_type};base64,{base64_data}"
+            if self.media_cache is not None:
+                cache_key = MediaCache.key(attachment_name, *self.media_fingerprint(attachment_name),
+                                           'deflate' if try_deflate else 'raw')
+                cached = self.media_cache.open(cache_key)
+                if cached is not None:
+                    encoding, cached_f = cached
+                    with cached_f:
+                        payload_id = self._start_payload(mime_type, encoding)
+                        # copied in large blocks, without decoding or encoding anything
+                        shutil.copyfileobj(cached_f, self._payload_f, 1024 * 1024)
+                        self._payload_f.write('</script>')
+                    return payload_id
+            media_data = self.read_media(attachment_name)
         except Exception as e:
-            print(f"Warning: Could not encode {attachment_name} to base64: {e}")
+            logger.warning("Could not embed %s: %s", attachment_name, e)
             return None
+        encoding = 'raw'
+        if try_deflate:
+            compressed = zlib.compress(media_data, 9)
+            if len(compressed) < len(media_data) * 0.9:
+                media_data, encoding = compressed, 'deflate'
+        encoded = base64.b64encode(media_data).decode('ascii')
+        payload_id = self._start_payload(mime_type, encoding)
+        self._payload_f.write(f'{encoded}</script>')
+        if cache_key is not None:
+            self.media_cache.put(cache_key, encoding, encoded)
+        return payload_id
+
+    def _start_payload(self, mime_type, encoding):
+        """Write the opening tag of the next payload block and return its id."""
+        self._payload_count += 1
+        payload_id = f"ce-p{self._payload_count}"
+        self._payload_f.write(
+            f'\n<script type="application/octet-stream" id="{payload_id}" data-mime="{mime_type}" '
+            f'data-encoding="{encoding}">'
+        )
+        return payload_id
 
     def render_media_element(self, attachment_name, is_media_linked=False):
-        """Render a media element based on its file extension."""
-        media_path = f"{self.media_path}/{attachment_name}"
+        """Render a media element based on its file extension.
 
+        Media is only loaded when it gets near the viewport: images are lazy-loaded and
+        videos/audio don't preload. Embedded media refers to an inert payload block that
+        the loader script turns into a blob URL at that point.
+        """
         if is_media_linked:
+            media_path = self.media_url(attachment_name)
             # Always show as link in media-linked version
             return f'<a href="{media_path}">📎 {attachment_name}</a><br>'
 
         # Render media inline in main version
         ext = attachment_name.lower()
-        
-        # If embed_media is enabled, try to encode as base64
-        if self.embed_media and self.zip_path:
-            base64_data = self.encode_media_to_base64(attachment_name)
-            if base64_data:
-                # Images
+
+        # Embedded media goes into a payload block (in compressed mode outside the compressed markup)
+        if self._payload_f is not None and self.is_embedded(attachment_name):
+            payload_id = self.write_media_payload(attachment_name)
+            if payload_id:
                 if ext.endswith(('.jpg', '.jpeg', '.png', '.webp', '.gif')):
-                    return f'<img class="media" src="{base64_data}"><br>'
-                # Videos
+                    return f'<img class="media" data-payload="{payload_id}"><br>'
                 elif ext.endswith('.mp4'):
-                    return f'<video class="media" controls><source src="{base64_data}" type="video/mp4"></video><br>'
-                # Audio files
-                elif ext.endswith('.opus'):
-                    return f'<audio class="media" controls><source src="{base64_data}" type="audio/ogg"></audio><br>'
-                elif ext.endswith('.wav'):
-                    return f'<audio class="media" controls><source src="{base64_data}" type="audio/wav"></audio><br>'
-                elif ext.endswith('.mp3'):
-                    return f'<audio class="media" controls><source src="{base64_data}" type="audio/mpeg"></audio><br>'
-                elif ext.endswith('.m4a'):
-                    return f'<audio class="media" controls><source src="{base64_data}" type="audio/mp4"></audio><br>'
-                
-                # Other documents - provide download link with base64 data
+                    return f'<video class="media" controls preload="none" data-payload="{payload_id}"></video><br>'
+                elif ext.endswith(('.opus', '.wav', '.mp3', '.m4a')):
+                    return f'<audio class="media" controls preload="none" data-payload="{payload_id}"></audio><br>'
                 else:
-                    return f'<a href="{base64_data}" download="{attachment_name}">📎 {attachment_name}</a><br>'
-        
+                    return f'<a href="#" data-payload="{payload_id}" download="{attachment_name}">📎 {attachment_name}</a><br>'
+
         # Fallback to file references
+        media_path = self.media_url(attachment_name)
         if ext.endswith(('.jpg', '.jpeg', '.png', '.webp', '.gif')):
-            return f'<img class="media" src="{media_path}"><br>'
+            return f'<img class="media" loading="lazy" src="{media_path}"><br>'
         elif ext.endswith('.mp4'):
-            return f'<video class="media" controls><source src="{media_path}" type="video/mp4"></video><br>'
+            return f'<video class="media" controls preload="none"><source src="{media_path}" type="video/mp4"></video><br>'
         elif ext.endswith('.opus'):
-            return f'<audio class="media" controls><source src="{media_path}" type="audio/ogg"></audio><br>'
+            return f'<audio class="media" controls preload="none"><source src="{media_path}" type="audio/ogg"></audio><br>'
         elif ext.endswith('.wav'):
-            return f'<audio class="media" controls><source src="{media_path}" type="audio/wav"></source></audio><br>'
+            return f'<audio class="media" controls preload="none"><source src="{media_path}" type="audio/wav"></source></audio><br>'
         elif ext.endswith('.mp3'):
-            return f'<audio class="media" controls><source src="{media_path}" type="audio/mpeg"></audio><br>'
+            return f'<audio class="media" controls preload="none"><source src="{media_path}" type="audio/mpeg"></audio><br>'
         elif ext.endswith('.m4a'):
-            return f'<audio class="media" controls><source src="{media_path}" type="audio/mp4"></audio><br>'
+            return f'<audio class="media" controls preload="none"><source src="{media_path}" type="audio/mp4"></audio><br>'
         else:
             return f'<a href="{media_path}">📎 {attachment_name}</a><br>'
 
@@ -960,55 +2904,140 @@ class HTMLRenderer(Renderer):
         message_class = "sent" if is_own_message else "received"
         if is_wa_message:
             message_class = 'whatsapp'
-        bg_color = sender_color_map.get(message.sender, '#ffffff')
-
-        # Common message structure
-        message_start = f'\n<div class="message {message_class} clearfix" data-id="{message.id}" style="background-color: {bg_color};">'
-        sender_div = f'<div class="sender">{html_module.escape(message.sender)}</div>'
-        content_start = '<div class="content">'
-        content_end = '</div>'
-        timestamp_span = f'<span class="timestamp">{message.formatted_timestamp} (#{message.id})</span>'
-
-        message_end = '</div>'
-
-        # Write message start to both files
-        main_f.write(message_start)
-        media_f.write(message_start)
-
-        # Write sender to both files
-        main_f.write(sender_div)
-        media_f.write(sender_div)
-
-        # Write content start to both files
-        main_f.write(content_start)
-        media_f.write(content_start)
+        # Common message structure; only the start depends on the perspective
+        if self.compact:
+            sender_class = self._sender_classes.get(message.sender)
+            message_start = (f'\n<div class="m {self.COMPACT_MESSAGE_CLASSES[message_class]}'
+                             f'{" " + sender_class if sender_class else ""}">')
+        else:
+            bg_color = sender_color_map.get(message.sender, '#ffffff')
+            message_start = f'\n<div class="message {message_class} clearfix" data-id="{message.id}" style="background-color: {bg_color};">'
+        fragment = self.fragments.get(message.id) if self.fragments is not None else None
+        if fragment is None:
+            fragment = (self.render_compact_message_fragment(message) if self.compact
+                        else self.render_message_fragment(message))
+            if self.fragments is not None:
+                self.fragments.put(message.id, fragment, len(fragment[0]) + len(fragment[1]))
+        before_media, after_media = fragment
+
+        # Write message start, sender and content start to both files
+        main_f.write(message_start + before_media)
+        media_f.write(message_start + before_media)
 
         # Check if the message contains media
         if message.has_attachment:
             attachment_name = message.attachment_name
-            self.attachments_to_extract.add(attachment_name)
+            self.note_attachment(attachment_name)
 
             # Render media differently for each file
             main_f.write(self.render_media_element(attachment_name, is_media_linked=False))
             media_f.write(self.render_media_element(attachment_name, is_media_linked=True))
 
-        # Add the message content to both files
-        cleaned_content = message.cleaned_content
-        if cleaned_content:
-            main_f.write(f'{cleaned_content}')
-            media_f.write(f'{cleaned_content}')
+        # Write the message content, content end, timestamp and message end to both files
+        main_f.write(after_media)
+        media_f.write(after_media)
 
-        # Write content end, timestamp, and message end to both files
-        main_f.write(content_end)
-        media_f.write(content_end)
-        main_f.write(timestamp_span)
-        media_f.write(timestamp_span)
-        main_f.write(message_end)
-        media_f.write(message_end)
+    @staticmethod
+    def render_message_fragment(message):
+        """The markup of a message before and after its media element, which is the same
+        from every perspective."""
+        sender_div = f'<div class="sender">{html_module.escape(message.sender)}</div>'
+        content_start = '<div class="content">'
+        content_end = '</div>'
+        timestamp_span = f'<span class="timestamp">{message.formatted_timestamp} (#{message.id})</span>'
+        message_end = '</div>'
+        return sender_div + content_start, message.cleaned_content + content_end + timestamp_span + message_end
+
+    @staticmethod
+    def render_compact_message_fragment(message):
+        """render_message_fragment() for compact mode: the content needs no wrapper, since it
+        never contains markup of its own other than links, line breaks and media."""
+        return (f'<b>{html_module.escape(message.sender)}</b>',
+                f'{message.cleaned_content}<i>{message.formatted_timestamp} (#{message.id})</i></div>')
+
+    def write_document(self, chat, main_f, media_f, resume=None, checkpoint=None):
+        """Write the complete main and media-linked HTML documents to two text streams.
+
+        With resume (a journal checkpoint), the streams already contain everything up to the
+        checkpoint's message and writing continues after it. checkpoint is called with a
+        message id whenever the output up to and including that message is complete.
+        """
+        self.chat = chat
+        self.plan_embedding(chat)
+        # 'white' (#ffffff) is the default background of .m and needs no class
+        self._sender_classes = {sender: f"s{i}" for i, sender in enumerate(chat.sender_color_map)
+                                if chat.sender_color_map[sender] != '#ffffff'}
+        if resume is not None:
+            self._payload_count = resume['state'].get('payload_count', 0)
+            self.replay_attachments(chat, resume['message_id'])
+            self._write_messages(chat, main_f, media_f, resume['message_id'], checkpoint)
+            return
+
+        # Write header to both files
+        header = self.get_html_header()
+        main_f.write(header)
+        media_f.write(header)
+
+        # Write date range and attribution to both files
+        if chat.date_range and chat.date_range.is_filtered():
+            date_range_str = chat.date_range.format_range(chat.message_date_format)
+            if date_range_str:
+                date_html = f'<p style="color: #667781;">{date_range_str}</p>'
+                main_f.write(date_html)
+                media_f.write(date_html)
+
+        if chat.message_filter and chat.message_filter.is_filtered():
+            filter_html = f'<p style="color: #667781;">{html_module.escape(chat.message_filter.describe())}</p>'
+            main_f.write(filter_html)
+            media_f.write(filter_html)
+
+        attribution = '<p style="color: #667781;">This rendering has been created with the free offline tool `chat-export` from https://chat-export.click </p>'
+        main_f.write(attribution)
+        media_f.write(attribution)
+        self._write_messages(chat, main_f, media_f, 0, checkpoint)
+
+    def _write_messages(self, chat, main_f, media_f, after_id, checkpoint):
+        """Write the messages after message after_id, the loader script and the footer."""
+        messages = [message for message in chat.messages if message.id > after_id] if after_id else chat.messages
+        if self.compress_payload:
+            # Markup is buffered into compressed blocks, media payloads go straight to the file
+            self._payload_f = main_f
+            main_out = CompressedBlockWriter(main_f)
+            try:
+                for message in messages:
+                    self.render_message(message, chat.sender_color_map, chat.own_name, main_out, media_f)
+                    # the output is only complete up to a message when its block has been written
+                    if main_out.end_message() and checkpoint is not None:
+                        checkpoint(message.id)
+                main_out.flush_block()
+            finally:
+                self._payload_f = None
+            main_f.write(self.get_payload_loader())
+        elif self.embed_media:
+            # Media payloads are written into the message markup, next to their element
+            self._payload_f = main_f
+            try:
+                for message in messages:
+                    self.render_message(message, chat.sender_color_map, chat.own_name, main_f, media_f)
+                    if checkpoint is not None and message.id % self.CHECKPOINT_INTERVAL == 0:
+                        checkpoint(message.id)
+            finally:
+                self._payload_f = None
+            main_f.write(self.get_payload_loader())
+        else:
+            for message in messages:
+                self.render_message(message, chat.sender_color_map, chat.own_name, main_f, media_f)
+                if checkpoint is not None and message.id % self.CHECKPOINT_INTERVAL == 0:
+                    checkpoint(message.id)
+
+        # Write footer to both files
+        footer = self.get_html_footer()
+        main_f.write(footer)
+        media_f.write(footer)
 
     def render(self, chat):
         """Render chat to HTML files."""
-        print("Writing HTML files...")
+        logger.info("Writing HTML files...")
 
         self.chat = chat
         # Prepare file paths
@@ -1017,56 +3046,163 @@ class HTMLRenderer(Renderer):
             media_linked_html_path = os.path.join(self.output_dir, self.html_filename_media_linked)
         else:
             # Use a proper temp file instead of a hardcoded name
+            import tempfile
             tmp_fd, media_linked_html_path = tempfile.mkstemp(suffix='.tmp', prefix='chat_export_')
             os.close(tmp_fd)
 
+        paths = {'main': main_html_path}
+        if self.html_filename_media_linked:
+            paths['media'] = media_linked_html_path
+        resume = self._resume_point(paths)
+        if resume is not None:
+            logger.info("Resuming after message %d", resume['message_id'])
+        if self.stylesheet_filename:
+            self._write_stylesheet()
+
         try:
             # Open both files for writing
-            with open(main_html_path, 'w', encoding='utf-8') as main_f, \
-                 open(media_linked_html_path, 'w', encoding='utf-8') as media_f:
+            with self._open_output(main_html_path, resume, 'main') as main_f, \
+                 self._open_output(media_linked_html_path, resume if 'media' in paths else None, 'media') as media_f:
+                checkpoint = None
+                if self.checkpoints is not None:
+                    files = {'main': main_f, 'media': media_f} if 'media' in paths else {'main': main_f}
+                    checkpoint = lambda message_id: self.checkpoints.save(
+                        message_id, files, {'payload_count': self._payload_count})
+                self.write_document(chat, main_f, media_f, resume, checkpoint)
+        finally:
+            self._close_zip_files()
+            # Clean up temp file if embed_media mode (no media-linked HTML needed)
+            if not self.html_filename_media_linked and os.path.exists(media_linked_html_path):
+                os.remove(media_linked_html_path)
 
-                # Write header to both files
-                header = self.get_html_header()
-                main_f.write(header)
-                media_f.write(header)
+        return self.attachments_to_extract
 
-                # Write date range and attribution to both files
-                if chat.date_range and chat.date_range.is_filtered():
-                    date_range_str = chat.date_range.format_range(chat.message_date_format)
-                    if date_range_str:
-                        date_html = f'<p style="color: #667781;">{date_range_str}</p>'
-                        main_f.write(date_html)
-                        media_f.write(date_html)
 
-                attribution = '<p style="color: #667781;">This rendering has been created with the free offline tool `chat-export` from https://chat-export.click </p>'
-                main_f.write(attribution)
-                media_f.write(attribution)
+class JSONRenderer(Renderer):
+    """Renders messages to a JSON file, with attachments linked to the media folder."""
 
-                message_count = 0
+    FILENAME_ATTRIBUTES = ('json_filename',)
 
-                for message in chat.messages:
-                    self.render_message(message, chat.sender_color_map, chat.own_name, main_f, media_f)
-                    message_count += 1
+    def __init__(self, output_dir, has_media=False, media_path="media", media_layout='flat'):
+        super().__init__(output_dir)
+        self.has_media = has_media
+        self.uses_media_files = has_media
+        self.media_path = media_path
+        self.media_layout = media_layout
+        self.json_filename = 'chat.json'
 
-                # Write footer to both files
-                footer = self.get_html_footer()
-                main_f.write(footer)
-                media_f.write(footer)
-        finally:
-            # Clean up temp file if embed_media mode (no media-linked HTML needed)
-            if not self.html_filename_media_linked and os.path.exists(media_linked_html_path):
-                os.remove(media_linked_html_path)
+    def get_generated_files(self) -> list[Path]:
+        """Get the generated files."""
+        return [Path(self.output_dir, self.json_filename)]
 
+    def message_to_dict(self, message, chat):
+        """Return the JSON object of a message."""
+        attachment = None
+        if message.has_attachment and self.has_media:
+            attachment_name = message.attachment_name
+            self.note_attachment(attachment_name)
+            attachment = self.media_url(attachment_name)
+        return {
+            'id': message.id,
+            'timestamp': message.timestamp,
+            'date': message.parsed_date.isoformat() if message.parsed_date else None,
+            'sender': message.sender,
+            'text': message.content.replace(chat.newline_marker, '\n'),
+            'attachment': attachment,
+        }
+
+    def render(self, chat):
+        """Render chat to a JSON file, writing one message at a time."""
+        import json
+
+        logger.info("Writing JSON file...")
+        chat_info = {
+            'name': chat.name,
+            'own_name': chat.own_name,
+            'senders': chat.senders,
+            'date_range': chat.date_range.format_range(chat.message_date_format) if chat.date_range else None,
+            'filter': chat.message_filter.describe() if chat.message_filter else None,
+        }
+        json_path = os.path.join(self.output_dir, self.json_filename)
+        resume = self._resume_point({'main': json_path})
+        messages = chat.messages
+        with self._open_output(json_path, resume, 'main') as f:
+            if resume is None:
+                f.write('{"chat": ' + json.dumps(chat_info, ensure_ascii=False) + ',\n"messages": [')
+            else:
+                logger.info("Resuming after message %d", resume['message_id'])
+                self.replay_attachments(chat, resume['message_id'])
+                messages = [message for message in messages if message.id > resume['message_id']]
+            for message in messages:
+                f.write(',\n' if message.id > 1 else '\n')
+                # messages don't depend on the perspective, only the chat info does
+                message_json = self.fragments.get(message.id) if self.fragments is not None else None
+                if message_json is None:
+                    message_json = json.dumps(self.message_to_dict(message, chat), ensure_ascii=False)
+                    if self.fragments is not None:
+                        self.fragments.put(message.id, message_json, len(message_json))
+                elif message.has_attachment and self.has_media:
+                    self.note_attachment(message.attachment_name)
+                f.write(message_json)
+                if self.checkpoints is not None and message.id % self.CHECKPOINT_INTERVAL == 0:
+                    self.checkpoints.save(message.id, {'main': f})
+            f.write('\n]}\n')
         return self.attachments_to_extract
 
 
+# Output formats by name (--format). Each factory gets the ChatExport and returns a Renderer.
+RENDERERS = {}
+
+
+def register_renderer(name, factory):
+    """Make a renderer available as output format `name`."""
+    RENDERERS[name] = factory
+
+
+register_renderer('html', lambda export: HTMLRenderer(
+    output_dir=export.output_dir,
+    has_media=export.has_media,
+    zip_path=export.zip_path,
+    media_layout=export.media_layout,
+    compact=export.compact
+))
+register_renderer('embedded', lambda export: HTMLRenderer(
+    output_dir=export.output_dir,
+    has_media=export.has_media,
+    embed_media=True,
+    zip_path=export.zip_path,
+    media_path="./" + os.path.basename(export.media_dir),
+    export_name=export.export_name,
+    media_layout=export.media_layout,
+    compress_payload=export.compress_payload,
+    embed_max_size=export.embed_max_size,
+    embed_budget=export.embed_budget,
+    attachment_size=export.attachment_size,
+    media_cache=export.media_cache,
+    compact=export.compact,
+    zip_index=export.zip_index
+))
+register_renderer('json', lambda export: JSONRenderer(
+    output_dir=export.output_dir,
+    has_media=export.has_media,
+    media_layout=export.media_layout
+))
+
+
 class ChatExport:
-    def __init__(self, zip_path, from_date=None, until_date=None, participant_name=None, base_output_dir=None, embed_media=False):
+    def __init__(self, zip_path, from_date=None, until_date=None, participant_name=None, base_output_dir=None, embed_media=False,
+                 pipeline_extraction=True, verify_crc=True, compress_payload=False, write_stats=False,
+                 senders=None, grep=None, formats=None, embed_max_size=None, embed_budget=None, resume=False,
+                 media_layout='flat', media_cache=None, media_cache_size=None, media_store=None, compact=False):
         # Validate zip file existence
         if not os.path.exists(zip_path):
             raise FileNotFoundError(f"Could not find the file: {zip_path}\nPlease check if the file path is correct.")
 
-        if not zip_path.lower().endswith('.zip'):
+        # An already extracted export folder can be used instead of the zip file
+        self.is_directory = os.path.isdir(zip_path)
+        if self.is_directory:
+            zip_path = zip_path.rstrip('/\\') or zip_path
+        elif not zip_path.lower().endswith('.zip'):
             raise ValueError(f"The file {zip_path} is not a zip file.\nPlease provide a valid WhatsApp chat export zip file.")
 
         self.zip_path = zip_path
@@ -1074,27 +3210,68 @@ class ChatExport:
         # Pre-set values for non-interactive mode
         self.from_date = from_date
         self.until_date = until_date
+        # One name, or several names / 'all' for one output per participant's perspective
+        if isinstance(participant_name, (list, tuple)):
+            participant_name = participant_name[0] if len(participant_name) == 1 else list(participant_name)
         self.participant_name = participant_name
-        self.embed_media = embed_media
-
-        # Set up output directory: base_output_dir/zip_filename or just zip_filename
-        zip_stem = Path(zip_path).stem
-        if self.embed_media:
-            if base_output_dir:
-                self.output_dir = parse_path(base_output_dir)
-            else:
-                self.output_dir = Path("")
-        else: 
-            if base_output_dir:
-                # Normalize the base output directory path (handle Windows paths, quotes, etc.)
-                normalized_base_dir = parse_path(base_output_dir)
-                self.output_dir = Path(os.path.join(normalized_base_dir, zip_stem))
-            else:
-                self.output_dir = Path(zip_stem)
-        self.media_dir = os.path.join(self.output_dir, "media")
-
-        self.own_name = participant_name
+        # Participants to render the chat for when there are several, see _select_participants
+        self.perspectives = None
+        # Everyone who wrote in the chat, known once it has been read
+        self.chat_senders = []
+        # Output formats (see RENDERERS); embed_media alone means the single embedded HTML file
+        if isinstance(formats, str):
+            formats = [formats]
+        self.formats = list(dict.fromkeys(formats or []))
+        if embed_media and 'embedded' not in self.formats:
+            self.formats.append('embedded')
+        if not self.formats:
+            self.formats = ['html']
+        unknown_formats = [name for name in self.formats if name not in RENDERERS]
+        if unknown_formats:
+            raise ValueError(f"Unknown output format: {', '.join(unknown_formats)} (available: {', '.join(RENDERERS)})")
+        # The embedded HTML file on its own is written without a folder of its own
+        self.embed_media = self.formats == ['embedded']
+        # File name of the embedded HTML file without extension, None for the name of the ZIP
+        self.export_name = None
+        # Attachments above this size or beyond this total are linked instead of embedded
+        self.embed_max_size = parse_size(embed_max_size) if embed_max_size is not None else None
+        self.embed_budget = parse_size(embed_budget) if embed_budget is not None else None
+        if media_layout not in MEDIA_LAYOUTS:
+            raise ValueError(f"Unknown media layout: {media_layout} (available: {', '.join(MEDIA_LAYOUTS)})")
+        self.media_layout = media_layout
+        self.compact = compact
+        # MediaStore that linked attachments go into instead of the media folder
+        self.media_store = None
+        self.media_links = None
+        if media_store:
+            if media_layout != 'flat':
+                raise ValueError("A media store has a layout of its own, --media-layout can't be combined with it")
+            self.media_store = MediaStore(parse_path(media_store))
+        # Folder for encoded embedded media that later exports of the same files can reuse
+        self.media_cache = None
+        if media_cache:
+            max_bytes = parse_size(media_cache_size) if media_cache_size is not None else MediaCache.DEFAULT_MAX_BYTES
+            self.media_cache = MediaCache(parse_path(media_cache), max_bytes)
+        self.pipeline_extraction = pipeline_extraction
+        self.verify_crc = verify_crc
+        self.compress_payload = compress_payload
+        self.write_stats = write_stats
+        # The stats JSON and HTML files, once written
+        self.statistics_files = []
+        # Keep only messages of these senders / matching this regex
+        self.message_filter = MessageFilter(senders, grep)
+        # Keep a progress journal in the output folder and continue an interrupted export
+        self.resume = resume
+        self.journal = None
+
+        # Set up output directory: base_output_dir/zip_filename or just zip_filename.
+        # For an export folder, a suffix keeps the output from landing in the input folder.
+        self._set_output_dir(base_output_dir, export_stem(zip_path) + ('_html' if self.is_directory else ''))
+
+        self.own_name = participant_name if isinstance(participant_name, str) else None
         self.attachments_in_zip = set()
+        # ZipIndex of the export ZIP, open from reading the chat until the conversion is done
+        self.zip_index = None
         self.has_media = False
         self.is_ios = False
 
@@ -1109,17 +3286,42 @@ class ChatExport:
 
         # Initialize modular components (will be set up later after platform detection)
         self.parser = None
+        self.renderers = []
         self.renderer = None
+        # (name for messages and the journal, renderer, perspective or None) per output
+        self.render_targets = []
+
+        # Seconds spent per processing stage of the last run (read, parse, render, extract)
+        self.timings = {}
+
+    def _set_output_dir(self, base_output_dir, output_folder_name):
+        """Set output_dir and media_dir. Without embedding, output goes to a folder of its own."""
+        zip_stem = self.output_folder_name = output_folder_name
+        if self.embed_media:
+            if base_output_dir:
+                self.output_dir = parse_path(base_output_dir)
+            else:
+                self.output_dir = Path("")
+        else: 
+            if base_output_dir:
+                # Normalize the base output directory path (handle Windows paths, quotes, etc.)
+                normalized_base_dir = parse_path(base_output_dir)
+                self.output_dir = Path(os.path.join(normalized_base_dir, zip_stem))
+            else:
+                self.output_dir = Path(zip_stem)
+        self.media_dir = os.path.join(self.output_dir, "media")
+        if self.embed_media and (self.embed_max_size is not None or self.embed_budget is not None):
+            # linked attachments of a single HTML file get a folder named after it
+            self.media_dir = os.path.join(self.output_dir, f"{self.export_name or export_stem(self.zip_path)}_media")
 
     def validate_participant(self, participant_name, senders):
         """Validate that the specified participant exists in the chat.
         If not found, display all participants and raise an error."""
         if participant_name not in senders:
-            print(f"\nError: Participant '{participant_name}' not found in the chat.")
-            print("\nFound the following participants in the chat:")
-            for i, sender in enumerate(senders, 1):
-                print(f"{i}. {sender}")
-            print("\nPlease use one of the names listed above exactly as shown.")
+            logger.error(
+                "Participant '%s' not found in the chat.\n\nFound the following participants in the chat:\n%s\n\n"
+                "Please use one of the names listed above exactly as shown.",
+                participant_name, "\n".join(f"{i}. {sender}" for i, sender in enumerate(senders, 1)))
             raise ValueError(f"Participant '{participant_name}' not found in chat participants ({', '.join(senders)}). Make sure to use one of the listed names.")
         return True
 
@@ -1137,22 +3339,98 @@ class ChatExport:
         )
         
 
-        # Setup renderer
-        self.renderer = HTMLRenderer(
-            output_dir=self.output_dir,
-            has_media=self.has_media,
-            embed_media=self.embed_media,
-            zip_path=self.zip_path
-        )
+        self._setup_renderers()
+
+    def _setup_renderers(self):
+        """One renderer per output format, times one per perspective if there are several.
+        The chat is parsed once and fed to all of them."""
+        self.render_targets = []
+        fragment_caches = {}
+        perspectives = self.perspectives or [None]
+        suffixes = self._perspective_suffixes(self.perspectives) if self.perspectives else [None]
+        for perspective, suffix in zip(perspectives, suffixes):
+            for name in self.formats:
+                renderer = RENDERERS[name](self)
+                if perspective is None:
+                    self.render_targets.append((name, renderer, None))
+                    continue
+                renderer.add_filename_suffix(suffix)
+                renderer.fragments = fragment_caches.setdefault(name, FragmentCache())
+                self.render_targets.append((f"{name} for {perspective}", renderer, perspective))
+        self.renderers = [renderer for _, renderer, _ in self.render_targets]
+        self.renderer = self.renderers[0]
+
+    @staticmethod
+    def _perspective_suffixes(names):
+        """The file name suffix of each participant's outputs, e.g. '_Alice'."""
+        suffixes = []
+        for name in names:
+            suffix = '_' + (re.sub(r'[^\w\-]+', '_', name).strip('_') or 'participant')
+            # names that only differ in punctuation still get their own files
+            while suffix in suffixes:
+                suffix += '_'
+            suffixes.append(suffix)
+        return suffixes
+
+    def _select_participants(self, senders):
+        """Validate the participant(s) and set own_name.
+
+        With several participants or 'all' (all senders), the chat is rendered once from
+        each participant's perspective, into files named after them.
+        """
+        self.chat_senders = list(senders)
+        if isinstance(self.participant_name, list) or (self.participant_name == 'all' and 'all' not in senders):
+            names = list(senders) if self.participant_name == 'all' else list(dict.fromkeys(self.participant_name))
+            if not names:
+                raise ValueError("The chat has no participants.")
+            for name in names:
+                self.validate_participant(name, senders)
+            self.perspectives = names
+            self.own_name = names[0]
+            self._setup_renderers()
+        else:
+            self.validate_participant(self.own_name, senders)
+
+    def _perspective_chat(self, chat, perspective):
+        """The chat as seen by another participant: same messages, own name and colors changed."""
+        import dataclasses
+
+        sender_color_map = self.parser._generate_color_map(chat.senders, perspective)
+        return dataclasses.replace(chat, own_name=perspective, sender_color_map=sender_color_map)
+
+    def get_generated_files(self) -> list[Path]:
+        """Get the files generated by all renderers, and the statistics files."""
+        # renderers for several perspectives share the stylesheet
+        rendered = [path for renderer in self.renderers for path in renderer.get_generated_files()]
+        return list(dict.fromkeys(rendered + self.statistics_files))
 
     @staticmethod
     def most_similar(target: str, candidates: list[str]) -> str:
-        """Return the string from candidates most similar to target."""
-        return max(candidates, key=lambda c: difflib.SequenceMatcher(None, target, c).ratio())
+        """Return the string from candidates most similar to target (the first one of equally similar ones).
+
+        The cheap upper bounds of the similarity are checked first, so the full comparison
+        only runs for candidates that can still beat the best one so far.
+        """
+        import difflib
+
+        matcher = difflib.SequenceMatcher(None)
+        matcher.set_seq1(target)
+        best, best_ratio = None, -1.0
+        for candidate in candidates:
+            matcher.set_seq2(candidate)
+            if best is not None and (matcher.real_quick_ratio() <= best_ratio or matcher.quick_ratio() <= best_ratio):
+                continue
+            ratio = matcher.ratio()
+            if ratio > best_ratio:
+                best, best_ratio = candidate, ratio
+        return best
 
     # Files/dirs this tool writes into a non-embed output folder.
-    _EXPORT_DIR_ENTRIES = frozenset({"chat.html", "chat_media_linked.html", "media"})
+    _EXPORT_DIR_ENTRIES = frozenset({"chat.html", "chat_media_linked.html", "chat.json", "media", "stats.json", "stats.html",
+                                     HTMLRenderer.STYLESHEET_FILENAME})
     _IGNORABLE_DIR_ENTRIES = frozenset({".DS_Store", "Thumbs.db", "desktop.ini"})
+    # the outputs that get a participant's name appended, see add_filename_suffix
+    _PERSPECTIVE_OUTPUTS = ("chat.html", "chat_media_linked.html", "chat.json")
 
     @staticmethod
     def _is_protected_path(path: Path) -> bool:
@@ -1190,16 +3468,58 @@ class ChatExport:
             entries = {p.name for p in path.iterdir()}
         except OSError:
             return False
-        return (entries - self._IGNORABLE_DIR_ENTRIES) <= self._EXPORT_DIR_ENTRIES
+        # plus the embedded HTML file, which is named after the export, and the journal
+        allowed_entries = self._EXPORT_DIR_ENTRIES | {p.name for p in self.get_generated_files()} | {
+            f"{self.export_name or export_stem(self.zip_path)}.html", self._journal_path().name}
+        # plus the outputs for each participant of this chat, from an earlier run with several perspectives
+        allowed_entries |= {stem + suffix + ext
+                            for suffix in self._perspective_suffixes(self.chat_senders)
+                            for stem, ext in map(os.path.splitext, self._PERSPECTIVE_OUTPUTS)}
+        return (entries - self._IGNORABLE_DIR_ENTRIES) <= allowed_entries
+
+    def _journal_path(self):
+        return Path(self.output_dir, f".{self.export_name or export_stem(self.zip_path)}.chat-export-journal")
+
+    def _journal_run_info(self):
+        """Everything that changes the output; a journal is only resumed with identical values."""
+        source = os.path.abspath(self.zip_path)
+        source_stat = os.stat(source)
+        return {
+            'version': get_version(),
+            'source': source,
+            'source_size': source_stat.st_size,
+            'source_mtime': source_stat.st_mtime,
+            'formats': self.formats,
+            'from_date': str(self.from_date) if self.from_date else None,
+            'until_date': str(self.until_date) if self.until_date else None,
+            'participant': self.perspectives or self.own_name,
+            'senders': sorted(self.message_filter.senders) if self.message_filter.senders else None,
+            'grep': self.message_filter.pattern.pattern if self.message_filter.pattern else None,
+            'embed_max_size': self.embed_max_size,
+            'embed_budget': self.embed_budget,
+            'compress': self.compress_payload,
+            'media_layout': self.media_layout,
+            'media_store': str(self.media_store.directory.absolute()) if self.media_store else None,
+            'compact': self.compact,
+        }
 
     def _prepare_output_directories(self):
         """Create output dirs. Delete a previous export only when that is clearly safe."""
-        zip_stem = Path(self.zip_path).stem
+        zip_stem = self.output_folder_name
         output_path = Path(self.output_dir)
 
-        if output_path.exists() and not self.embed_media:
+        resuming = False
+        if self.resume:
+            self.journal = ExportJournal(self._journal_path(), self._journal_run_info())
+            resuming = self.journal.load()
+            if resuming:
+                logger.info("Resuming the interrupted export in %s", self.output_dir)
+            elif self.journal.path.exists():
+                logger.info("The journal of the previous export was written with other options, starting over")
+
+        if output_path.exists() and not self.embed_media and not resuming:
             if self._is_replaceable_export_dir(output_path, zip_stem):
-                print(f"Cleaning existing directory: {self.output_dir}")
+                logger.info("Cleaning existing directory: %s", self.output_dir)
                 shutil.rmtree(self.output_dir)
             elif output_path.is_file() or self._is_protected_path(output_path) or any(output_path.iterdir()):
                 raise ValueError(
@@ -1210,44 +3530,395 @@ class ChatExport:
                 )
 
         os.makedirs(self.output_dir, exist_ok=True)
-        if self.has_media and not self.embed_media:
+        if self.has_media and not self.embed_media and self.media_store is None:
             os.makedirs(self.media_dir, exist_ok=True)
+        if self.journal is not None:
+            self.journal.open(resuming)
+
+    def _finish_journal(self):
+        """The export is complete; there is nothing left to resume."""
+        if self.journal is not None:
+            self.journal.remove()
+            self.journal = None
+
+    def _select_chat_file(self, candidates, base_name):
+        """Pick the chat text file among .txt candidates and detect the platform.
+
+        Cheapest checks first: iOS's '_chat.txt', then '<export name>.txt'. Otherwise only
+        the files in the top folder named like Android's 'WhatsApp Chat with ...' are
+        considered, if there are any: the one whose name is the start of the export name or
+        the other way round (e.g. 'WhatsApp Chat with X (1).zip'), if exactly one is. Else
+        the name is compared by similarity to those files, or to all candidates.
+        """
+        if not candidates:
+            raise FileNotFoundError("No .txt file found in the ZIP archive. Not a valid WhatsApp export zip.")
+        if '_chat.txt' in candidates:
+            self.is_ios = True
+            return '_chat.txt'
+        self.is_ios = False
+        exact_name = f"{base_name}.txt"
+        if exact_name in candidates:
+            return exact_name
+        named_like_chats = [name for name in candidates if '/' not in name and 'whatsapp' in name.lower()]
+        prefix_matches = [name for name in named_like_chats
+                          if base_name.startswith(name[:-4]) or name[:-4].startswith(base_name)]
+        if len(prefix_matches) == 1:
+            return prefix_matches[0]
+        return self.most_similar(exact_name, prefix_matches or named_like_chats or candidates)
+
+    def _read_chat(self) -> str:
+        """Read the chat text from the ZIP file or the extracted export folder."""
+        if self.is_directory:
+            return self._read_chat_from_directory()
+        return self._read_chat_from_zip()
+
+    def _print_export_kind(self, chat_file, source='ZIP file'):
+        kind = 'iOS' if self.is_ios else 'Android'
+        if self.has_media:
+            logger.info("%s is an %s export with media/attachments, '%s' is the chat text file.", source, kind, chat_file)
+        else:
+            logger.info("%s is an %s export without media/attachments, '%s' is the chat text file.", source, kind, chat_file)
 
     def _read_chat_from_zip(self) -> str:
         """Validate the ZIP and read the chat text. Does not touch the output directory."""
         zip_base_name = Path(self.zip_path).stem
+        self.close()
         try:
-            with zipfile.ZipFile(self.zip_path, 'r') as zip_ref:
-                chat_file_candidates = [f for f in zip_ref.namelist() if f.lower().endswith('.txt')]
-                if not chat_file_candidates:
-                    raise FileNotFoundError("No .txt file found in the ZIP archive. Not a valid WhatsApp export zip.")
-                if '_chat.txt' in chat_file_candidates:
-                    self.is_ios = True
-                    chat_file = '_chat.txt'
-                else:
-                    self.is_ios = False
-                    chat_file = self.most_similar(f"{zip_base_name}.txt", chat_file_candidates)
+            self.zip_index = ZipIndex(self.zip_path)
+            chat_file = self._select_chat_file(self.zip_index.text_files, zip_base_name)
 
-                for file in zip_ref.namelist():
-                    if file != chat_file:
-                        self.attachments_in_zip.add(file)
-                        self.has_media = True
+            self.attachments_in_zip = set(self.zip_index.entries)
+            self.attachments_in_zip.discard(chat_file)
+            self.has_media = bool(self.attachments_in_zip)
 
-                if chat_file not in zip_ref.namelist():
-                    raise FileNotFoundError(f"The chat file '{chat_file}' does not exist in the ZIP archive. Not a valid WhatsApp export zip.")
-
-                with zip_ref.open(chat_file) as f:
-                    chat_content = f.read().decode('utf-8')
+            with self.zip_index.zip_ref.open(chat_file) as f:
+                chat_content = f.read().decode('utf-8')
         except zipfile.BadZipFile:
+            self.close()
             raise ValueError(f"The file {self.zip_path} is not a valid ZIP file.")
+        except BaseException:
+            self.close()
+            raise
 
-        kind = 'iOS' if self.is_ios else 'Android'
-        if self.has_media:
-            print(f"ZIP file is an {kind} export with media/attachments, '{chat_file}' is the chat text file.")
-        else:
-            print(f"ZIP file is an {kind} export without media/attachments, '{chat_file}' is the chat text file.")
+        self._print_export_kind(chat_file)
+        return chat_content
+
+    def _read_chat_from_directory(self) -> str:
+        """Read the chat text from an already extracted export folder.
+
+        Uses the same detection as for ZIP files; file names are relative to the folder,
+        with '/' as separator like ZIP entry names.
+        """
+        names = []
+        for root, dirs, files in os.walk(self.zip_path):
+            dirs.sort()
+            relative_root = os.path.relpath(root, self.zip_path)
+            for file in sorted(files):
+                if file in self._IGNORABLE_DIR_ENTRIES:
+                    continue
+                name = file if relative_root == os.curdir else os.path.join(relative_root, file)
+                names.append(name.replace(os.path.sep, '/'))
+
+        chat_file_candidates = [f for f in names if f.lower().endswith('.txt')]
+        try:
+            chat_file = self._select_chat_file(chat_file_candidates, Path(self.zip_path).name)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No .txt file found in the folder {self.zip_path}. Not a valid WhatsApp export folder.")
+
+        for file in names:
+            if file != chat_file:
+                self.attachments_in_zip.add(file)
+                self.has_media = True
+
+        with open(os.path.join(self.zip_path, *chat_file.split('/')), 'rb') as f:
+            chat_content = f.read().decode('utf-8')
+
+        self._print_export_kind(chat_file, source='Folder')
         return chat_content
 
+    def _validate_message_filter(self, senders):
+        """Check that the senders to filter for exist in the chat."""
+        for name in sorted(self.message_filter.senders or ()):
+            if name not in senders and name != "WhatsApp":
+                raise ValueError(f"Sender '{name}' not found in chat participants ({', '.join(senders)}). Make sure to use one of the listed names.")
+
+    def _report_filtered_count(self, date_range, filtered_count, total_count):
+        """Print how many messages are left after filtering; fail if there are none."""
+        if self.message_filter.is_filtered():
+            logger.info("%d of %d messages match the filters.", filtered_count, total_count)
+            if filtered_count == 0:
+                raise ValueError("No messages match the filters. Aborting.")
+        elif date_range and date_range.is_filtered():
+            logger.info("%d of %d messages match date range filter.", filtered_count, total_count)
+            if filtered_count == 0:
+                raise ValueError("No messages found in the specified date range. Aborting.")
+
+    def attachment_size(self, attachment_name):
+        """Size in bytes of an attachment of the ZIP or export folder."""
+        if self.is_directory:
+            try:
+                return os.path.getsize(os.path.join(self.zip_path, *attachment_name.split('/')))
+            except OSError:
+                return 0
+        info = self.zip_index.entries.get(attachment_name) if self.zip_index is not None else None
+        return info.file_size if info is not None else 0
+
+    def attachment_stored_size(self, attachment_name):
+        """Bytes an attachment takes up in the ZIP (compressed), or its size in an export folder."""
+        info = self.zip_index.entries.get(attachment_name) if self.zip_index is not None else None
+        return info.compress_size if info is not None else self.attachment_size(attachment_name)
+
+    def close(self):
+        """Close the ZIP kept open for the stages of a conversion."""
+        if self.zip_index is not None:
+            self.zip_index.close()
+            self.zip_index = None
+
+    def _create_statistics(self):
+        """ChatStatistics to fill while parsing, or None if no statistics are written."""
+        return ChatStatistics(self.attachment_size) if self.write_stats else None
+
+    def _write_statistics(self, stats, chat):
+        """Write stats as JSON and HTML next to the chat HTML."""
+        if stats is None:
+            return
+        if self.embed_media:
+            base_name = f"{self.export_name or export_stem(self.zip_path)}_stats"
+        else:
+            base_name = 'stats'
+        json_path = Path(self.output_dir, base_name + '.json')
+        html_path = json_path.with_suffix('.html')
+        stats.write_json(json_path)
+        stats.write_html(html_path, chat.name)
+        self.statistics_files = [json_path, html_path]
+        logger.info("Statistics written to %s and %s", json_path, html_path)
+
+    def _create_media_extractor(self):
+        """Create the extractor that fills the media folder from the ZIP or export folder."""
+        return self._media_extractor_for(self.zip_path)
+
+    def _zip_index_for(self, source_path):
+        """ZipIndex of a source ZIP that has been read already, or None."""
+        if self.zip_index is not None and source_path == self.zip_path:
+            return self.zip_index
+        return None
+
+    def _media_extractor_for(self, source_path):
+        if os.path.isdir(source_path):
+            extractor = DirectoryMediaExtractor(source_path, self.media_dir, media_layout=self.media_layout)
+        else:
+            extractor = MediaExtractor(source_path, self.media_dir, verify_crc=self.verify_crc,
+                                       media_layout=self.media_layout, zip_index=self._zip_index_for(source_path))
+        extractor.journal = self.journal
+        return extractor
+
+    def _validate_date_inputs(self):
+        """Parse the pre-set from/until date strings of non-interactive mode."""
+        # Validate date parameters if provided
+        if self.from_date:
+            try:
+                self.from_date = self.parse_date_input(self.from_date)
+            except ValueError as e:
+                raise ValueError(f"Invalid from-date format: {e}")
+
+        if self.until_date:
+            try:
+                self.until_date = self.parse_date_input(self.until_date)
+            except ValueError as e:
+                raise ValueError(f"Invalid until-date format: {e}")
+
+        if self.from_date and self.until_date and self.from_date > self.until_date:
+            raise ValueError("'From' date must be before 'until' date")
+
+    def _render(self, name, renderer, chat, perspective=None):
+        """Render with one renderer. With a journal, output an interrupted run has finished is
+        kept and a partially written one is continued from its last checkpoint."""
+        if perspective is not None:
+            chat = self._perspective_chat(chat, perspective)
+        if self.journal is None:
+            return renderer.render(chat)
+        stage = f"render:{name}"
+        if stage in self.journal.completed_stages and all(path.exists() for path in renderer.get_generated_files()):
+            logger.info("Keeping the %s output of the interrupted run", name)
+            return renderer.replay_attachments(chat)
+        renderer.checkpoints = RenderCheckpoints(self.journal, stage)
+        attachments = renderer.render(chat)
+        self.journal.complete_stage(stage)
+        return attachments
+
+    def _render_and_extract(self, chat):
+        """Render the chat with all renderers and extract the attachments they link to.
+
+        Extraction is shared: each attachment is extracted once, however many renderers
+        use it. In pipelined mode, attachments are extracted on a background thread while
+        the output is still being written.
+        """
+        render_start_time = time.time()
+        media_renderers = [renderer for renderer in self.renderers if renderer.uses_media_files]
+        if media_renderers and self.media_store is not None:
+            self._render_into_store(chat, media_renderers)
+            self.timings['render'] = time.time() - render_start_time
+            return
+        if not media_renderers:
+            for name, renderer, perspective in self.render_targets:
+                self._render(name, renderer, chat, perspective)
+            self.timings['render'] = time.time() - render_start_time
+            if self.has_media:
+                logger.info("Media will be embedded as base64 in HTML (no file extraction needed)")
+            return
+
+        if self.pipeline_extraction:
+            logger.info("Extracting attachments/media while rendering...")
+            extractor = self._create_media_extractor().start()
+            submitted = set()
+
+            def submit(attachment_name):
+                if attachment_name not in submitted:
+                    submitted.add(attachment_name)
+                    extractor.submit(attachment_name)
+
+            for renderer in media_renderers:
+                renderer.attachment_callback = submit
+            try:
+                for name, renderer, perspective in self.render_targets:
+                    self._render(name, renderer, chat, perspective)
+            except BaseException:
+                extractor.close(abort=True)
+                raise
+            finally:
+                for renderer in media_renderers:
+                    renderer.attachment_callback = None
+            extract_start_time = time.time()
+            self.timings['render'] = extract_start_time - render_start_time
+            extractor.close()
+            # only the time spent waiting for extraction after rendering has finished
+            self.timings['extract'] = time.time() - extract_start_time
+            return
+
+        attachments_to_extract = set()
+        for name, renderer, perspective in self.render_targets:
+            attachments = self._render(name, renderer, chat, perspective)
+            if renderer.uses_media_files:
+                attachments_to_extract.update(attachments)
+        extract_start_time = time.time()
+        self.timings['render'] = extract_start_time - render_start_time
+
+        logger.info("Extracting attachments/media...")
+        # extract attachments of rendered messages
+        self._create_media_extractor().extract_all(attachments_to_extract)
+        self.timings['extract'] = time.time() - extract_start_time
+
+    def _render_into_store(self, chat, media_renderers):
+        """Render with attachments linked into the media store, then record which objects
+        the output files link to."""
+        self.media_links = StoredMediaLinks(self.media_store, self.zip_path, self._zip_index_for(self.zip_path))
+        self.media_links.sources = chat.attachment_sources
+        for renderer in media_renderers:
+            renderer.media_links = self.media_links
+        try:
+            for name, renderer, perspective in self.render_targets:
+                self._render(name, renderer, chat, perspective)
+            # attachments of output kept from an interrupted run (--resume) weren't linked again
+            objects = {self.media_links.object_for(attachment_name)
+                       for renderer in media_renderers for attachment_name in renderer.attachments_to_extract}
+        finally:
+            self.media_links.close()
+        self.media_store.write_ref(self.get_generated_files(), objects, source=os.path.abspath(self.zip_path))
+        logger.info("%d attachments linked into the media store %s", len(objects), self.media_store.directory)
+
+    # Messages rendered to measure the HTML size per message in plan()
+    PLAN_SAMPLE_SIZE = 500
+    # Base64 plus the <script> element around each embedded attachment
+    EMBED_OVERHEAD_FACTOR = 4 / 3
+    EMBED_OVERHEAD_BYTES = 150
+
+    def plan(self, largest_count=10):
+        """Estimate the size of the conversion without writing or extracting anything.
+
+        Messages are only scanned (with the date range and message filters applied), not
+        parsed; the HTML size is extrapolated from rendering a sample of them. Attachment
+        sizes come from the ZIP central directory. Returns a JSON-serializable dict.
+        """
+        import dataclasses
+
+        self._validate_date_inputs()
+        start_time = time.time()
+        chat_content = self._read_chat()
+        self.setup_modular_components()
+        date_range = DateRange(self.from_date, self.until_date) if (self.from_date or self.until_date) else None
+        if self.participant_name:
+            self._select_participants(self.parser.get_senders(chat_content))
+        chat = self.parser.create_chat(chat_content, chat_name=os.path.basename(self.zip_path),
+                                       date_range=date_range, own_name=self.own_name,
+                                       message_filter=self.message_filter)
+        self._validate_message_filter(chat.senders)
+
+        counts = {'total': 0, 'filtered': 0}
+        senders = set()
+        dates = {}
+        referenced = set()
+        sample = []
+        for timestamp, sender, text in self.parser._scan_messages(chat_content, date_range, counts, self.message_filter):
+            senders.add(sender)
+            date_part = timestamp.partition(' ')[0]
+            if date_part not in dates:
+                dates[date_part] = self.parser._parse_timestamp_date(timestamp)
+            if self.has_media:
+                attachment_name = Message._find_attachment(text, chat)
+                if attachment_name is not None:
+                    referenced.add(attachment_name)
+            if len(sample) < self.PLAN_SAMPLE_SIZE:
+                sample.append(Message.create_with_context(len(sample) + 1, timestamp,
+                                                          self.parser._normalize_sender(sender) if sender else "WhatsApp",
+                                                          text, chat))
+        message_count = counts['filtered']
+        parsed_dates = [day for day in dates.values() if day is not None]
+
+        # HTML size: fixed part of an empty document plus the average size of a sample message
+        chat.sender_color_map.update(self.parser._generate_color_map(chat.senders, self.own_name))
+        html_sizes = {}
+        for messages in ([], sample):
+            renderer = HTMLRenderer(output_dir=None, has_media=self.has_media, zip_path=self.zip_path,
+                                    compact=self.compact)
+            main_f, media_f = io.StringIO(), io.StringIO()
+            renderer.write_document(dataclasses.replace(chat, messages=messages), main_f, media_f)
+            html_sizes[len(messages)] = (len(main_f.getvalue().encode('utf-8')), len(media_f.getvalue().encode('utf-8')))
+        empty_main, empty_media = html_sizes[0]
+        sample_main, sample_media = html_sizes[len(sample)]
+        scale = message_count / len(sample) if sample else 0
+        main_html = int(empty_main + (sample_main - empty_main) * scale)
+        media_linked_html = int(empty_media + (sample_media - empty_media) * scale)
+
+        media_bytes = sum(self.attachment_size(name) for name in referenced)
+        loader_bytes = len(HTMLRenderer(output_dir=None, embed_media=True, zip_path=self.zip_path).get_payload_loader()) if referenced else 0
+        largest = sorted(referenced, key=lambda name: (-self.attachment_size(name), name))[:largest_count]
+        return {
+            'source': os.path.abspath(self.zip_path),
+            'platform': 'ios' if self.is_ios else 'android',
+            'messages': message_count,
+            'messages_total': counts['total'],
+            'first_date': min(parsed_dates).isoformat() if parsed_dates else None,
+            'last_date': max(parsed_dates).isoformat() if parsed_dates else None,
+            'senders': len(senders - {None}),
+            'senders_total': len(chat.senders),
+            'attachments': {
+                'in_export': len(self.attachments_in_zip),
+                'referenced': len(referenced),
+                'unreferenced': len(self.attachments_in_zip - referenced),
+                'bytes': media_bytes,
+                'stored_bytes': sum(self.attachment_stored_size(name) for name in referenced),
+                'largest': [{'name': name, 'bytes': self.attachment_size(name)} for name in largest],
+            },
+            'estimated_output_bytes': {
+                'linked': {'chat.html': main_html, 'chat_media_linked.html': media_linked_html,
+                           'media': media_bytes, 'total': main_html + media_linked_html + media_bytes},
+                'embedded': int(main_html + loader_bytes + media_bytes * self.EMBED_OVERHEAD_FACTOR
+                                + len(referenced) * self.EMBED_OVERHEAD_BYTES),
+            },
+            'sample_messages': len(sample),
+            'seconds': round(time.time() - start_time, 3),
+        }
+
     def process_chat(self):
         # Ask for optional date range
         print("\nOptional: Enter date range to filter messages")
@@ -1276,7 +3947,7 @@ class ChatExport:
                     break
         
 
-        chat_content = self._read_chat_from_zip()
+        chat_content = self._read_chat()
         self.setup_modular_components()
 
         # Create date range for filtering
@@ -1284,10 +3955,13 @@ class ChatExport:
 
         # Get list of senders first to let user choose their name
         senders = self.parser.get_senders(chat_content)
+        self.chat_senders = list(senders)
         print("\nFound the following participants in the chat:")
         for i, sender in enumerate(senders, 1):
             print(f"{i}. {sender}")
 
+        self._validate_message_filter(senders)
+
         while True:
             try:
                 choice = int(input("\nEnter the number corresponding to your name: ")) - 1
@@ -1302,103 +3976,1099 @@ class ChatExport:
         processing_start_time = time.time()
         
         # Parse messages using the new MessageParser - now returns a Chat object
+        stats = self._create_statistics()
         chat, filtered_count, total_count = self.parser.parse_messages(
             chat_content,
             chat_name=os.path.basename(self.zip_path),
             date_range=date_range,
-            own_name=self.own_name
+            own_name=self.own_name,
+            stats=stats,
+            message_filter=self.message_filter
         )
 
-        if date_range and date_range.is_filtered():
-            print(f"\n{filtered_count} of {total_count} messages match date range filter.")
-            if filtered_count == 0:
-                raise ValueError("No messages found in the specified date range. Aborting.")
-        print(f"Exporting {len(chat.messages)} messages.")
+        self._report_filtered_count(date_range, filtered_count, total_count)
+        logger.info("Exporting %d messages.", len(chat.messages))
 
         self._prepare_output_directories()
-
-        # Render messages using the new HTMLRenderer
-        attachments_to_extract = self.renderer.render(chat)
-
-        if self.has_media and not self.embed_media:
-            print("Extracting attachments/media...")
-            # extract attachments of rendered messages
-            with zipfile.ZipFile(self.zip_path, 'r') as zip_ref:
-                # Extract media files
-                for file in zip_ref.namelist():
-                    if file in attachments_to_extract:
-                        zip_ref.extract(file, self.media_dir)
-        elif self.has_media and self.embed_media:
-            print("Media will be embedded as base64 in HTML (no file extraction needed)")
+        self._render_and_extract(chat)
+        self._write_statistics(stats, chat)
+        self._finish_journal()
+        self.close()
         processing_end_time = time.time()
-        print(f"Processing took {processing_end_time - processing_start_time:.3f} seconds")
+        logger.info("Processing took %.3f seconds", processing_end_time - processing_start_time)
 
     def process_chat_non_interactive(self):
         """Process chat in non-interactive mode using pre-set parameters."""
-        # Validate date parameters if provided
-        if self.from_date:
-            try:
-                self.from_date = self.parse_date_input(self.from_date)
-            except ValueError as e:
-                raise ValueError(f"Invalid from-date format: {e}")
-
-        if self.until_date:
-            try:
-                self.until_date = self.parse_date_input(self.until_date)
-            except ValueError as e:
-                raise ValueError(f"Invalid until-date format: {e}")
-
-        if self.from_date and self.until_date and self.from_date > self.until_date:
-            raise ValueError("'From' date must be before 'until' date")
+        self._validate_date_inputs()
 
         processing_start_time = time.time()
+        self.timings = {}
 
-        chat_content = self._read_chat_from_zip()
+        chat_content = self._read_chat()
         self.setup_modular_components()
+        parse_start_time = time.time()
+        self.timings['read'] = parse_start_time - processing_start_time
 
         # Create date range for filtering
         date_range = DateRange(self.from_date, self.until_date) if (self.from_date or self.until_date) else None
-        print(f"from date: {self.from_date}, until date: {self.until_date}")
+        logger.info("from date: %s, until date: %s", self.from_date, self.until_date)
 
         # Get list of senders and validate the provided participant
         senders = self.parser.get_senders(chat_content)
-        self.validate_participant(self.own_name, senders)
+        self._select_participants(senders)
+        self._validate_message_filter(senders)
 
         # Parse messages using the new MessageParser - now returns a Chat object
+        stats = self._create_statistics()
         chat, filtered_count, total_count = self.parser.parse_messages(
             chat_content,
             chat_name=os.path.basename(self.zip_path),
             date_range=date_range,
-            own_name=self.own_name
+            own_name=self.own_name,
+            stats=stats,
+            message_filter=self.message_filter
         )
 
-        if date_range and date_range.is_filtered():
-            print(f"\n{filtered_count} of {total_count} messages match date range filter.")
-            if filtered_count == 0:
-                raise ValueError("No messages found in the specified date range. Aborting.")
-        print(f"Exporting {len(chat.messages)} messages.")
+        self._report_filtered_count(date_range, filtered_count, total_count)
+        logger.info("Exporting %d messages.", len(chat.messages))
+        self.timings['parse'] = time.time() - parse_start_time
 
         self._prepare_output_directories()
-
-        # Render messages using the new HTMLRenderer
-        attachments_to_extract = self.renderer.render(chat)
-
-        if self.has_media and not self.embed_media:
-            print("Extracting attachments/media...")
-            # extract attachments of rendered messages
-            with zipfile.ZipFile(self.zip_path, 'r') as zip_ref:
-                # Extract media files
-                for file in zip_ref.namelist():
-                    if file in attachments_to_extract:
-                        zip_ref.extract(file, self.media_dir)
-        elif self.has_media and self.embed_media:
-            print("Media will be embedded as base64 in HTML (no file extraction needed)")
+        self._render_and_extract(chat)
+        self._write_statistics(stats, chat)
+        self._finish_journal()
+        self.close()
         processing_end_time = time.time()
-        print(f"Processing took {processing_end_time - processing_start_time:.3f} seconds")
+        self.timings['total'] = processing_end_time - processing_start_time
+        logger.info("Processing took %.3f seconds", processing_end_time - processing_start_time)
         return chat
         
 
 
+class ChatMerger(ChatExport):
+    """Merges several exports of the same chat (e.g. from different phones) into one chat.
+
+    The exports are parsed as message streams and merged in timestamp order. Messages that
+    appear in more than one export (same minute, sender and content hash) are kept once;
+    repeated identical messages within one minute are kept as often as the export with the
+    most of them has them. Each attachment is taken from an export that contains it.
+    """
+
+    _TIME_PATTERN = re.compile(r'(\d{1,2})[.:](\d{2})(?:[.:]\d{2})?(?:\s*([AaPp])\.?\s*[Mm]\.?)?')
+    # Larger groups of messages with the same minute key are merged by identity instead of
+    # with difflib, whose cost grows quadratically with the group
+    MAX_DIFF_MESSAGES = 1000
+
+    def __init__(self, export_paths, from_date=None, until_date=None, participant_name=None, base_output_dir=None,
+                 embed_media=False, output_name=None, pipeline_extraction=True, verify_crc=True, compress_payload=False,
+                 formats=None, media_layout='flat', media_store=None, compact=False):
+        if len(export_paths) < 2:
+            raise ValueError("At least two exports are needed for merging.")
+        self.sources = [ChatExport(path, verify_crc=verify_crc) for path in export_paths]
+        super().__init__(export_paths[0], from_date, until_date, participant_name, base_output_dir, embed_media,
+                         pipeline_extraction=pipeline_extraction, verify_crc=verify_crc, compress_payload=compress_payload,
+                         formats=formats, media_layout=media_layout, media_store=media_store, compact=compact)
+        self.output_name = self.export_name = output_name or f"{export_stem(self.zip_path)}_merged"
+        self._set_output_dir(base_output_dir, self.output_name)
+        self.duplicate_count = 0
+        self.chat = None
+
+    def attachment_size(self, attachment_name):
+        """Size in bytes of an attachment, taken from the first export that contains it."""
+        for source in self.sources:
+            if attachment_name in source.attachments_in_zip:
+                return source.attachment_size(attachment_name)
+        return 0
+
+    @classmethod
+    def _minute_key(cls, message):
+        """Sort key with minute resolution, since some exports have seconds and some don't.
+        None if the message date can't be read."""
+        if message.parsed_date is None:
+            return None
+        match = cls._TIME_PATTERN.search(message.timestamp.split(' ', 1)[-1])
+        if not match:
+            return (message.parsed_date.toordinal(), 0, 0)
+        hour, minute, am_pm = int(match.group(1)), int(match.group(2)), match.group(3)
+        if am_pm:
+            hour = hour % 12 + (12 if am_pm in 'Pp' else 0)
+        return (message.parsed_date.toordinal(), hour, minute)
+
+    @staticmethod
+    def _identity(message):
+        """Sender and content hash of a message, to recognize it in other exports."""
+        import hashlib
+
+        # The last message of an export may carry the file's trailing newline
+        content = message.content.replace(' $NEWLINE$ ', '\n').strip()
+        return message.sender, hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+
+    @staticmethod
+    def _keyed(source_index, source_path, messages):
+        # a message without a readable date keeps its place after the message before it
+        key = (-1, 0, 0)
+        for message in messages:
+            key = ChatMerger._minute_key(message) or key
+            yield key, source_index, source_path, message
+
+    def _merge_minute(self, per_source):
+        """Merge the messages of one minute, given as one list of (source, message) per export."""
+        lists = [items for items in per_source if items]
+        result = max(lists, key=len)
+        for other in lists:
+            if other is result:
+                continue
+            result_ids = [self._identity(message) for _, message in result]
+            other_ids = [self._identity(message) for _, message in other]
+            if result_ids == other_ids:
+                merged = [self._prefer_attachment(a, b) for a, b in zip(result, other)]
+            elif max(len(result), len(other)) > self.MAX_DIFF_MESSAGES:
+                merged = self._merge_by_identity(result, result_ids, other, other_ids)
+            else:
+                import difflib
+
+                merged = []
+                matcher = difflib.SequenceMatcher(None, result_ids, other_ids, autojunk=False)
+                for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                    if tag == 'equal':
+                        merged.extend(self._prefer_attachment(a, b) for a, b in zip(result[i1:i2], other[j1:j2]))
+                    else:
+                        merged.extend(result[i1:i2])
+                        merged.extend(other[j1:j2])
+            self.duplicate_count += len(result) + len(other) - len(merged)
+            result = merged
+        return result
+
+    @classmethod
+    def _merge_by_identity(cls, result, result_ids, other, other_ids):
+        """Linear fallback for large groups: messages of other that result doesn't have
+        (counting repeats) are appended after it, in their order."""
+        positions = {}
+        for index, identity in enumerate(result_ids):
+            positions.setdefault(identity, []).append(index)
+        for matches in positions.values():
+            matches.reverse()
+        merged = list(result)
+        added = []
+        for item, identity in zip(other, other_ids):
+            matches = positions.get(identity)
+            if matches:
+                index = matches.pop()
+                merged[index] = cls._prefer_attachment(merged[index], item)
+            else:
+                added.append(item)
+        return merged + added
+
+    @staticmethod
+    def _prefer_attachment(a, b):
+        """Of two copies of a message, pick the one whose export contains the attachment."""
+        if not a[1].has_attachment and b[1].has_attachment:
+            return b
+        return a
+
+    def merge_messages(self, streams):
+        """Yield the merged (source_path, message) pairs of several message streams.
+
+        streams is a list of (source_path, messages) with messages in chronological order.
+        Runs in linear time; only the messages of the current minute are held in memory.
+        Messages whose date can't be read count as part of the minute before them.
+        """
+        import heapq
+        import itertools
+
+        keyed_streams = [self._keyed(i, path, messages) for i, (path, messages) in enumerate(streams)]
+        merged = heapq.merge(*keyed_streams, key=lambda item: (item[0], item[1]))
+        for _, group in itertools.groupby(merged, key=lambda item: item[0]):
+            per_source = [[] for _ in streams]
+            for _, source_index, source_path, message in group:
+                per_source[source_index].append((source_path, message))
+            yield from self._merge_minute(per_source)
+
+    def process_chat_non_interactive(self):
+        """Merge and render the exports using the pre-set parameters."""
+        self._validate_date_inputs()
+
+        processing_start_time = time.time()
+        self.timings = {}
+        date_range = DateRange(self.from_date, self.until_date) if (self.from_date or self.until_date) else None
+
+        streams = []
+        senders = set()
+        counts = {'total': 0, 'filtered': 0}
+        for source in self.sources:
+            chat_content = source._read_chat()
+            source.setup_modular_components()
+            source_chat = source.parser.create_chat(
+                chat_content,
+                chat_name=os.path.basename(source.zip_path),
+                date_range=date_range,
+                own_name=self.own_name
+            )
+            senders.update(source_chat.senders)
+            streams.append((source.zip_path, source.parser.iter_messages(chat_content, source_chat, date_range, counts)))
+            self.attachments_in_zip.update(source.attachments_in_zip)
+            self.has_media = self.has_media or source.has_media
+        self.is_ios = self.sources[0].is_ios
+        self.setup_modular_components()
+        parse_start_time = time.time()
+        self.timings['read'] = parse_start_time - processing_start_time
+
+        senders = sorted(senders)
+        self._select_participants(senders)
+
+        first_source_parser = self.sources[0].parser
+        chat = Chat(
+            name=self.output_name,
+            is_ios=self.is_ios,
+            has_media=self.has_media,
+            attachments_in_zip=frozenset(self.attachments_in_zip),
+            message_date_format=first_source_parser.message_date_format,
+            newline_marker=first_source_parser.newline_marker,
+            messages=[],
+            senders=senders,
+            date_range=date_range,
+            own_name=self.own_name
+        )
+        import dataclasses
+
+        for source_path, message in self.merge_messages(streams):
+            chat.messages.append(dataclasses.replace(message, id=len(chat.messages) + 1))
+            if message.has_attachment:
+                chat.attachment_sources.setdefault(message.attachment_name, source_path)
+        chat.sender_color_map.update(self.parser._generate_color_map(senders, self.own_name))
+        self.chat = chat
+
+        logger.info("Merged %d exports: %d messages, %d duplicates removed.", len(self.sources), len(chat.messages), self.duplicate_count)
+        if date_range and date_range.is_filtered() and counts['filtered'] == 0:
+            raise ValueError("No messages found in the specified date range. Aborting.")
+        logger.info("Exporting %d messages.", len(chat.messages))
+        self.timings['parse'] = time.time() - parse_start_time
+
+        self._prepare_output_directories()
+        self._render_and_extract(chat)
+        self.close()
+        processing_end_time = time.time()
+        self.timings['total'] = processing_end_time - processing_start_time
+        logger.info("Processing took %.3f seconds", processing_end_time - processing_start_time)
+        return chat
+
+    def _zip_index_for(self, source_path):
+        for source in self.sources:
+            if source.zip_path == source_path:
+                return source.zip_index
+        return None
+
+    def close(self):
+        for source in self.sources:
+            source.close()
+        super().close()
+
+    def _create_media_extractor(self):
+        extractors = {source.zip_path: self._media_extractor_for(source.zip_path) for source in self.sources}
+        return MultiSourceMediaExtractor(extractors, self.chat.attachment_sources, self.zip_path)
+
+
+class ChatServer:
+    """Serves a chat export ZIP over a local HTTP server without extracting anything.
+
+    The chat is parsed once per date range and rendered once per participant on demand;
+    the most recently used parsed chats and pages are cached in memory. Requests for
+    ./media/... are answered straight from the ZIP entries, with HTTP Range support so
+    audio and video can seek. The ZIP is opened once.
+    """
+
+    _COPY_CHUNK = 256 * 1024
+    # Entries kept in memory, least recently used dropped first: parsed chats per date
+    # range, and rendered pages per participant and date range
+    MAX_CACHED_CHATS = 4
+    MAX_CACHED_PAGES = 16
+
+    def __init__(self, zip_path, host='127.0.0.1', port=8000):
+        self.zip_path = zip_path
+        self.host = host
+        self.port = port
+
+        self.chat_export = ChatExport(zip_path)
+        if self.chat_export.is_directory:
+            raise ValueError(f"{zip_path} is a folder. The serve command needs the chat export ZIP file.")
+        self.chat_content = self.chat_export._read_chat_from_zip()
+        self.chat_export.setup_modular_components()
+        self.senders = self.chat_export.parser.get_senders(self.chat_content)
+        # the ZipFile that was opened for reading the chat
+        self.zip_ref = self.chat_export.zip_index.zip_ref
+        self._mime_types = HTMLRenderer(output_dir=None)
+
+        from collections import OrderedDict
+
+        # (from_date, until_date) -> parsed Chat
+        self._chats = OrderedDict()
+        # (participant, from_date, until_date) -> (main_html, media_linked_html) as bytes
+        self._pages = OrderedDict()
+        # guards the caches; each entry is built under a lock of its own, see _cached
+        self._lock = threading.Lock()
+        self._building = {}
+
+    def _cached(self, cache, limit, key, build):
+        """Return cache[key], building it first if needed.
+
+        Requests for the same entry wait for the one that builds it; others go ahead.
+        """
+        with self._lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+            entry_lock = self._building.setdefault((id(cache), key), threading.Lock())
+        with entry_lock:
+            with self._lock:
+                if key in cache:
+                    # built while this request was waiting
+                    cache.move_to_end(key)
+                    return cache[key]
+            try:
+                value = build()
+            finally:
+                with self._lock:
+                    self._building.pop((id(cache), key), None)
+            with self._lock:
+                cache[key] = value
+                if len(cache) > limit:
+                    cache.popitem(last=False)
+            return value
+
+    def get_chat(self, from_date, until_date):
+        """Return the chat parsed for a date range, without a participant's perspective."""
+        def parse():
+            date_range = DateRange(from_date, until_date) if (from_date or until_date) else None
+            chat, _, _ = self.chat_export.parser.parse_messages(
+                self.chat_content,
+                chat_name=os.path.basename(self.zip_path),
+                date_range=date_range
+            )
+            return chat
+
+        return self._cached(self._chats, self.MAX_CACHED_CHATS, (from_date, until_date), parse)
+
+    def get_pages(self, participant, from_date_str=None, until_date_str=None):
+        """Return the rendered main and media-linked HTML for a participant and date range."""
+        # parsed first, so that differently written dates share a page
+        from_date = self.chat_export.parse_date_input(from_date_str)
+        until_date = self.chat_export.parse_date_input(until_date_str)
+
+        def render():
+            chat = self.chat_export._perspective_chat(self.get_chat(from_date, until_date), participant)
+            renderer = HTMLRenderer(output_dir=None, has_media=self.chat_export.has_media)
+            main_f, media_f = io.StringIO(), io.StringIO()
+            renderer.write_document(chat, main_f, media_f)
+            return main_f.getvalue().encode('utf-8'), media_f.getvalue().encode('utf-8')
+
+        return self._cached(self._pages, self.MAX_CACHED_PAGES, (participant, from_date, until_date), render)
+
+    def get_index_page(self):
+        """Return an index page linking to the chat from each participant's perspective."""
+        import urllib.parse
+
+        safe_name = html_module.escape(os.path.basename(self.zip_path))
+        items = []
+        for sender in self.senders:
+            query = urllib.parse.urlencode({'participant': sender})
+            items.append(
+                f'<li>{html_module.escape(sender)}: <a href="/chat.html?{html_module.escape(query)}">chat</a>'
+                f' | <a href="/chat_media_linked.html?{html_module.escape(query)}">chat with media links</a></li>'
+            )
+        return f"""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>{safe_name}</title>
+</head>
+<body style="font-family: Arial, sans-serif;">
+<h1>{safe_name}</h1>
+<p>Select the participant that represents yourself. Add <code>&amp;from=...&amp;until=...</code> to the URL to filter by date.</p>
+<ul>
+{chr(10).join(items)}
+</ul>
+</body>
+</html>""".encode('utf-8')
+
+    @staticmethod
+    def parse_range(range_header, size):
+        """Parse a single 'bytes=' range. Returns (start, end) inclusive, or None to serve
+        the whole file. Raises ValueError if the range cannot be satisfied."""
+        if not range_header.startswith('bytes=') or ',' in range_header:
+            return None
+        start_str, _, end_str = range_header[len('bytes='):].strip().partition('-')
+        try:
+            if start_str == '':
+                # suffix range: the last N bytes
+                length = int(end_str)
+                if length <= 0:
+                    raise ValueError("Empty suffix range")
+                return max(size - length, 0), size - 1
+            start = int(start_str)
+            end = int(end_str) if end_str else None
+        except ValueError:
+            return None
+        if end is not None and end < start:
+            # syntactically invalid, so ignored (RFC 7233, 2.1)
+            return None
+        if start >= size:
+            raise ValueError(f"Range {range_header} not satisfiable for {size} bytes")
+        return start, size - 1 if end is None else min(end, size - 1)
+
+    def send_media(self, handler, attachment_name, head_only=False):
+        """Send a ZIP entry as the response, honoring a Range header."""
+        if attachment_name not in self.chat_export.attachments_in_zip:
+            handler.send_error(404, "Attachment not found")
+            return
+        info = self.zip_ref.getinfo(attachment_name)
+        size = info.file_size
+
+        start, end, status = 0, size - 1, 200
+        range_header = handler.headers.get('Range')
+        if range_header:
+            try:
+                byte_range = self.parse_range(range_header, size)
+            except ValueError:
+                handler.send_response(416)
+                handler.send_header('Content-Range', f'bytes */{size}')
+                handler.send_header('Content-Length', '0')
+                handler.end_headers()
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                status = 206
+        length = max(end - start + 1, 0)
+
+        handler.send_response(status)
+        handler.send_header('Content-Type', self._mime_types.get_mime_type(attachment_name))
+        handler.send_header('Accept-Ranges', 'bytes')
+        handler.send_header('Content-Length', str(length))
+        if status == 206:
+            handler.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        handler.end_headers()
+        if head_only or length == 0:
+            return
+
+        with open(self.zip_path, 'rb') as archive:
+            data_offset = zip_stored_data_offset(archive, info)
+            if data_offset is not None:
+                # Stored entry: send the byte range straight from the archive file
+                handler.wfile.flush()
+                handler.connection.sendfile(archive, data_offset + start, length)
+                return
+
+        with self.zip_ref.open(info) as member:
+            member.seek(start)
+            remaining = length
+            while remaining > 0:
+                block = member.read(min(self._COPY_CHUNK, remaining))
+                if not block:
+                    break
+                handler.wfile.write(block)
+                remaining -= len(block)
+
+    def make_handler(self):
+        """Create the request handler class bound to this server."""
+        import http.server
+        import urllib.parse
+
+        chat_server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._handle(head_only=False)
+
+            def do_HEAD(self):
+                self._handle(head_only=True)
+
+            def _handle(self, head_only):
+                url = urllib.parse.urlsplit(self.path)
+                path = urllib.parse.unquote(url.path)
+                query = urllib.parse.parse_qs(url.query)
+                try:
+                    if path.startswith('/media/'):
+                        chat_server.send_media(self, path[len('/media/'):], head_only)
+                    elif path in ('/', '/index.html'):
+                        self._send_html(chat_server.get_index_page(), head_only)
+                    elif path in ('/chat.html', '/chat_media_linked.html'):
+                        participant = query.get('participant', [None])[0]
+                        if participant not in chat_server.senders:
+                            self.send_error(404, "Unknown participant")
+                            return
+                        main_html, media_linked_html = chat_server.get_pages(
+                            participant,
+                            query.get('from', [None])[0],
+                            query.get('until', [None])[0]
+                        )
+                        self._send_html(main_html if path == '/chat.html' else media_linked_html, head_only)
+                    else:
+                        self.send_error(404)
+                except ValueError as e:
+                    self.send_error(400, str(e))
+                except (BrokenPipeError, ConnectionResetError):
+                    # The browser cancelled the request, e.g. while seeking in a video
+                    pass
+
+            def _send_html(self, body, head_only):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if not head_only:
+                    self.wfile.write(body)
+
+        return Handler
+
+    def serve_forever(self, open_browser=False):
+        """Run the HTTP server until interrupted."""
+        import http.server
+
+        httpd = http.server.ThreadingHTTPServer((self.host, self.port), self.make_handler())
+        url = f"http://{self.host}:{httpd.server_address[1]}/"
+        print(f"Serving {self.zip_path} at {url} (press Ctrl+C to stop)")
+        if open_browser:
+            import webbrowser
+            webbrowser.open(url)
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\nStopping server.")
+        finally:
+            httpd.server_close()
+            self.zip_ref.close()
+
+
+@dataclass
+class ExportResult:
+    """Outcome of convert() and export()."""
+    output_files: list
+    messages: int
+    # Seconds per processing stage (read, parse, render, extract, total)
+    timings: dict = field(default_factory=dict)
+
+
+def convert(zip_path, participant, *, from_date=None, until_date=None, output_dir=None, embed_media=False,
+            formats=None, embed_max_size=None, embed_budget=None, compress=False, stats=False, senders=None,
+            grep=None, resume=False, media_layout='flat', media_cache=None, media_cache_size=None,
+            media_store=None, compact=False, pipeline_extraction=True, verify_crc=True) -> ExportResult:
+    """Convert a chat export without prompting and return an ExportResult.
+
+    The options are those of the non-interactive mode. Each call works on its own
+    ChatExport, so conversions can run concurrently in threads as long as they write to
+    different output folders. Progress goes to the 'chat_export' logger; invalid input
+    raises FileNotFoundError or ValueError.
+    """
+    chat_export = ChatExport(
+        os.fspath(zip_path), from_date, until_date, participant, output_dir, embed_media,
+        pipeline_extraction=pipeline_extraction,
+        verify_crc=verify_crc,
+        compress_payload=compress,
+        write_stats=stats,
+        senders=senders,
+        grep=grep,
+        formats=formats,
+        embed_max_size=embed_max_size,
+        embed_budget=embed_budget,
+        resume=resume,
+        media_layout=media_layout,
+        media_cache=media_cache,
+        media_cache_size=media_cache_size,
+        media_store=media_store,
+        compact=compact
+    )
+    chat = chat_export.process_chat_non_interactive()
+    return ExportResult(
+        output_files=[path.absolute() for path in chat_export.get_generated_files()],
+        messages=len(chat.messages),
+        timings=dict(chat_export.timings)
+    )
+
+
+async def export(zip_path, participant, *, executor=None, **options) -> ExportResult:
+    """convert() for asyncio applications.
+
+    The conversion, with all its ZIP and file I/O, runs in executor (default: the event
+    loop's thread pool), so the event loop keeps serving other requests meanwhile.
+    """
+    import asyncio
+    import functools
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(convert, zip_path, participant, **options))
+
+
+class ConversionWorker:
+    """Runs conversion jobs, read as JSON lines, in one long-lived process.
+
+    Each job is a JSON object with the options of the non-interactive mode, e.g.
+    {"id": "42", "zip_file": "chat.zip", "participant": "John Doe", "from_date": "01.01.2024",
+     "until_date": null, "output_dir": "/tmp/out", "embed_media": false}
+    For every job, one JSON line with its status, output files and timings is written as
+    soon as it finishes. Jobs run on a thread pool, so the interpreter, imports and compiled
+    patterns stay warm between jobs.
+    """
+
+    JOB_KEYS = frozenset({'id', 'zip_file', 'participant', 'from_date', 'until_date', 'output_dir',
+                          'embed_media', 'embed_max_size', 'embed_budget', 'formats', 'compress', 'stats',
+                          'senders', 'grep', 'resume', 'media_layout', 'media_cache', 'media_cache_size',
+                          'media_store', 'compact', 'no_pipeline', 'no_crc_check'})
+
+    def __init__(self, concurrency=1):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='chat-export-job')
+
+    @classmethod
+    def run_job(cls, job):
+        """Run a single job and return its result as a dict."""
+        start_time = time.time()
+        result = {'id': job.get('id') if isinstance(job, dict) else None}
+        try:
+            if not isinstance(job, dict):
+                raise ValueError("A job must be a JSON object")
+            unknown_keys = set(job) - cls.JOB_KEYS
+            if unknown_keys:
+                raise ValueError(f"Unknown job keys: {', '.join(sorted(unknown_keys))}")
+            if not job.get('zip_file') or not job.get('participant'):
+                raise ValueError("A job requires 'zip_file' and 'participant'")
+
+            export_result = convert(
+                job['zip_file'],
+                job['participant'],
+                from_date=job.get('from_date') or None,
+                until_date=job.get('until_date') or None,
+                output_dir=job.get('output_dir'),
+                embed_media=bool(job.get('embed_media', False)),
+                formats=job.get('formats'),
+                embed_max_size=job.get('embed_max_size'),
+                embed_budget=job.get('embed_budget'),
+                compress=bool(job.get('compress', False)),
+                stats=bool(job.get('stats', False)),
+                senders=job.get('senders'),
+                grep=job.get('grep'),
+                resume=bool(job.get('resume', False)),
+                media_layout=job.get('media_layout') or 'flat',
+                media_cache=job.get('media_cache'),
+                media_cache_size=job.get('media_cache_size'),
+                media_store=job.get('media_store'),
+                compact=bool(job.get('compact', False)),
+                pipeline_extraction=not job.get('no_pipeline', False),
+                verify_crc=not job.get('no_crc_check', False)
+            )
+            result['status'] = 'ok'
+            result['messages'] = export_result.messages
+            result['output_files'] = [str(path) for path in export_result.output_files]
+            result['timings'] = {stage: round(seconds, 3) for stage, seconds in export_result.timings.items()}
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = f"{type(e).__name__}: {e}"
+        result.setdefault('timings', {})['wall'] = round(time.time() - start_time, 3)
+        return result
+
+    def serve_stream(self, in_f, out_f):
+        """Read jobs from in_f until EOF and write one result line per job to out_f."""
+        import json
+
+        write_lock = threading.Lock()
+        # Backpressure: don't read far ahead of the jobs that are actually running
+        slots = threading.BoundedSemaphore(self.concurrency * 2)
+        pending = set()
+        all_done = threading.Condition()
+        # Set when out_f can't be written any more (client gone, closed pipe); later results are dropped
+        closed = threading.Event()
+
+        def emit(result):
+            with write_lock:
+                if closed.is_set():
+                    return
+                try:
+                    out_f.write(json.dumps(result, ensure_ascii=False) + '\n')
+                    out_f.flush()
+                except (OSError, ValueError) as e:
+                    logger.warning("Can't write results any more (%s), dropping the remaining jobs.", e)
+                    closed.set()
+
+        def on_done(future):
+            try:
+                if not future.cancelled():
+                    emit(future.result())
+            finally:
+                slots.release()
+                with all_done:
+                    pending.discard(future)
+                    all_done.notify_all()
+
+        for line in in_f:
+            if closed.is_set():
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                emit({'id': None, 'status': 'error', 'error': f"Invalid JSON: {e}"})
+                continue
+            slots.acquire()
+            future = self._executor.submit(self.run_job, job)
+            with all_done:
+                pending.add(future)
+            future.add_done_callback(on_done)
+
+        if closed.is_set():
+            # jobs that haven't started yet; cancelling runs on_done for them
+            with all_done:
+                waiting = list(pending)
+            for future in waiting:
+                future.cancel()
+        with all_done:
+            all_done.wait_for(lambda: not pending)
+
+    def serve_socket(self, socket_path):
+        """Accept connections on a Unix socket; each connection is a stream of jobs."""
+        import socketserver
+        import stat
+
+        if not hasattr(socketserver, 'ThreadingUnixStreamServer'):
+            raise ValueError("Unix sockets are not supported on this platform. Use stdin instead.")
+        if os.path.exists(socket_path):
+            if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                raise ValueError(f"'{socket_path}' exists and is not a socket.")
+            os.remove(socket_path)
+
+        worker = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                in_f = io.TextIOWrapper(self.rfile, encoding='utf-8')
+                out_f = io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True)
+                try:
+                    worker.serve_stream(in_f, out_f)
+                finally:
+                    in_f.detach()
+                    out_f.detach()
+
+        with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as server:
+            print(f"Listening for jobs on {socket_path} (press Ctrl+C to stop)")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                print("\nStopping worker.")
+            finally:
+                os.remove(socket_path)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def _run_job_in_process(job, conn):
+    """Child process of FolderWatcher: run one job and send its result back."""
+    import signal
+
+    # Ctrl+C is handled by the watcher, which lets running jobs finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # only warnings; the progress of parallel jobs would be interleaved
+    if not logger.handlers:
+        configure_logging(sys.stderr)
+    logger.setLevel(logging.WARNING)
+    conn.send(ConversionWorker.run_job(job))
+    conn.close()
+
+
+class WatchMetrics:
+    """Counters and latencies of a FolderWatcher, written as JSON or in the Prometheus
+    text format (for the textfile collector of node_exporter)."""
+
+    STAGES = ('queue', 'read', 'parse', 'render', 'extract', 'total')
+    QUANTILES = (0.5, 0.9, 0.99)
+    # Latency samples kept per stage, and seconds of recent jobs the throughput is taken over
+    SAMPLES = 1000
+    THROUGHPUT_WINDOW = 300
+
+    def __init__(self):
+        from collections import Counter, deque
+
+        self.started = time.time()
+        self.queue_depth = 0
+        self.running = 0
+        self.jobs = Counter()
+        self.messages = 0
+        self.last_success = None
+        self.latencies = {stage: deque(maxlen=self.SAMPLES) for stage in self.STAGES}
+        self.latency_sums = Counter()
+        self.latency_counts = Counter()
+        # (finish time, messages) of recent jobs
+        self._recent = deque()
+        self.lock = threading.Lock()
+
+    def record(self, result, queue_seconds):
+        """Count a finished job; result is a ConversionWorker result dict."""
+        now = time.time()
+        with self.lock:
+            self.jobs[result['status']] += 1
+            timings = dict(result.get('timings', {}), queue=queue_seconds)
+            if result['status'] == 'ok':
+                self.messages += result['messages']
+                self.last_success = now
+                self._recent.append((now, result['messages']))
+            for stage in self.STAGES:
+                if stage in timings:
+                    self.latencies[stage].append(timings[stage])
+                    self.latency_sums[stage] += timings[stage]
+                    self.latency_counts[stage] += 1
+
+    @staticmethod
+    def quantile(samples, q):
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+    def to_dict(self):
+        now = time.time()
+        with self.lock:
+            while self._recent and self._recent[0][0] < now - self.THROUGHPUT_WINDOW:
+                self._recent.popleft()
+            window = min(self.THROUGHPUT_WINDOW, max(now - self.started, 1))
+            return {
+                'uptime_seconds': round(now - self.started, 3),
+                'queue_depth': self.queue_depth,
+                'jobs_running': self.running,
+                'jobs': {status: self.jobs[status] for status in ('ok', 'error', 'timeout')},
+                'messages': self.messages,
+                'throughput': {
+                    'jobs_per_minute': round(len(self._recent) * 60 / window, 3),
+                    'messages_per_second': round(sum(count for _, count in self._recent) / window, 3),
+                },
+                'last_success': self.last_success,
+                'latency_seconds': {
+                    stage: {
+                        'count': self.latency_counts[stage],
+                        'sum': round(self.latency_sums[stage], 3),
+                        **{f"p{round(q * 100)}": round(self.quantile(self.latencies[stage], q), 3)
+                           for q in self.QUANTILES},
+                    }
+                    for stage in self.STAGES
+                },
+            }
+
+    def to_prometheus(self):
+        metrics = self.to_dict()
+        prefix = 'chat_export_watch'
+        lines = [
+            f"# HELP {prefix}_queue_depth Exports waiting for a worker.",
+            f"# TYPE {prefix}_queue_depth gauge",
+            f"{prefix}_queue_depth {metrics['queue_depth']}",
+            f"# HELP {prefix}_jobs_running Exports being converted.",
+            f"# TYPE {prefix}_jobs_running gauge",
+            f"{prefix}_jobs_running {metrics['jobs_running']}",
+            f"# HELP {prefix}_jobs_total Finished conversions by status.",
+            f"# TYPE {prefix}_jobs_total counter",
+        ]
+        lines += [f'{prefix}_jobs_total{{status="{status}"}} {count}' for status, count in metrics['jobs'].items()]
+        lines += [
+            f"# HELP {prefix}_messages_total Messages exported.",
+            f"# TYPE {prefix}_messages_total counter",
+            f"{prefix}_messages_total {metrics['messages']}",
+            f"# HELP {prefix}_last_success_timestamp_seconds Time of the last successful conversion.",
+            f"# TYPE {prefix}_last_success_timestamp_seconds gauge",
+            f"{prefix}_last_success_timestamp_seconds {metrics['last_success'] or 0}",
+            f"# HELP {prefix}_stage_seconds Seconds per conversion stage (queue: waiting for a worker).",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for stage, latency in metrics['latency_seconds'].items():
+            for q in self.QUANTILES:
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{q}"}} '
+                             f'{latency[f"p{round(q * 100)}"]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {latency["sum"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {latency["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, metrics_format='json'):
+        """Replace the metrics file atomically, so collectors never read half of it."""
+        import json
+
+        text = (self.to_prometheus() if metrics_format == 'prometheus'
+                else json.dumps(self.to_dict(), indent=2) + '\n')
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+class FolderWatcher:
+    """Converts chat export ZIPs that appear (or change) in a folder (chat-export watch).
+
+    The folder is polled; a ZIP is queued once its size and modification time stayed the
+    same for stable_polls polls, so files still being copied are left alone. Each job runs
+    ConversionWorker.run_job in a child process of its own, at most `workers` at a time, and
+    is stopped after `timeout` seconds. Size and modification time of every converted (or
+    failed) ZIP are kept in a state file in the output folder, so a restarted watcher only
+    converts what is new or changed.
+    """
+
+    STATE_FILE = '.chat-export-watch.json'
+
+    def __init__(self, watch_dir, job_options, workers=1, timeout=None, interval=5.0, stable_polls=2,
+                 metrics_path=None, metrics_format='json'):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.watch_dir = Path(watch_dir)
+        if not self.watch_dir.is_dir():
+            raise FileNotFoundError(f"Watch folder '{watch_dir}' not found.")
+        # job keys of ConversionWorker shared by all exports (participant, output_dir, formats, ...)
+        self.job_options = job_options
+        self.output_dir = Path(job_options.get('output_dir') or '.')
+        self.timeout = timeout
+        self.interval = interval
+        self.stable_polls = stable_polls
+        self.metrics_path = metrics_path
+        self.metrics_format = metrics_format
+        self.metrics = WatchMetrics()
+        self.state_path = self.output_dir / self.STATE_FILE
+        os.makedirs(self.output_dir, exist_ok=True)
+        # path -> [size, mtime_ns] of the last conversion
+        self.done = self._load_state()
+        # path -> ((size, mtime_ns), polls it stayed unchanged)
+        self._candidates = {}
+        # paths queued or being converted
+        self._active = set()
+        self._lock = threading.Lock()
+        # set when stopping: queued jobs that have not started are dropped
+        self._stopping = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chat-export-watch')
+
+    def _load_state(self):
+        import json
+
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        import json
+
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.done, f, indent=1, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def poll(self):
+        """Scan the folder once and queue the ZIPs that are new or changed and stable."""
+        seen = set()
+        for entry in os.scandir(self.watch_dir):
+            if not entry.name.lower().endswith('.zip') or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            path = os.path.abspath(entry.path)
+            signature = [stat.st_size, stat.st_mtime_ns]
+            seen.add(path)
+            with self._lock:
+                if path in self._active or self.done.get(path) == signature:
+                    self._candidates.pop(path, None)
+                    continue
+            previous, polls = self._candidates.get(path, (None, 0))
+            polls = polls + 1 if previous == signature else 1
+            if polls >= self.stable_polls:
+                del self._candidates[path]
+                self._queue(path, signature)
+            else:
+                self._candidates[path] = (signature, polls)
+        for path in set(self._candidates) - seen:
+            del self._candidates[path]
+        self._write_metrics()
+
+    def _queue(self, path, signature):
+        logger.info("Queued %s", os.path.basename(path))
+        with self._lock:
+            self._active.add(path)
+        with self.metrics.lock:
+            self.metrics.queue_depth += 1
+        self._executor.submit(self._convert, path, signature, time.time())
+
+    def _convert(self, path, signature, queued_at):
+        with self.metrics.lock:
+            self.metrics.queue_depth -= 1
+            if self._stopping.is_set():
+                return None
+            self.metrics.running += 1
+        queue_seconds = time.time() - queued_at
+        job = dict(self.job_options, id=os.path.basename(path), zip_file=path)
+        try:
+            result = self._run_process(job)
+        except Exception as e:
+            result = {'id': job['id'], 'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+        if result['status'] == 'ok':
+            logger.info("Converted %s: %d messages in %.2f seconds", job['id'], result['messages'],
+                        result['timings']['wall'])
+        else:
+            logger.error("Failed to convert %s: %s", job['id'], result['error'])
+        with self.metrics.lock:
+            self.metrics.running -= 1
+        self.metrics.record(result, queue_seconds)
+        with self._lock:
+            self._active.discard(path)
+            # failed exports are not retried until the file changes
+            self.done[path] = signature
+            self._save_state()
+        self._write_metrics()
+        return result
+
+    def _run_process(self, job):
+        import multiprocessing
+
+        start_time = time.time()
+        receive_conn, send_conn = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_run_job_in_process, args=(job, send_conn), daemon=True)
+        process.start()
+        send_conn.close()
+        try:
+            if receive_conn.poll(self.timeout):
+                return receive_conn.recv()
+            if process.is_alive():
+                process.terminate()
+                process.join(5)
+                if process.is_alive():
+                    process.kill()
+                return {'id': job['id'], 'status': 'timeout',
+                        'error': f"Stopped after the timeout of {self.timeout:g} seconds",
+                        'timings': {'wall': round(time.time() - start_time, 3)}}
+            return {'id': job['id'], 'status': 'error',
+                    'error': f"Conversion process exited with code {process.exitcode}"}
+        except EOFError:
+            return {'id': job['id'], 'status': 'error', 'error': "Conversion process exited without a result"}
+        finally:
+            receive_conn.close()
+            process.join()
+
+    def _write_metrics(self):
+        if self.metrics_path:
+            try:
+                self.metrics.write(self.metrics_path, self.metrics_format)
+            except OSError as e:
+                logger.warning("Could not write metrics: %s", e)
+
+    def run(self, once=False):
+        """Poll until interrupted. With once, convert what is in the folder and return."""
+        try:
+            while True:
+                self.poll()
+                if once and not self._candidates:
+                    break
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            logger.info("Waiting for running conversions to finish...")
+            self._stopping.set()
+            raise
+        finally:
+            self._executor.shutdown(wait=True)
+            self._write_metrics()
+
+
 def check_tkinter_availability():
     """Check if tkinter is available and working on the system."""
     try:
@@ -1411,10 +5081,10 @@ def check_tkinter_availability():
         return False
 
 def browse_zip_file():
-    if sys.platform == 'darwin' and pyobjc_available:
+    if sys.platform == 'darwin' and pyobjc_available():
         result = macos_file_picker()
         return result
-    elif sys.platform == 'win32' and pywin32_available:
+    elif sys.platform == 'win32' and pywin32_available():
         result = windows_file_picker()
         return result
 
@@ -1445,13 +5115,155 @@ def open_html_file_in_browser(html_file: Path):
     file_path = Path(os.path.abspath(html_file))
     # Open the file in the default web browser
     # file:///
+    import webbrowser
     webbrowser.open(f"file://{file_path.as_posix()}")
 
+def configure_logging(stream=None):
+    """Show the progress messages of the library on the console (stdout by default)."""
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    # don't print the messages a second time if the application configured the root logger
+    logger.propagate = False
+
+def serve_main(argv):
+    """Entry point for `chat-export serve ZIP`."""
+    args = parse_serve_arguments(argv)
+    configure_logging()
+    print(f"chat-export v{get_version()} - Serve mode")
+    print("----------------------------------------")
+    try:
+        server = ChatServer(str(parse_path(args.zip_file)), host=args.host, port=args.port)
+        server.serve_forever(open_browser=args.open)
+    except (FileNotFoundError, ValueError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+def worker_main(argv):
+    """Entry point for `chat-export worker`."""
+    args = parse_worker_arguments(argv)
+    # stdout carries the JSON results, so progress output goes to stderr
+    results_out = sys.stdout
+    sys.stdout = sys.stderr
+    configure_logging(sys.stderr)
+    print(f"chat-export v{get_version()} - Worker mode ({args.concurrency} concurrent jobs)")
+    worker = ConversionWorker(concurrency=args.concurrency)
+    try:
+        if args.socket:
+            worker.serve_socket(args.socket)
+        else:
+            worker.serve_stream(sys.stdin, results_out)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        worker.shutdown()
+        sys.stdout = results_out
+
+def watch_main(argv):
+    """Entry point for `chat-export watch DIR`."""
+    args = parse_watch_arguments(argv)
+    configure_logging()
+    print(f"chat-export v{get_version()} - Watch mode ({args.workers} concurrent conversions)")
+    print("----------------------------------------")
+    job_options = {
+        'participant': args.participant or 'all',
+        'output_dir': str(parse_path(args.output_dir)),
+        'embed_media': args.embed_media,
+        'formats': args.format,
+        'compress': args.compress,
+        'stats': args.stats,
+        'media_layout': args.media_layout,
+        'media_cache': args.media_cache,
+        'media_store': args.media_store,
+        'compact': args.compact,
+    }
+    try:
+        watcher = FolderWatcher(parse_path(args.watch_dir), job_options, workers=args.workers,
+                                timeout=args.timeout, interval=args.interval, stable_polls=args.stable_polls,
+                                metrics_path=args.metrics, metrics_format=args.metrics_format)
+        if not args.once:
+            print(f"Watching {watcher.watch_dir} (press Ctrl+C to stop)")
+        watcher.run(once=args.once)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+
+def gc_main(argv):
+    """Entry point for `chat-export gc STORE`."""
+    args = parse_gc_arguments(argv)
+    store_path = parse_path(args.store)
+    if not (store_path / MediaStore.INDEX_FILE).exists() and not (store_path / 'objects').is_dir():
+        print(f"Error: '{args.store}' is not a media store.")
+        sys.exit(1)
+    refs, objects, freed = MediaStore(store_path).gc(args.grace * 3600, dry_run=args.dry_run)
+    action = "Would delete" if args.dry_run else "Deleted"
+    print(f"{action} {objects} unreferenced attachments ({freed / 1024 ** 2:.1f} MB) "
+          f"and {refs} references of deleted exports.")
+
+def merge_main(argv):
+    """Entry point for `chat-export merge EXPORT EXPORT ...`."""
+    args = parse_merge_arguments(argv)
+    configure_logging()
+    print(f"chat-export v{get_version()} - Merge mode")
+    print("----------------------------------------")
+    try:
+        chat_merger = ChatMerger(args.exports, args.from_date, args.until_date, args.participant, args.output_dir,
+                                 args.embed_media, output_name=args.name,
+                                 pipeline_extraction=not args.no_pipeline, verify_crc=not args.no_crc_check,
+                                 compress_payload=args.compress, formats=args.format, media_layout=args.media_layout,
+                                 media_store=args.media_store, compact=args.compact)
+        chat_merger.process_chat_non_interactive()
+        print(f'Written: {", ".join([str(p.absolute()) for p in chat_merger.get_generated_files()])}')
+        print("Done.")
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+def plan_main(args):
+    """Entry point for --plan: print the estimate as JSON on stdout."""
+    import json
+
+    # stdout carries the JSON, so progress output goes to stderr
+    configure_logging(sys.stderr)
+    try:
+        chat_export = ChatExport(args.zip_file, args.from_date, args.until_date, args.participant, args.output_dir,
+                                 args.embed_media, senders=args.sender, grep=args.grep, formats=args.format,
+                                 embed_max_size=args.embed_max_size, embed_budget=args.embed_budget,
+                                 compact=args.compact)
+        print(json.dumps(chat_export.plan(), indent=2, ensure_ascii=False))
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'merge':
+        merge_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'worker':
+        worker_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'watch':
+        watch_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'gc':
+        gc_main(sys.argv[2:])
+        return
+
     args = parse_arguments()
+    if args.plan:
+        plan_main(args)
+        return
+    configure_logging()
     if args.non_interactive:
         # Non-interactive mode
-        print(f"chat-export v{__version__} - Non-interactive mode")
+        print(f"chat-export v{get_version()} - Non-interactive mode")
         print("----------------------------------------")
         success = False
         try:
@@ -1461,9 +5273,16 @@ def main():
             from_date = args.from_date if args.from_date else None
             until_date = args.until_date if args.until_date else None
 
-            chat_export = ChatExport(args.zip_file, from_date, until_date, args.participant, args.output_dir, args.embed_media)
+            chat_export = ChatExport(args.zip_file, from_date, until_date, args.participant, args.output_dir, args.embed_media,
+                                     pipeline_extraction=not args.no_pipeline, verify_crc=not args.no_crc_check,
+                                     compress_payload=args.compress, write_stats=args.stats,
+                                     senders=args.sender, grep=args.grep, formats=args.format,
+                                     embed_max_size=args.embed_max_size, embed_budget=args.embed_budget,
+                                     resume=args.resume, media_layout=args.media_layout,
+                                     media_cache=args.media_cache, media_cache_size=args.media_cache_size,
+                                     media_store=args.media_store, compact=args.compact)
             chat_export.process_chat_non_interactive()
-            print(f'Written: {", ".join([str(p.absolute()) for p in chat_export.renderer.get_generated_files()])}')
+            print(f'Written: {", ".join([str(p.absolute()) for p in chat_export.get_generated_files()])}')
             print("Done.")
             success = True
 
@@ -1475,12 +5294,13 @@ def main():
             sys.exit(1)
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
+            import traceback
             print(traceback.format_exc())
             sys.exit(1) 
 
     else:
         # Interactive mode (original behavior)
-        print(f"Welcome to chat-export v{__version__}")
+        print(f"Welcome to chat-export v{get_version()}")
         print("----------------------------------------")
         print("Select the WhatsApp chat export ZIP file you want to convert to HTML.")
         success = False
@@ -1489,14 +5309,22 @@ def main():
             if not selected_zip_file:
                 raise FileNotFoundError("No file selected.")
             print(f"Processing selected file: {selected_zip_file}...")
-            chat_export = ChatExport(selected_zip_file, base_output_dir=args.output_dir, embed_media=args.embed_media)
+            chat_export = ChatExport(selected_zip_file, base_output_dir=args.output_dir, embed_media=args.embed_media,
+                                     pipeline_extraction=not args.no_pipeline, verify_crc=not args.no_crc_check,
+                                     compress_payload=args.compress, write_stats=args.stats,
+                                     senders=args.sender, grep=args.grep, formats=args.format,
+                                     embed_max_size=args.embed_max_size, embed_budget=args.embed_budget,
+                                     resume=args.resume, media_layout=args.media_layout,
+                                     media_cache=args.media_cache, media_cache_size=args.media_cache_size,
+                                     media_store=args.media_store, compact=args.compact)
             chat_export.process_chat()
-            print(f'Written: {", ".join([str(p.absolute()) for p in chat_export.renderer.get_generated_files()])}')
+            print(f'Written: {", ".join([str(p.absolute()) for p in chat_export.get_generated_files()])}')
             print("Done.")
             open_in_browser = input("Would you like to open them in the browser? [Y/n]: ").strip().lower()
             if open_in_browser != 'n':
-                for file in reversed(chat_export.renderer.get_generated_files()):
-                    open_html_file_in_browser(file.absolute())
+                for file in reversed(chat_export.get_generated_files()):
+                    if file.suffix == '.html' and file not in chat_export.statistics_files:
+                        open_html_file_in_browser(file.absolute())
             success = True
 
         except FileNotFoundError as e:
@@ -1505,9 +5333,11 @@ def main():
             print(f"Error: {e}")
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
+            import traceback
             print(traceback.format_exc())
 
         if success and input("Do you like the tool and want to buy me a coffee? [y/N]: ").strip().lower() == 'y':
+            import webbrowser
             webbrowser.open(donate_link)
         if not success:
             print("Press enter to exit")